@@ -0,0 +1,119 @@
+# Stress run of the arena command queue: many threads fire answers right around the
+# round deadlines of a running arena, and the run reports how many answers and commands
+# went through how fast. tests/test_commands.py checks the messages of the same run:
+# - every answer got exactly one reply (received, not in a round or already answered)
+# - every received answer was scored exactly once, as correct, in the round it was received
+#
+# usage: python -m benchmarks.commands_stress --players 200 --rounds 10 --threads 16
+import server.game as game
+import server.scoring as scoring
+from server.game import *
+import argparse
+import json
+import threading
+
+# (module, name, value) settings of a stress run: short rounds, and late answers count as wrong,
+# so keep those players in the game
+SETTINGS = [
+	(game, 'MAX_COUNTDOWN_TIME', 0.5),
+	(game, 'MIN_COUNTDOWN_TIME', 0.5),
+	(game, 'ROUND_END_WAITING_TIME', 0.2),
+	(game, 'GAME_END_WAITING_TIME', 0.2),
+	(scoring, 'MAX_PENALTY', 100)
+]
+
+# replies to an answer, whether or not it was taken
+REPLIES = ["Answer received.", "Not in a round.", "You already gave the answer for this question.", "Sorry, you are disqualified for this set."]
+
+# the same question every round, so every answer is correct whenever it arrives
+class FixedQuestions:
+	def next(self) -> tuple:
+		return 1, 1, "+", [2]
+
+# run an arena on its own server loop (with SETTINGS applied) and fire answers at its round deadlines.
+# Returns the messages sent to each single player (in the order the arena sent them), the answers sent
+# and the arena, closed once its last round was scored.
+def fireAnswers (players, rounds, threads, spread) -> tuple:
+	server = SocketServer()
+	arena = Game(server, 'stress')
+	arena.questions = FixedQuestions()
+
+	events = {}
+	def record (cli, name, content):
+		events[cli].append(content if name in ["message", "error"] else name)
+	arena.sendDataToSingle = record
+	arena.broadcast = lambda clients, name, content: None
+
+	threading.Thread(target=server.start, kwargs={"listen": False}, daemon=True).start()
+
+	clients = [SocketClient(None, ('stress', index)) for index in range(players)]
+	for index, cli in enumerate(clients):
+		events[cli] = []
+		arena.onClientConnect(cli)
+		arena.onMessage(cli, json.dumps({
+			"name": "register",
+			"nickname": f'p{index}'
+		}))
+
+	answer = json.dumps({
+		"name": "answer",
+		"answer": "2"
+	})
+	sent = [0] * threads
+
+	def fire (worker, deadline):
+		rand = random.Random(worker)
+		mine = clients[worker::threads]
+		times = sorted(deadline + rand.uniform(-spread, spread) for _ in mine)
+
+		for cli, at in zip(mine, times):
+			delay = at - time.time()
+			if delay > 0:
+				time.sleep(delay)
+			arena.onMessage(cli, answer)
+			sent[worker] += 1
+
+	lastEnd = None
+	for _ in range(rounds):
+		# wait for the next round to start (endTime is a plain int, reading it from here is safe)
+		while arena.round.roundEnd or arena.round.endTime == lastEnd:
+			time.sleep(0.005)
+
+		lastEnd = arena.round.endTime
+		workers = [threading.Thread(target=fire, args=[worker, lastEnd / 1000]) for worker in range(threads)]
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+
+	time.sleep(1.5) # let the last round be scored
+	arena.post(arena.close)
+
+	return events, sum(sent), arena
+
+def main ():
+	parser = argparse.ArgumentParser(description='Fire concurrent answers at round boundaries.')
+	parser.add_argument('--players', type=int, default=200)
+	parser.add_argument('--rounds', type=int, default=10, help='at most 100')
+	parser.add_argument('--threads', type=int, default=16)
+	parser.add_argument('--spread', type=float, default=0.05, help='answers are fired within this many seconds around the deadline')
+	args = parser.parse_args()
+
+	setLogLevel('INFO')
+	for module, name, value in SETTINGS:
+		setattr(module, name, value)
+
+	started = time.perf_counter()
+	events, sent, arena = fireAnswers(args.players, args.rounds, args.threads, args.spread)
+	elapsed = time.perf_counter() - started
+
+	messages = [message for messages in events.values() for message in messages]
+	received = messages.count("Answer received.")
+	scored = messages.count("correct_answer")
+	replied = sum(1 for message in messages if message in REPLIES)
+
+	print(f'{sent} answers over {args.rounds} rounds in {elapsed:.1f} s: {replied} replies, {received} received, {scored} scored, {sent - received} rejected')
+	print(f'{arena.commands.processed} commands processed')
+
+if __name__ == '__main__':
+	main()
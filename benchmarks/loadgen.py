@@ -0,0 +1,288 @@
+# Headless load generator for the game server.
+# Opens many raw WebSocket clients, registers them, answers every round_started
+# question (correctly or not, after a random delay) and reports throughput,
+# broadcast latency and round-deadline slip.
+#
+# usage: python -m benchmarks.loadgen --clients 2000 --rooms 50 --duration 60
+from server.server_enums import ROUND_END_WAITING_TIME, GAME_END_WAITING_TIME
+from server.ws_codec import *
+import argparse
+import base64
+import heapq
+import json
+import os
+import random
+import selectors
+import socket
+import time
+
+# masked client to server frame
+def clientFrame (data, opcode = OPCODE_TEXT) -> bytes:
+	mask = os.urandom(4)
+	length = len(data)
+
+	if length < 126:
+		header = bytes([0x80 | opcode, 0x80 | length])
+	elif length < 0x10000:
+		header = HEADER_16.pack(0x80 | opcode, 0x80 | 126, length)
+	else:
+		header = HEADER_64.pack(0x80 | opcode, 0x80 | 127, length)
+
+	return header + mask + unmask(data, mask)
+
+# accepted answers of a round_started question, same rules as the server
+def solve (question) -> int:
+	num1, num2 = question["num1"], question["num2"]
+
+	match question["operator"]:
+		case "+":
+			return num1 + num2
+		case "-":
+			return num1 - num2
+		case "*":
+			return num1 * num2
+		case "/":
+			return num1 // num2
+		case "%":
+			return num1 % num2
+
+def percentile (values, p) -> float:
+	if len(values) < 1:
+		return float('nan')
+
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+class LoadClient:
+	def __init__(self, index, room) -> None:
+		self.index = index
+		self.room = room
+		self.name = f'lg{index}'
+		self.socket = None
+		self.buffer = bytearray()
+		self.open = False
+		self.startedAt = None
+		self.roundEnd = None # time_end of the running round (ms)
+		self.outbound = b''
+
+class LoadGenerator:
+	def __init__(self, args) -> None:
+		self.args = args
+		self.random = random.Random(args.seed)
+		self.selector = selectors.DefaultSelector()
+		self.clients = []
+		self.timers = [] # (when, seq, callback, args)
+		self.seq = 0
+
+		self.connectTimes = []
+		self.firstConnectAt = None
+		self.lastOpenAt = None
+		self.failedConnects = 0
+		self.closed = 0
+		self.registered = 0
+		self.messagesIn = 0
+		self.messagesOut = 0
+		self.bytesIn = 0
+		self.answers = 0
+		self.broadcastLatency = [] # ms between the server stamping round_ended and a client receiving it
+		self.deadlineSlip = [] # ms between the announced round end and round_ended arriving
+
+	def callLater(self, delay, callback, *args):
+		self.seq += 1
+		heapq.heappush(self.timers, (time.monotonic() + delay, self.seq, callback, args))
+
+	def connect(self, cli: LoadClient):
+		s = cli.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		s.setblocking(False)
+		cli.startedAt = time.monotonic()
+		if self.firstConnectAt == None:
+			self.firstConnectAt = cli.startedAt
+
+		try:
+			s.connect_ex((self.args.host, self.args.port))
+		except OSError:
+			self.failedConnects += 1
+			return
+
+		key = base64.b64encode(os.urandom(16)).decode()
+		path = f'/room/{cli.room}'
+		cli.outbound = f'GET {path} HTTP/1.1\r\nHost: {self.args.host}\r\nConnection: Upgrade\r\nUpgrade: websocket\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'.encode()
+
+		self.selector.register(s, selectors.EVENT_READ | selectors.EVENT_WRITE, cli)
+
+	def send(self, cli: LoadClient, message):
+		if cli.socket == None:
+			return
+
+		cli.outbound += clientFrame(json.dumps(message).encode())
+		self.messagesOut += 1
+		self.flush(cli)
+
+	def flush(self, cli: LoadClient):
+		try:
+			sent = cli.socket.send(cli.outbound)
+			cli.outbound = cli.outbound[sent:]
+		except (BlockingIOError, InterruptedError):
+			pass
+		except OSError:
+			return self.drop(cli)
+
+		events = selectors.EVENT_READ | (selectors.EVENT_WRITE if len(cli.outbound) > 0 else 0)
+		self.selector.modify(cli.socket, events, cli)
+
+	def drop(self, cli: LoadClient):
+		if cli.socket == None:
+			return
+
+		if cli.open:
+			self.closed += 1
+		else:
+			self.failedConnects += 1
+
+		self.selector.unregister(cli.socket)
+		cli.socket.close()
+		cli.socket = None
+
+	def read(self, cli: LoadClient):
+		try:
+			chunk = cli.socket.recv(65536)
+		except (BlockingIOError, InterruptedError):
+			return
+		except OSError:
+			chunk = b''
+
+		if len(chunk) < 1:
+			return self.drop(cli)
+
+		self.bytesIn += len(chunk)
+		cli.buffer += chunk
+
+		if not cli.open:
+			end = cli.buffer.find(b'\r\n\r\n')
+			if end < 0:
+				return
+
+			if not cli.buffer.startswith(b'HTTP/1.1 101'):
+				return self.drop(cli)
+
+			del cli.buffer[:end + 4]
+			cli.open = True
+			self.lastOpenAt = time.monotonic()
+			self.connectTimes.append(self.lastOpenAt - cli.startedAt)
+			self.send(cli, {
+				"name": "register",
+				"nickname": cli.name
+			})
+
+		offset = 0
+		while True:
+			header = parseFrameHeader(cli.buffer, offset)
+			if header == None or header[5] > len(cli.buffer):
+				break
+
+			_, _, opcode, _, start, end = header
+			payload = bytes(cli.buffer[start : end])
+			offset = end
+
+			if opcode == OPCODE_TEXT:
+				self.onMessage(cli, json.loads(payload))
+
+		del cli.buffer[:offset]
+
+	def onMessage(self, cli: LoadClient, message):
+		self.messagesIn += 1
+		now = time.time() * 1000
+		data = message["data"]
+
+		match message["name"]:
+			case "register_success":
+				self.registered += 1
+			case "round_started":
+				cli.roundEnd = data["time_end"]
+				answer = solve(data)
+				if self.random.random() >= self.args.correct:
+					answer += 1
+
+				delay = self.random.uniform(self.args.min_latency, self.args.max_latency) / 1000
+				self.callLater(delay, self.answer, cli, answer)
+			case "round_ended":
+				if data.get("not_started"):
+					return
+
+				waiting = GAME_END_WAITING_TIME if data["game_end"] else ROUND_END_WAITING_TIME
+				self.broadcastLatency.append(now - (data["time_end"] - waiting * 1000))
+
+				if cli.roundEnd != None:
+					self.deadlineSlip.append(now - cli.roundEnd)
+					cli.roundEnd = None
+
+	def answer(self, cli: LoadClient, answer):
+		self.answers += 1
+		self.send(cli, {
+			"name": "answer",
+			"answer": str(answer)
+		})
+
+	def run(self):
+		args = self.args
+		self.clients = [LoadClient(index, f'lg{index % args.rooms}') for index in range(args.clients)]
+
+		started = time.monotonic()
+		end = started + args.duration
+		nextConnect = 0
+
+		while time.monotonic() < end:
+			now = time.monotonic()
+
+			# ramp up at the requested connection rate
+			target = min(len(self.clients), int((now - started) * args.rate) + 1)
+			while nextConnect < target:
+				self.connect(self.clients[nextConnect])
+				nextConnect += 1
+
+			while len(self.timers) > 0 and self.timers[0][0] <= now:
+				_, _, callback, callbackArgs = heapq.heappop(self.timers)
+				callback(*callbackArgs)
+
+			timeout = 0.05
+			if len(self.timers) > 0:
+				timeout = min(timeout, max(0, self.timers[0][0] - now))
+
+			for key, mask in self.selector.select(timeout):
+				cli = key.data
+				if mask & selectors.EVENT_WRITE:
+					self.flush(cli)
+				if mask & selectors.EVENT_READ and cli.socket != None:
+					self.read(cli)
+
+		self.report(time.monotonic() - started)
+
+	def report(self, elapsed):
+		connected = len(self.connectTimes)
+		rampUp = (self.lastOpenAt - self.firstConnectAt) if connected > 0 else elapsed
+
+		print(f'duration:              {elapsed:.1f} s')
+		print(f'connections:           {connected} open, {self.failedConnects} failed, {self.closed} closed by server')
+		print(f'connections/sec:       {connected / max(rampUp, 1e-9):.1f} (handshake p50 {percentile(self.connectTimes, 50) * 1000:.1f} ms, p99 {percentile(self.connectTimes, 99) * 1000:.1f} ms)')
+		print(f'registered:            {self.registered}')
+		print(f'messages in:           {self.messagesIn} ({self.messagesIn / elapsed:.1f}/s, {self.bytesIn / elapsed / 1024:.1f} KiB/s)')
+		print(f'messages out:          {self.messagesOut} ({self.messagesOut / elapsed:.1f}/s, {self.answers} answers)')
+		print(f'broadcast latency:     p50 {percentile(self.broadcastLatency, 50):.1f} ms, p99 {percentile(self.broadcastLatency, 99):.1f} ms ({len(self.broadcastLatency)} samples)')
+		print(f'round deadline slip:   p50 {percentile(self.deadlineSlip, 50):.1f} ms, p99 {percentile(self.deadlineSlip, 99):.1f} ms ({len(self.deadlineSlip)} samples)')
+
+def main ():
+	parser = argparse.ArgumentParser(description='Load test a running game server.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=int(os.environ.get('GAME_SERVER_PORT') or 4000))
+	parser.add_argument('--clients', type=int, default=1000, help='number of WebSocket clients')
+	parser.add_argument('--rooms', type=int, default=10, help='clients are spread over this many rooms')
+	parser.add_argument('--rate', type=float, default=500, help='new connections per second')
+	parser.add_argument('--duration', type=float, default=60, help='seconds to run')
+	parser.add_argument('--correct', type=float, default=0.8, help='probability of a correct answer')
+	parser.add_argument('--min-latency', type=float, default=200, help='min answer delay (ms)')
+	parser.add_argument('--max-latency', type=float, default=3000, help='max answer delay (ms)')
+	parser.add_argument('--seed', type=int, default=None)
+	LoadGenerator(parser.parse_args()).run()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,138 @@
+# Memory per connection, measured with tracemalloc on the server side of loopback TCP connections:
+# - idle connection: upgraded WebSocket client that has not joined a room
+# - registered player: upgraded, joined a room (10 players per room) and registered
+# On Linux the kernel's memory per TCP socket is estimated from the slab usage in /proc/meminfo
+# (system wide, so run it on an otherwise quiet machine).
+#
+# usage: python -m benchmarks.memory_bench --connections 5000
+from server.rooms import *
+import argparse
+import gc
+import json
+import tracemalloc
+
+MB = 1024 * 1024
+
+def upgradeRequest (path) -> bytes:
+	key = base64.b64encode(os.urandom(16)).decode()
+	return f'GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: Upgrade\r\nUpgrade: websocket\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'.encode()
+
+# masked client to server text frame
+def clientFrame (message) -> bytes:
+	data = json.dumps(message).encode()
+	mask = os.urandom(4)
+	return bytes([0x80 | OPCODE_TEXT, 0x80 | len(data)]) + mask + unmask(data, mask)
+
+# kernel slab memory in bytes, None if unknown
+def slabBytes () -> int | None:
+	try:
+		with open('/proc/meminfo') as meminfo:
+			for line in meminfo:
+				if line.startswith('Slab:'):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+
+	return None
+
+# count connected (server side, client side) loopback TCP socket pairs
+def tcpPairs (count) -> list:
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.bind(('127.0.0.1', 0))
+	listener.listen(SERVER_LISTEN_BACKLOG)
+
+	pairs = []
+	for _ in range(count):
+		client = socket.create_connection(listener.getsockname())
+		server, _ = listener.accept()
+		server.setblocking(False)
+		pairs.append((server, client))
+
+	listener.close()
+	return pairs
+
+# kernel bytes per TCP socket, None if unknown
+def measureKernel (count) -> float | None:
+	before = slabBytes()
+	pairs = tcpPairs(count)
+	after = slabBytes()
+
+	for pair in pairs:
+		pair[0].close()
+		pair[1].close()
+
+	if before == None or after == None:
+		return None
+
+	return (after - before) / (2 * count)
+
+# run every command and timer due now, including those they post
+def runCommands (scheduler):
+	while True:
+		timeout = scheduler.nextTimeout()
+		if timeout == None or timeout > 0:
+			return
+		scheduler.runDue()
+
+# bytes allocated per connection handed to server by connect(server, c, index)
+def measure (count, server, connect) -> float:
+	pairs = tcpPairs(count)
+
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+
+	for index, pair in enumerate(pairs):
+		connect(server, pair[0], index)
+
+	# joins and registrations are arena commands, apply them before measuring
+	runCommands(server.scheduler if isinstance(server, SocketServer) else server.server.scheduler)
+
+	gc.collect()
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+
+	allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+	for pair in pairs:
+		pair[0].close()
+		pair[1].close()
+
+	return allocated / count
+
+def idleConnection (server: SocketServer, c, index):
+	server.adoptClient(c, ('idle', index), upgradeRequest('/'))
+
+def registeredPlayer (manager: RoomManager, c, index):
+	data = upgradeRequest(f'/room/bench{index // 10}') + clientFrame({
+		"name": "register",
+		"nickname": f'p{index}'
+	})
+	manager.server.adoptClient(c, ('player', index), data)
+
+def main ():
+	parser = argparse.ArgumentParser(description='Measure server memory per connection.')
+	parser.add_argument('--connections', type=int, default=2000)
+	parser.add_argument('--memory', type=int, default=512, help='container memory (MB) to compute the capacity for')
+	args = parser.parse_args()
+
+	setLogLevel('INFO')
+	raiseOpenFilesLimit()
+
+	idle = measure(args.connections, SocketServer(), idleConnection)
+	player = measure(args.connections, RoomManager(), registeredPlayer)
+	kernel = measureKernel(args.connections)
+
+	print(f'idle connection:    {idle:8.0f} bytes ({args.connections} connections)')
+	print(f'registered player:  {player:8.0f} bytes (incl. a tenth of a room)')
+
+	if kernel == None:
+		kernel = 0
+		print('kernel per socket:  unknown, not included below')
+	else:
+		print(f'kernel per socket:  {kernel:8.0f} bytes (slab)')
+
+	print(f'{args.memory} MB fit about {int(args.memory * MB / (idle + kernel))} idle connections or {int(args.memory * MB / (player + kernel))} players')
+
+if __name__ == '__main__':
+	main()
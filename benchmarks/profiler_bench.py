@@ -0,0 +1,79 @@
+# Overhead of the sampling profiler (GAME_PROFILE) on a busy server loop:
+# the same workload (parse client frames, broadcast scoreboards to a room) runs
+# with and without a profiler sampling it, best of a few runs each.
+#
+# usage: python -m benchmarks.profiler_bench --interval 0.01
+from server.socket_handler import *
+from server.profiler import Profiler
+import argparse
+import tempfile
+
+PLAYERS = 100
+
+def clientFrame (data) -> bytes:
+	mask = os.urandom(4)
+	return bytes([0x80 | OPCODE_TEXT, 0x80 | len(data)]) + mask + unmask(data, mask)
+
+def workload (iterations):
+	reader = SocketClient(None, ('bench', -1))
+	reader.WebSocket = True
+	frames = clientFrame(json.dumps({"name": "answer", "answer": "42"}).encode()) * 50
+
+	clients = []
+	for index in range(PLAYERS):
+		cli = SocketClient(None, ('bench', index))
+		cli.WebSocket = True
+		clients.append(cli)
+
+	players = {"seq": 1, "players": [{"name": f"p{index}", "points": index % 20, "gameovered": False} for index in range(PLAYERS)]}
+
+	for _ in range(iterations):
+		for msg, isBinary in reader.feed(frames):
+			reader.decodeMessage(msg)
+
+		broadcast(clients, "players_info", players)
+
+		for cli in clients:
+			cli.outbound = cli.outboundKeys = None
+			cli.outboundSize = 0
+
+def timed (iterations, profiler = None) -> float:
+	if profiler != None:
+		profiler.start()
+
+	started = time.perf_counter()
+	workload(iterations)
+	elapsed = time.perf_counter() - started
+
+	if profiler != None:
+		profiler.running = False
+		profiler.thread.join()
+
+	return elapsed
+
+def main ():
+	parser = argparse.ArgumentParser(description='Measure the overhead of the sampling profiler.')
+	parser.add_argument('--iterations', type=int, default=2000)
+	parser.add_argument('--interval', type=float, default=PROFILE_INTERVAL, help='seconds between samples')
+	parser.add_argument('--repeat', type=int, default=5)
+	args = parser.parse_args()
+
+	setLogLevel('WARNING')
+
+	with tempfile.TemporaryDirectory() as directory:
+		off = on = float('inf')
+		samples = 0
+
+		for _ in range(args.repeat):
+			off = min(off, timed(args.iterations))
+
+			profiler = Profiler(interval=args.interval, window=3600, directory=directory)
+			on = min(on, timed(args.iterations, profiler))
+			samples = max(samples, profiler.samples)
+
+	print(f'without profiler: {off * 1000:8.1f} ms')
+	print(f'with profiler:    {on * 1000:8.1f} ms ({samples} samples at {1 / args.interval:.0f}/s)')
+	print(f'overhead:         {(on - off) / off * 100:8.2f} %')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,38 @@
+# Encoded size and encode cost of the hot messages, JSON vs. the binary protocol.
+#
+# usage: python -m benchmarks.protocol_bench
+from server.protocol import *
+import timeit
+
+def messages (players) -> list:
+	return [
+		("round_started", {"time_end": 1792314114102, "num1": -1234, "num2": 77, "operator": "*", "points_to_win": 12}),
+		("round_ended", {"num1": -1234, "num2": 77, "operator": "%", "result": [75, -2], "points_to_win": 12, "time_end": 1792314114102, "game_end": False}),
+		("players_info", {"seq": 42, "players": [{"name": f"player{i}", "points": i % 20, "gameovered": i % 7 == 0} for i in range(players)]}),
+		("players_delta", {"seq": 43, "updated": [{"name": f"player{i}", "points": i % 20, "gameovered": i % 7 == 0} for i in range(3)], "removed": ["player9"]}),
+		("correct_answer", "")
+	]
+
+def measure (protocol, name, data) -> float:
+	timer = timeit.Timer(lambda: protocol.encode(name, data))
+	loops, _ = timer.autorange()
+	return min(timer.repeat(repeat=5, number=loops)) / loops
+
+def main ():
+	print(f'{"message":<22} {"json":>9} {"binary":>9} {"ratio":>7} {"json":>12} {"binary":>12} {"speedup":>8}')
+
+	for players in [10, 200]:
+		for name, data in messages(players):
+			label = f'{name} ({players})' if name == "players_info" else name
+			if name != "players_info" and players != 10:
+				continue
+
+			jsonSize = len(JSON_PROTOCOL.encode(name, data).encode('utf-8'))
+			binarySize = len(BINARY_PROTOCOL.encode(name, data))
+			jsonTime = measure(JSON_PROTOCOL, name, data)
+			binaryTime = measure(BINARY_PROTOCOL, name, data)
+
+			print(f'{label:<22} {jsonSize:>7} B {binarySize:>7} B {jsonSize / binarySize:>6.1f}x {jsonTime * 1e6:>9.2f} us {binaryTime * 1e6:>9.2f} us {jsonTime / binaryTime:>7.1f}x')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,67 @@
+# Question generation throughput: the original per-round code (20k-element list for
+# the divisor, eval for the answer) against the pre-generated QuestionPool.
+#
+# usage: python -m benchmarks.questions_bench
+from server.questions import *
+import random
+import timeit
+
+# the previous Set.restartRound / Set.endRound question code
+def legacyQuestion ():
+	operator = random.choice(["+", "-", "*", "/", "%"])
+
+	match (operator):
+		case "%" | "/":
+			num2 = random.choice(list(range(-10000, 0)) + list(range(1, 10001)))
+		case _:
+			num2 = random.randrange(-10000, 10000, 1)
+
+	match (operator):
+		case "/":
+			division1 = int(-10000 / num2)
+			division2 = int(10000 / num2)
+			num1 = num2 * random.randrange(min(division1, division2), max(division1, division2), 1)
+		case _:
+			num1 = random.randrange(-10000, 10000, 1)
+
+	result = [int(eval(f'{num1} {operator} {num2}'))]
+
+	if operator == "%":
+		result.append(result[0] - num2)
+		result.sort(reverse=True)
+
+	return num1, num2, operator, result
+
+# accepted answers computed the old way, for the equivalence check
+def legacyAnswers (num1, num2, operator):
+	result = [int(eval(f'{num1} {operator} {num2}'))]
+
+	if operator == "%":
+		result.append(result[0] - num2)
+		result.sort(reverse=True)
+
+	return result
+
+def measure (func, number) -> float:
+	return min(timeit.repeat(func, repeat=5, number=number)) / number
+
+def main ():
+	# the pool must accept exactly what eval accepted
+	pool = QuestionPool('classic', seed=1)
+	for _ in range(100000):
+		num1, num2, operator, answers = pool.next()
+		assert answers == legacyAnswers(num1, num2, operator), (num1, num2, operator)
+
+	# same seed, same questions
+	assert [QuestionPool('classic', seed=7).next() for _ in range(10)] == [QuestionPool('classic', seed=7).next() for _ in range(10)]
+
+	old = measure(legacyQuestion, 2000)
+	print(f'legacy (list + eval):  {old * 1e6:8.2f} us/question')
+
+	for profile in QUESTION_PROFILES:
+		pool = QuestionPool(profile, seed=1)
+		new = measure(pool.next, 100000)
+		print(f'pool ({profile + "):":<15}{new * 1e6:8.2f} us/question  {old / new:7.1f}x')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,137 @@
+# Round scoring: the original per-Player loop of Set.endRound against the batch
+# scoring over PlayerColumns (pure Python and, if installed, numpy).
+# tests/test_scoring.py checks that random rounds give identical results with every implementation.
+#
+# usage: python -m benchmarks.scoring_bench
+from server.scoring import *
+import server.scoring as scoring
+import random
+import time
+
+# player state of the previous Set.endRound
+class LegacyPlayer:
+	def __init__(self, slot) -> None:
+		self.slot = slot
+		self.points = 0
+		self.answered = None
+		self.registered = False
+		self.justJoined = True
+		self.penalty = 0
+		self.gameovered = False
+
+# the previous Set.endRound rules, returns (correct, wrong, disqualified, winner) as slots
+def legacyScoreRound (players, answers, result, winningPoints):
+	firstCorrect = None
+	correct, wrong, disqualified = [], [], []
+
+	new_answers = []
+	for player in answers:
+		if player.answered in result:
+			player.penalty = 0
+			new_answers.append(player)
+			correct.append(player.slot)
+
+			if firstCorrect == None:
+				firstCorrect = player
+			else:
+				player.points += 1
+		else:
+			player.answered = None
+
+	totalPointsLost = 0
+	for player in players:
+		if (not player.registered) or player.gameovered:
+			continue
+
+		if player.answered == None:
+			wrong.append(player.slot)
+			if player.justJoined:
+				continue
+
+			player.penalty += 1
+			if player.penalty >= scoring.MAX_PENALTY:
+				player.gameovered = True
+				totalPointsLost += player.points
+				disqualified.append(player.slot)
+			elif player.points > 0:
+				totalPointsLost += 1
+				player.points -= 1
+
+	if firstCorrect != None:
+		totalPointsLost = max(2, totalPointsLost)
+		if firstCorrect.justJoined:
+			totalPointsLost //= 2
+		firstCorrect.points += totalPointsLost
+
+	winner = None
+	for player in new_answers:
+		if player.points >= winningPoints and (winner == None or winner.points < player.points):
+			winner = player
+
+	return correct, wrong, disqualified, winner.slot if winner != None else None
+
+# the same random round as legacy players and as columns
+def randomRound (rand, count):
+	accepted = rand.choice([[rand.randint(-5, 5)], sorted([rand.randint(-5, 5), rand.randint(-5, 5)], reverse=True)])
+	legacy = []
+	columns = PlayerColumns()
+
+	for slot in range(count):
+		player = LegacyPlayer(columns.allocate())
+		player.registered = rand.random() < 0.9
+		player.justJoined = rand.random() < 0.2
+		player.gameovered = rand.random() < 0.1
+		player.penalty = rand.randint(0, scoring.MAX_PENALTY - 1)
+		player.points = rand.randint(0, 30)
+		legacy.append(player)
+
+		columns.registered[slot] = player.registered
+		columns.justJoined[slot] = player.justJoined
+		columns.gameovered[slot] = player.gameovered
+		columns.penalty[slot] = player.penalty
+		columns.points[slot] = player.points
+
+	answering = [player for player in legacy if player.registered and not player.gameovered and rand.random() < 0.7]
+	rand.shuffle(answering)
+
+	for player in answering:
+		player.answered = rand.randint(-6, 6)
+		columns.answer(player.slot, player.answered)
+
+	return legacy, answering, columns, accepted
+
+def measure (rand, count, implementation) -> float:
+	best = float('inf')
+
+	for _ in range(5):
+		legacy, answering, columns, accepted = randomRound(rand, count)
+
+		started = time.perf_counter()
+		if implementation == legacyScoreRound:
+			legacyScoreRound(legacy, answering, accepted, 20)
+		else:
+			implementation(columns, accepted, 20)
+		best = min(best, time.perf_counter() - started)
+
+	return best
+
+def main ():
+	rand = random.Random(1)
+	implementations = [('python', scoreRoundPython)]
+	if scoring.numpy != None:
+		implementations.append(('numpy', scoreRoundNumpy))
+	else:
+		print('numpy is not installed, only the pure Python scoring is timed\n')
+
+	for count in [100, 1000, 10000, 50000]:
+		old = measure(rand, count, legacyScoreRound)
+		line = f'{count:>6} players  legacy {old * 1000:8.2f} ms'
+
+		for name, implementation in implementations:
+			new = measure(rand, count, implementation)
+			line += f'  {name} {new * 1000:8.2f} ms ({old / new:5.1f}x)'
+
+		print(line)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,87 @@
+# Warm restart cost: thousands of arenas with registered players are written as a snapshot
+# plus a log of the answers given since, then read back and restored into fresh arenas,
+# the way a restarted RoomManager does before it accepts connections.
+#
+# usage: python -m benchmarks.snapshot_bench --arenas 5000 --players 10
+from server.rooms import *
+import argparse
+import tempfile
+
+def buildArenas (server, count, players, rand) -> list:
+	arenas = []
+
+	for index in range(count):
+		game = Game(server, f'room{index}')
+		game.generateRaceValues()
+		game.round.notStarted = game.round.roundEnd = game.round.endGame = False
+		game.round.num1, game.round.num2, game.round.operator = rand.randint(-100, 100), rand.randint(1, 100), '+'
+		game.round.accepted = game.round.result = [game.round.num1 + game.round.num2]
+		game.round.endTime = int((time.time() + 10) * 1000)
+
+		for slot in range(players):
+			player = game.players.add(SocketClient(None, ('bench', index * players + slot)))
+			game.players.register(player, f'p{slot}')
+			player.points = rand.randint(0, 20)
+
+		arenas.append(game)
+
+	return arenas
+
+def main ():
+	parser = argparse.ArgumentParser(description='Benchmark arena snapshots and their recovery.')
+	parser.add_argument('--arenas', type=int, default=5000)
+	parser.add_argument('--players', type=int, default=10, help='registered players per arena')
+	parser.add_argument('--answers', type=int, default=5, help='answers per arena logged after the snapshot')
+	parser.add_argument('--repeat', type=int, default=3)
+	args = parser.parse_args()
+
+	setLogLevel('WARNING')
+	rand = random.Random(1)
+	server = SocketServer()
+	arenas = buildArenas(server, args.arenas, args.players, rand)
+
+	with tempfile.TemporaryDirectory() as directory:
+		journal = Journal('bench', directory)
+
+		# the loop records SNAPSHOT_BATCH arenas per iteration (see Journal.snapshotBatch)
+		batches = []
+		for index in range(0, len(arenas), SNAPSHOT_BATCH):
+			started = time.perf_counter()
+			batches.append([arenaRecord(arena) for arena in arenas[index:index + SNAPSHOT_BATCH]])
+			batches[-1].append(time.perf_counter() - started)
+		taking = [batch.pop() for batch in batches]
+		data = b''.join(record for batch in batches for record in batch)
+
+		started = time.perf_counter()
+		journal.beginGeneration(1)
+		journal.writeLog(data)
+		journal.writeSnapshot(1, data)
+		writing = time.perf_counter() - started
+
+		records = []
+		for arena in arenas:
+			for player in list(arena.players.names.values())[:args.answers]:
+				records.append(answerRecord(arena, player, rand.randint(-100, 100)))
+		journal.writeLog(b''.join(records))
+		journal.log.close()
+
+		print(f'{args.arenas} arenas of {args.players} players: snapshot {len(data) / 1e6:.1f} MB, log {sum(len(record) for record in records) / 1e6:.1f} MB')
+		print(f'take snapshot:   {sum(taking) * 1000:8.1f} ms (on the server loop, in {len(taking)} batches of at most {max(taking) * 1000:.1f} ms)')
+		print(f'write snapshot:  {writing * 1000:8.1f} ms (logged and fsynced, on the journal thread)')
+
+		# the restart path of a RoomManager: read and replay the journal, restore the rooms, take the first snapshot
+		restoring = float('inf')
+		for _ in range(args.repeat):
+			manager = RoomManager()
+			manager.journal = Journal('bench', directory)
+
+			started = time.perf_counter()
+			restored = manager.restoreRooms()
+			restoring = min(restoring, time.perf_counter() - started)
+
+			manager.journal.flush()
+
+		print(f'recovery:        {restoring * 1000:8.1f} ms ({len(restored)} rooms, until the server could accept connections)')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,92 @@
+# Cost of watching an arena: the scoreboard of a busy arena changes many times a second,
+# viewers either join as (unregistered) players and get every delta, or as spectators
+# and get a throttled snapshot. Reports what the server sends and spends per viewer.
+#
+# usage: python -m benchmarks.spectator_bench --players 20 --viewers 2000 --updates 50
+from server.game import *
+import argparse
+
+# a connected socket that takes everything, counting what it was sent
+class CountingSocket:
+	def __init__(self) -> None:
+		self.frames = 0
+		self.bytes = 0
+
+	def send(self, data) -> int:
+		self.frames += 1
+		self.bytes += len(data)
+		return len(data)
+
+def client (index) -> SocketClient:
+	cli = SocketClient(CountingSocket(), ('bench', index))
+	cli.WebSocket = True
+	return cli
+
+def run (players, viewers, spectate, updatesPerSecond, duration) -> tuple:
+	game = Game(SocketServer(), 'bench')
+	rand = random.Random(1)
+
+	competitors = []
+	for index in range(players):
+		cli = client(index)
+		game.addClient(cli)
+		game.players.register(game.players.find(cli), f'p{index}')
+		competitors.append(game.players.find(cli))
+
+	audience = [client(players + index) for index in range(viewers)]
+	for cli in audience:
+		if spectate:
+			game.addSpectator(cli)
+		else:
+			game.addClient(cli)
+
+	for cli in audience:
+		cli.socket.frames = cli.socket.bytes = 0
+
+	busy = 0.0
+	started = time.monotonic()
+	nextUpdate = started
+
+	while time.monotonic() - started < duration:
+		now = time.monotonic()
+
+		if now >= nextUpdate:
+			before = time.perf_counter()
+			rand.choice(competitors).points += 1
+			game.playerStatus()
+			busy += time.perf_counter() - before
+			nextUpdate += 1 / updatesPerSecond
+
+		before = time.perf_counter()
+		game.scheduler.runDue()
+		busy += time.perf_counter() - before
+
+		wait = nextUpdate - time.monotonic()
+		timeout = game.scheduler.nextTimeout()
+		if timeout != None:
+			wait = min(wait, timeout)
+		time.sleep(max(0, wait))
+
+	frames = sum(cli.socket.frames for cli in audience) / viewers
+	sent = sum(cli.socket.bytes for cli in audience) / viewers
+
+	return frames / duration, sent / duration, busy / duration
+
+def main ():
+	parser = argparse.ArgumentParser(description='Compare what watching an arena costs as a player and as a spectator.')
+	parser.add_argument('--players', type=int, default=20, help='competitors whose points change')
+	parser.add_argument('--viewers', type=int, default=2000)
+	parser.add_argument('--updates', type=float, default=50, help='scoreboard changes per second')
+	parser.add_argument('--duration', type=float, default=3, help='seconds per run')
+	args = parser.parse_args()
+
+	setLogLevel('WARNING')
+
+	print(f'{args.viewers} viewers of {args.players} players, {args.updates:.0f} scoreboard changes/s, spectators updated at most {SPECTATOR_UPDATE_RATE:.0f}/s')
+
+	for name, spectate in [('as players', False), ('as spectators', True)]:
+		frames, sent, busy = run(args.players, args.viewers, spectate, args.updates, args.duration)
+		print(f'{name + ":":<15} {frames:6.1f} frames/s {sent:8.0f} bytes/s per viewer, server loop busy {busy * 100:5.1f} %')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,79 @@
+# Throughput of the match store: rounds handed over by arenas, the time that costs the game
+# thread, and how fast the writer thread gets them on disk; then the leaderboard and history queries.
+#
+# usage: python -m benchmarks.store_bench --rounds 20000 --players 10
+from server.store import *
+import argparse
+import os
+import random
+import tempfile
+
+def main ():
+	parser = argparse.ArgumentParser(description='Benchmark the SQLite match store.')
+	parser.add_argument('--rounds', type=int, default=20000)
+	parser.add_argument('--players', type=int, default=10, help='players answering every round')
+	parser.add_argument('--rounds-per-match', type=int, default=10)
+	parser.add_argument('--nicknames', type=int, default=5000)
+	parser.add_argument('--queries', type=int, default=1000)
+	args = parser.parse_args()
+
+	rand = random.Random(1)
+	nicknames = [f'p{index}' for index in range(args.nicknames)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		store = SQLiteStore(os.path.join(directory, 'bench.db'))
+
+		handing = 0.0
+		started = time.perf_counter()
+
+		for match in range(args.rounds // args.rounds_per_match):
+			matchStart = time.time()
+			players = rand.sample(nicknames, args.players)
+			points = {nickname: 0 for nickname in players}
+
+			before = time.perf_counter()
+			matchId = store.newMatchId()
+			handing += time.perf_counter() - before
+
+			for index in range(1, args.rounds_per_match + 1):
+				answers = [(nickname, rand.randint(-100, 100), rand.random() < 0.5) for nickname in players]
+				for nickname, answer, correct in answers:
+					points[nickname] += correct
+
+				before = time.perf_counter()
+				store.recordRound(matchId, index, 12, 34, "+", [46], answers, time.time())
+				handing += time.perf_counter() - before
+
+			winner = max(players, key=points.get)
+
+			before = time.perf_counter()
+			store.recordMatch(matchId, f'room{match % 50}', 26, args.rounds_per_match, winner, [(nickname, points[nickname], False) for nickname in players], matchStart, time.time())
+			handing += time.perf_counter() - before
+
+		store.flush()
+		elapsed = time.perf_counter() - started
+
+		rounds = args.rounds // args.rounds_per_match * args.rounds_per_match
+		print(f'{rounds} rounds of {args.players} answers: {rounds / elapsed:,.0f} rounds/s written ({store.written:,} rows in {store.batches} transactions)')
+		print(f'game thread cost:  {handing / rounds * 1e6:8.1f} us per round')
+
+		reader = store.reader()
+		for name, sql, params in [
+			("top players", "SELECT nickname FROM players ORDER BY wins DESC, points DESC LIMIT ?", (10,)),
+			("history", "SELECT s.match_id FROM standings s JOIN matches m ON m.id = s.match_id WHERE s.nickname = ? ORDER BY s.ended_at DESC LIMIT ?", ('p1', 20))
+		]:
+			plan = ' | '.join(row[-1] for row in reader.execute("EXPLAIN QUERY PLAN " + sql, params))
+			print(f'{name + " plan:":<19}{plan}')
+
+		before = time.perf_counter()
+		for _ in range(args.queries):
+			store.topPlayers(10)
+		print(f'top 10 players:    {(time.perf_counter() - before) / args.queries * 1e6:8.1f} us per query')
+
+		before = time.perf_counter()
+		for _ in range(args.queries):
+			store.history(rand.choice(nicknames), 20)
+		print(f'nickname history:  {(time.perf_counter() - before) / args.queries * 1e6:8.1f} us per query')
+
+if __name__ == '__main__':
+	main()
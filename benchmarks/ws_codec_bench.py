@@ -0,0 +1,81 @@
+# Micro-benchmark of the WebSocket codec: the original per-byte implementation
+# against server.ws_codec, for inbound unmasking and outbound frame building.
+#
+# usage: python -m benchmarks.ws_codec_bench
+from server import ws_codec
+import os
+import timeit
+
+SIZES = [10, 2 * 1024, 64 * 1024]
+
+# the previous WSPayload.parse unmasking loop
+def legacyUnmask (payload, mask):
+	result = []
+	for p in payload:
+		result.append(p)
+
+	for i in range(0, len(result)):
+		result[i] = mask[i % 4] ^ result[i]
+
+	return bytes(result)
+
+# the previous SocketClient.send frame builder
+def legacyEncodeFrame (data, sendAsText = True):
+	payload = bytes([
+		(1 << 7) | (000 << 4) | (1 if sendAsText else 2),
+		0,
+	]) + data
+
+	payloadLen = len(payload)
+	payloadheaderSize = payloadLen
+	extraPayloadLenBytes = 0
+
+	if payloadLen >= 0x10000:
+		extraPayloadLenBytes = 8
+		payloadheaderSize = 127
+	elif payloadLen >= 126:
+		extraPayloadLenBytes = 2
+		payloadheaderSize = 126
+
+	payload = payload[:1] + bytes([(payload[1] << 7) | payloadheaderSize]) + payload[2:]
+
+	if extraPayloadLenBytes != 0:
+		exLenBytes = []
+		for i in range(0, extraPayloadLenBytes):
+			exLenBytes.insert(0, payloadLen & 0xff)
+			payloadLen >>= 8
+
+		payload = payload[:2] + bytes(exLenBytes) + payload[2:]
+
+	return payload + b'\r\n'
+
+def measure (func, *args) -> float:
+	timer = timeit.Timer(lambda: func(*args))
+	loops, _ = timer.autorange()
+	return min(timer.repeat(repeat=5, number=loops)) / loops
+
+def formatTime (seconds) -> str:
+	if seconds < 1e-3:
+		return f'{seconds * 1e6:10.2f} us'
+	return f'{seconds * 1e3:10.2f} ms'
+
+def row (name, size, old, new):
+	print(f'{name:<8} {size:>8} B {formatTime(old)} {formatTime(new)} {old / new:9.1f}x')
+
+def main ():
+	print(f'numpy accelerator: {"enabled" if ws_codec.numpy != None else "not installed"}')
+	print(f'{"case":<8} {"payload":>10} {"old":>13} {"new":>13} {"speedup":>10}')
+
+	for size in SIZES:
+		payload = os.urandom(size)
+		mask = os.urandom(4)
+
+		assert legacyUnmask(payload, mask) == ws_codec.unmask(payload, mask)
+		row('unmask', size, measure(legacyUnmask, payload, mask), measure(ws_codec.unmask, payload, mask))
+
+	for size in SIZES:
+		payload = os.urandom(size)
+		row('frame', size, measure(legacyEncodeFrame, payload), measure(ws_codec.encodeFrame, payload))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,95 @@
+from flask import Response, request
+import gzip
+import hashlib
+import mimetypes
+import os
+
+# brotli is optional, assets are only precompressed with gzip without it
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+# types worth compressing (images are already compressed)
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# compressed variants must save at least this many bytes
+MIN_COMPRESSION_SAVING = 256
+
+LONG_CACHE = 'public, max-age=31536000, immutable' # for versioned URLs (?v=<version>)
+REVALIDATE = 'no-cache' # cache, but ask with the ETag before using it
+
+# An in-memory response body with its precompressed variants.
+class Asset:
+	def __init__(self, data: bytes, mimetype) -> None:
+		self.mimetype = mimetype
+		self.version = hashlib.sha1(data).hexdigest()[:16]
+		self.variants = {None: data} # content encoding -> body
+
+		if mimetype == None or not mimetype.startswith(COMPRESSIBLE_TYPES):
+			return
+
+		compressed = gzip.compress(data, compresslevel=9, mtime=0)
+		if len(compressed) + MIN_COMPRESSION_SAVING <= len(data):
+			self.variants['gzip'] = compressed
+
+		if brotli != None:
+			compressed = brotli.compress(data, quality=11)
+			if len(compressed) + MIN_COMPRESSION_SAVING <= len(data):
+				self.variants['br'] = compressed
+
+	# the content encoding to answer the request with (accepted is the request's Accept-Encoding)
+	def encodingFor(self, accepted) -> str | None:
+		for encoding in ('br', 'gzip'):
+			if encoding in self.variants and accepted.quality(encoding) > 0:
+				return encoding
+
+		return None
+
+	# every representation gets its own strong ETag
+	def etag(self, encoding) -> str:
+		return f'{self.version}-{encoding}' if encoding != None else self.version
+
+	def response(self, cacheControl = REVALIDATE) -> Response:
+		encoding = self.encodingFor(request.accept_encodings)
+		etag = self.etag(encoding)
+
+		if request.if_none_match.contains(etag):
+			response = Response(status=304)
+		else:
+			response = Response(self.variants[encoding], mimetype=self.mimetype)
+
+			if encoding != None:
+				response.headers["Content-Encoding"] = encoding
+
+		response.set_etag(etag)
+		response.headers["Cache-Control"] = cacheControl
+		if len(self.variants) > 1:
+			response.headers["Vary"] = "Accept-Encoding"
+
+		return response
+
+# Every file of a folder loaded once into memory, with ETags and compressed variants.
+# Files changed on disk are picked up on the next restart.
+class StaticAssets:
+	def __init__(self, folder) -> None:
+		self.assets = {} # path relative to folder ('/' separated) -> Asset
+
+		for root, _, files in os.walk(folder):
+			for file in files:
+				path = os.path.join(root, file)
+				mimetype, _ = mimetypes.guess_type(file)
+
+				with open(path, 'rb') as f:
+					self.assets[os.path.relpath(path, folder).replace(os.sep, '/')] = Asset(f.read(), mimetype)
+
+	def find(self, path) -> Asset | None:
+		return self.assets.get(path)
+
+	# versioned URL of an asset, responses to it can be cached forever
+	def url(self, path) -> str:
+		asset = self.assets.get(path)
+
+		if asset == None:
+			return f'./{path}'
+
+		return f'./{path}?v={asset.version}'
@@ -1,15 +1,78 @@
-from flask import Flask, render_template
+from flask import Flask, Response, abort, jsonify, render_template, request
 from client.client_enums import *
+from client.assets import *
+from server.metrics import *
+from server.store import *
+from server.log import *
 import os
 
 class Client:
 	def __init__(self) -> None:
-		self.app = Flask(__name__, static_url_path='', static_folder='./public')
-		
+		# static files are served from memory by the catch-all route below
+		self.app = Flask(__name__, static_folder=None)
+		self.assets = StaticAssets(os.path.join(os.path.dirname(__file__), 'public'))
+		self.pages = {} # WS endpoint -> rendered index page
+
 		@self.app.route("/") 
 		def index(): 
-			return render_template('index.html', WS_ENDPOINT=os.environ.get('WS_ENDPOINT'))
+			return self.indexPage().response()
+
+		@self.app.route("/metrics")
+		def metrics():
+			if not METRICS_ENABLED:
+				abort(404)
+
+			return Response(renderMetrics(), mimetype='text/plain; version=0.0.4')
+
+		# all-time leaderboard and match history of the match store
+		@self.app.route("/api/top")
+		def top():
+			return jsonify(sharedMatchStore().topPlayers(self.limit(10)))
+
+		@self.app.route("/api/history/<nickname>")
+		def history(nickname):
+			return jsonify(sharedMatchStore().history(nickname, self.limit(20)))
+
+		@self.app.route("/<path:filename>")
+		def static(filename):
+			asset = self.assets.find(filename)
+
+			if asset == None:
+				abort(404)
+
+			# versioned URLs (see StaticAssets.url) never change
+			return asset.response(LONG_CACHE if request.args.get('v') == asset.version else REVALIDATE)
+
+	# the limit query argument, within 1 to 100
+	def limit(self, default) -> int:
+		return min(max(request.args.get('limit', default, type=int), 1), 100)
+
+	# the index only depends on the WS endpoint (set once the server starts), render it once per endpoint
+	def indexPage(self) -> Asset:
+		endpoint = os.environ.get('WS_ENDPOINT')
+		page = self.pages.get(endpoint)
+
+		if page == None:
+			html = render_template('index.html', WS_ENDPOINT=endpoint, asset=self.assets.url)
+			page = self.pages[endpoint] = Asset(html.encode('utf-8'), 'text/html')
+
+		return page
 
 	def start(self):
-		self.app.run(host=CLIENT_HOST, port=CLIENT_PORT)
-		
\ No newline at end of file
+		if CLIENT_SERVER == 'none':
+			return
+
+		if CLIENT_SERVER in ['auto', 'waitress']:
+			try:
+				import waitress
+			except ImportError:
+				waitress = None
+
+			if waitress != None:
+				info(f'[Client] Serving at http://{CLIENT_HOST}:{CLIENT_PORT} with waitress ({CLIENT_THREADS} threads).')
+				return waitress.serve(self.app, host=CLIENT_HOST, port=CLIENT_PORT, threads=CLIENT_THREADS, ident='racing-arena')
+
+			if CLIENT_SERVER == 'waitress':
+				warning('[Client] waitress is not installed, falling back to the Flask development server.')
+
+		self.app.run(host=CLIENT_HOST, port=CLIENT_PORT, threaded=True)
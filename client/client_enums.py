@@ -4,6 +4,8 @@ import os
 
 CLIENT_HOST = '0.0.0.0'
 CLIENT_PORT = int(os.environ.get('GAME_CLIENT_PORT') or 1275)
+CLIENT_SERVER = os.environ.get('GAME_CLIENT_SERVER') or 'auto' # auto (waitress if installed, else flask), waitress, flask or none (serve client.wsgi:app yourself)
+CLIENT_THREADS = int(os.environ.get('GAME_CLIENT_THREADS') or 16) # request threads of waitress
 
 # export
 os.environ['GAME_CLIENT_PORT'] = str(CLIENT_PORT)
\ No newline at end of file
@@ -1,5 +1,6 @@
 (function(){
 	let players = [];
+	let playersSeq = null, resyncing = false; // scoreboard version, see server/scoreboard.py
 	let maxScore, player_name;
 
 	let getColorFromPlayer = function (player) {
@@ -103,16 +104,132 @@
 
 	let inputBox = document.querySelector("#input");
 
-	let socket = new WebSocket(String(WS_ENDPOINT).replace(/^ws\:\/\/0\.0\.0\.0\:(\d+)\//, "ws://localhost:$1/"));
+	// join the room given in the page URL (?room=<id>), or the default one
+	let room = new URLSearchParams(window.location.search).get("room");
+	// watch without playing (?spectate in the page URL)
+	let spectating = new URLSearchParams(window.location.search).has("spectate");
 
-	socket.sendJSON = function(e) {
+	if (spectating) {
+		inputBox.setAttribute("style", "display: none;");
+		document.querySelector("#text").innerText = "Spectating";
+	}
+
+	// compact binary protocol for the hot messages, JSON for the rest (see server/protocol.py)
+	const BINARY_PROTOCOL = "racing-arena.bin.v1";
+	const OPERATORS = ["+", "-", "*", "/", "%"];
+
+	let endpoint = String(WS_ENDPOINT).replace(/^ws\:\/\/0\.0\.0\.0\:(\d+)\//, "ws://localhost:$1/") + (room ? "room/" + encodeURIComponent(room) : "");
+
+	// our player is kept a while after the connection drops, the resume token reclaims it (per room, for this tab)
+	const RESUME_KEY = "resume_token:" + (room || "");
+	let socket = null, reconnectDelay = 1000;
+
+	let sendJSON = function(e) {
 		return this.send(JSON.stringify(e))
 	}
 
-	socket.onmessage = function (e) {
+	// the same check as the server does on JSON answers (see Game.handleMessage)
+	const ANSWER_PATTERN = /^-?[0-9]+$/;
+
+	let sendAnswer = function (answer) {
+		// anything the float64 of the binary frame can not carry exactly goes as JSON, so the server judges it the same way
+		if (this.protocol !== BINARY_PROTOCOL || !ANSWER_PATTERN.test(answer) || !Number.isSafeInteger(Number(answer))) return this.sendJSON({
+			name: "answer",
+			answer: answer
+		});
+
+		let view = new DataView(new ArrayBuffer(9));
+		view.setUint8(0, 0x05);
+		view.setFloat64(1, Number(answer));
+		return this.send(view.buffer);
+	}
+
+	let textDecoder = new TextDecoder();
+
+	let decodeBinary = function (buffer) {
+		let view = new DataView(buffer);
+		let offset = 1;
+
+		switch (view.getUint8(0)) {
+			case 0x01:
+				return {
+					name: "round_started",
+					data: {
+						time_end: view.getFloat64(1) || null,
+						num1: view.getInt32(9),
+						num2: view.getInt32(13),
+						operator: OPERATORS[view.getUint8(17)],
+						points_to_win: view.getUint16(18)
+					}
+				};
+			case 0x02: {
+				let flags = view.getUint8(1);
+				let data = {
+					time_end: view.getFloat64(2) || null,
+					game_end: (flags & 0x02) != 0
+				};
+
+				if (flags & 0x01) data.not_started = true;
+				else {
+					data.num1 = view.getInt32(10);
+					data.num2 = view.getInt32(14);
+					data.operator = OPERATORS[view.getUint8(18)];
+					data.points_to_win = view.getUint16(19);
+					data.result = [];
+					for (let i = 0, count = view.getUint8(21); i < count; ++i) data.result.push(view.getFloat64(22 + i * 8));
+				}
+
+				return { name: "round_ended", data: data };
+			}
+			case 0x03:
+			case 0x06: {
+				let seq = view.getUint32(1);
+				let players = [];
+				offset = 7;
+
+				for (let i = 0, count = view.getUint16(5); i < count; ++i) {
+					let length = view.getUint8(offset);
+					let name = textDecoder.decode(new Uint8Array(buffer, offset + 1, length));
+					offset += 1 + length;
+					players.push({
+						name: name,
+						points: view.getInt32(offset),
+						gameovered: view.getUint8(offset + 4) != 0
+					});
+					offset += 5;
+				}
+
+				if (view.getUint8(0) == 0x03) return {
+					name: "players_info",
+					data: { seq: seq, players: players }
+				};
+
+				let removed = [];
+				let removedCount = view.getUint16(offset);
+				offset += 2;
+
+				for (let i = 0; i < removedCount; ++i) {
+					let length = view.getUint8(offset);
+					removed.push(textDecoder.decode(new Uint8Array(buffer, offset + 1, length)));
+					offset += 1 + length;
+				}
+
+				return {
+					name: "players_delta",
+					data: { seq: seq, updated: players, removed: removed }
+				};
+			}
+			case 0x04:
+				return { name: "correct_answer", data: "" };
+		}
+
+		throw new Error("Unknown binary message " + view.getUint8(0));
+	}
+
+	let onMessage = function (e) {
 		let { data } = e;
 		try {
-			data = JSON.parse(data);
+			data = (data instanceof ArrayBuffer) ? decodeBinary(data) : JSON.parse(data);
 			spec = data.data;
 
 			if (spec && spec.time_end != null) Timer.start(spec.time_end);
@@ -128,9 +245,22 @@
 					NotifBox.set(spec, "blue", "white");
 					break;
 				case "error":
+					// the server no longer knows our player, register again
+					if (spec === "This session can not be resumed.") {
+						sessionStorage.removeItem(RESUME_KEY);
+						player_name = null;
+						inputBox.setAttribute("type", "text");
+						document.querySelector("#text").innerText = "What's your name?";
+						document.querySelector("#profile").setAttribute("style", "display: none;");
+						window.onbeforeunload = null;
+						break;
+					}
 				case "disqualified":
 					NotifBox.set(spec, "red", "white");
 					break;
+				case "resume_token":
+					sessionStorage.setItem(RESUME_KEY, spec);
+					break;
 				case "register_success":
 					NotifBox.set("Registered successfully.", "green", "white");
 					player_name = spec;
@@ -158,7 +288,34 @@
 					NotifBox.set("Wrong Answer :(", "red", "white");
 					break;
 				case "players_info":
-					players = spec;
+					players = spec.players;
+					playersSeq = spec.seq;
+					resyncing = false;
+					updateVisual();
+					break;
+				case "players_delta":
+					if (playersSeq == null || spec.seq > playersSeq + 1) {
+						// missed an update, ask for the whole scoreboard again
+						if (!resyncing) socket.sendJSON({ name: "players_resync" });
+						resyncing = true;
+						break;
+					}
+
+					if (spec.seq <= playersSeq) break;
+
+					for (let player of spec.updated) {
+						let index = players.findIndex((p) => p.name === player.name);
+						if (index < 0) players.push(player);
+						else players[index] = player;
+					}
+
+					for (let name of spec.removed) {
+						players = players.filter((p) => p.name !== name);
+						let element = document.querySelector(".player-bar#player_" + name);
+						if (element != null) element.remove();
+					}
+
+					playersSeq = spec.seq;
 					updateVisual();
 					break;
 				case "player_left": {
@@ -175,6 +332,33 @@
 		catch (e) { console.log(e) }
 	}
 
+	// resuming, the server only sends what changed since the scoreboard and round we have
+	let connect = function () {
+		let token = sessionStorage.getItem(RESUME_KEY), query = "";
+		if (spectating) query = "?spectate=1";
+		else if (token) {
+			query = "?resume=" + encodeURIComponent(token);
+			if (playersSeq != null) query += "&seq=" + playersSeq;
+			if (Timer.endValue != null) query += "&round=" + Timer.endValue;
+		}
+
+		socket = new WebSocket(endpoint + query, [BINARY_PROTOCOL, "racing-arena.json"]);
+		socket.binaryType = "arraybuffer";
+		socket.sendJSON = sendJSON;
+		socket.sendAnswer = sendAnswer;
+		socket.onmessage = onMessage;
+		socket.onopen = function () {
+			reconnectDelay = 1000;
+		}
+		socket.onclose = function () {
+			NotifBox.set("Connection lost, reconnecting...", "red", "white");
+			setTimeout(connect, reconnectDelay);
+			reconnectDelay = Math.min(reconnectDelay * 2, 10000);
+		}
+	}
+
+	connect();
+
 	inputBox.addEventListener("keypress", function (e) {
 		if (e.keyCode != 13 || inputBox.value == '') return;
 		e.preventDefault();
@@ -186,10 +370,7 @@
 			NotifBox.set("Registering...", "blue", "white");
 		}
 		else {
-			socket.sendJSON({
-				name: "answer",
-				answer: inputBox.value
-			});
+			socket.sendAnswer(inputBox.value);
 			NotifBox.set("Sending Answer...", "blue", "white");
 		}
 
@@ -0,0 +1,6 @@
+from client.client import *
+
+# WSGI entry point for serving the client with an external server, e.g.
+# gunicorn -w 4 -b 0.0.0.0:1275 client.wsgi:app
+# (set WS_ENDPOINT to the game server's address, and GAME_CLIENT_SERVER=none for main.py)
+app = Client().app
@@ -1,9 +1,19 @@
 from client.client import *
-from server.game import *
+from server.cluster import *
 from threading import Thread
 
 # start server
-Thread(target=Game().start,args=[]).start()
+if SERVER_WORKERS > 1:
+	# fork the workers before any other thread starts (the log listener included)
+	router = ClusterRouter()
+	router.spawn()
+	startLogging()
+	startProfiler()
+	Thread(target=router.start,args=[]).start()
+else:
+	startLogging()
+	startProfiler()
+	Thread(target=RoomManager().start,args=[]).start()
 
 # start client
 Thread(target=Client().start,args=[]).start()
\ No newline at end of file
@@ -0,0 +1,374 @@
+from server.rooms import *
+import base64
+import json
+import multiprocessing
+
+# Router <-> worker messages are one JSON object per SOCK_SEQPACKET datagram,
+# accepted connections travel alongside as file descriptors (SCM_RIGHTS).
+# Bytes already read from a connection are base64 in the message: at most SERVER_MAX_MESSAGE_SIZE * 4 / 3,
+# well within CLUSTER_CHANNEL_BUFFER (as latin-1 text, JSON escapes every non-ASCII byte to 6 bytes).
+def sendChannel (channel, message, fds = []):
+	data = json.dumps(message).encode()
+
+	if len(fds) > 0:
+		return socket.send_fds(channel, [data], fds)
+
+	return channel.send(data)
+
+# A worker process: a RoomManager serving the connections the router hands over.
+class ClusterWorker:
+	def __init__(self, index, channel) -> None:
+		self.index = index
+		self.channel = channel
+		self.assigned = set() # rooms the router pinned to this worker
+
+		manager = self.manager = RoomManager(f'worker-{index}')
+		manager.onRoomClosed = self.onRoomClosed
+		manager.canHost = self.canHost
+
+	def start(self):
+		server = self.manager.server
+
+		self.channel.setblocking(False)
+		server.watch(self.channel, self.onChannel)
+		server.scheduler.callLater(CLUSTER_STATS_INTERVAL, self.reportStats)
+
+		# rooms restored from this worker's journal stay here, clients reclaiming their slots must find them
+		restored = self.manager.restoreRooms()
+		if len(restored) > 0:
+			self.assigned.update(restored)
+			sendChannel(self.channel, {
+				"type": "rooms_restored",
+				"rooms": restored
+			})
+
+		info(f'[Cluster] Worker {self.index} started (pid {os.getpid()}).')
+
+		server.start(listen=False)
+
+	# only rooms the router pinned here can be created, others may live on another worker
+	def canHost(self, roomId) -> bool:
+		return roomId in self.assigned
+
+	def onChannel(self, channel):
+		while True:
+			try:
+				data, fds, _, _ = socket.recv_fds(channel, CLUSTER_CHANNEL_BUFFER, 1)
+			except (BlockingIOError, InterruptedError):
+				return
+
+			if len(data) < 1: # router is gone
+				os._exit(0)
+
+			adopted = None # the received fd, once a socket owns it
+
+			try:
+				message = json.loads(data)
+
+				match message['type']:
+					case 'connection':
+						if message['room'] != None:
+							self.assigned.add(message['room'])
+
+						address, received = tuple(message['address']), base64.b64decode(message['data'])
+						c = socket.socket(fileno=fds[0])
+						adopted = fds[0]
+						self.manager.server.adoptClient(c, address, received)
+					case 'lobby':
+						self.manager.sharedLobby = message['lobby']
+			except Exception as e:
+				warning('[Cluster] channel:', e)
+			finally:
+				# a connection that could not be adopted would stay open in this process
+				for fd in fds:
+					if fd != adopted:
+						os.close(fd)
+
+	def onRoomClosed(self, roomId):
+		self.assigned.discard(roomId)
+
+		sendChannel(self.channel, {
+			"type": "room_closed",
+			"room": roomId
+		})
+
+	def reportStats(self):
+		try:
+			sendChannel(self.channel, {
+				"type": "stats",
+				"connections": len(self.manager.server.clients),
+				"rooms": self.manager.roomsInfo(),
+				"leaderboard": self.manager.leaderboard(),
+				"metrics": snapshot() if METRICS_ENABLED else []
+			})
+		except OSError as e:
+			warning('[Cluster] stats:', e)
+
+		self.manager.server.scheduler.callLater(CLUSTER_STATS_INTERVAL, self.reportStats)
+
+def runWorker (index, channel):
+	startLogging()
+	startProfiler()
+	ClusterWorker(index, channel).start()
+
+# router side state of a worker process
+class WorkerInfo:
+	def __init__(self, index, process, channel) -> None:
+		self.index = index
+		self.process = process
+		self.channel = channel
+		self.alive = True
+		self.connections = 0 # as last reported
+		self.routed = 0 # connections handed over since the last report
+		self.rooms = []
+		self.leaderboard = []
+		self.metrics = [] # metric families as last reported
+
+	def load(self) -> int:
+		return self.connections + self.routed
+
+# Accepts every connection on SERVER_PORT, reads the upgrade request to find the room,
+# and passes the socket to the worker the room is pinned to. It also merges the
+# workers' room lists and leaderboards into a lobby shared back with every worker.
+class ClusterRouter:
+	def __init__(self, workers = SERVER_WORKERS) -> None:
+		self.workerCount = workers
+		self.workers = []
+		self.pinned = {} # room id -> worker index
+		self.pending = {} # socket -> [address, bytes read so far, timer dropping it]
+		self.selector = selectors.DefaultSelector()
+		self.scheduler = Scheduler()
+		self.socket = None
+
+		addCollector(self.workerMetrics)
+
+	# fork the workers, call before starting any thread in this process
+	def spawn(self):
+		context = multiprocessing.get_context('fork')
+
+		for index in range(self.workerCount):
+			parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+			process = context.Process(target=runWorker, args=[index, child], daemon=True)
+			process.start()
+			child.close()
+
+			self.workers.append(WorkerInfo(index, process, parent))
+
+	def start(self):
+		if len(self.workers) < 1:
+			self.spawn()
+
+		raiseOpenFilesLimit()
+		os.environ['WS_ENDPOINT'] = f"ws://{SERVER_HOST}:{SERVER_PORT}/"
+
+		s = self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		s.bind((SERVER_HOST, SERVER_PORT))
+		s.listen(SERVER_LISTEN_BACKLOG)
+		s.setblocking(False)
+
+		self.selector.register(s, selectors.EVENT_READ, self.acceptClients)
+
+		for worker in self.workers:
+			worker.channel.setblocking(False)
+			self.selector.register(worker.channel, selectors.EVENT_READ, worker)
+
+		info(f'[Cluster] Router started at \'ws://{SERVER_HOST}:{SERVER_PORT}\' with {len(self.workers)} workers.')
+
+		self.shareLobby()
+
+		while True:
+			for key, _ in self.selector.select(self.scheduler.nextTimeout()):
+				if type(key.data) == WorkerInfo:
+					self.readWorker(key.data)
+				else:
+					key.data(key.fileobj)
+
+			self.scheduler.runDue()
+
+	def acceptClients(self, listener):
+		for _ in range(SERVER_ACCEPT_BATCH):
+			try:
+				c, addr = listener.accept()
+			except (BlockingIOError, InterruptedError):
+				return
+			except OSError as e:
+				warning(f'[Cluster] accept: {e}')
+				return
+
+			c.setblocking(False)
+			self.pending[c] = [addr, b'', self.scheduler.callLater(SERVER_UPGRADE_TIMEOUT, self.expirePending, c)]
+			self.selector.register(c, selectors.EVENT_READ, self.readPending)
+
+	# read until the upgrade request is complete, then hand the socket over
+	def readPending(self, c):
+		addr, data, timer = self.pending[c]
+
+		try:
+			chunk = c.recv(SERVER_RECV_SIZE)
+		except (BlockingIOError, InterruptedError):
+			return
+		except OSError:
+			chunk = b''
+
+		if len(chunk) < 1 or len(data) + len(chunk) > SERVER_MAX_MESSAGE_SIZE:
+			return self.dropPending(c)
+
+		data += chunk
+		self.pending[c][1] = data
+
+		if data.startswith(b'GET ') and b'\r\n\r\n' not in data:
+			return
+
+		roomId = None
+		requestLine = re.match(rb'GET\s+(\S+)\s+HTTP/', data)
+		if requestLine != None:
+			roomId = roomIdFromPath(requestLine.group(1).decode('latin-1'))
+
+		self.selector.unregister(c)
+		del self.pending[c]
+		timer.cancel()
+
+		self.route(c, addr, data, roomId)
+
+	def dropPending(self, c):
+		self.selector.unregister(c)
+		self.pending.pop(c)[2].cancel()
+		c.close()
+
+	# a connection that did not complete its upgrade request in time
+	def expirePending(self, c):
+		if c in self.pending:
+			debug(f'[Cluster] Upgrade request of {self.pending[c][0]} timed out.')
+			self.dropPending(c)
+
+	def pickWorker(self, roomId) -> WorkerInfo | None:
+		index = self.pinned.get(roomId)
+
+		if index != None and self.workers[index].alive:
+			return self.workers[index]
+
+		alive = [worker for worker in self.workers if worker.alive]
+		if len(alive) < 1:
+			return None
+
+		worker = min(alive, key=lambda worker: worker.load())
+
+		# invalid room ids are not pinned, the worker answers with an error
+		if roomId != None:
+			self.pinned[roomId] = worker.index
+
+		return worker
+
+	def route(self, c, addr, data, roomId):
+		worker = self.pickWorker(roomId)
+
+		try:
+			if worker == None:
+				raise OSError("no worker alive")
+
+			sendChannel(worker.channel, {
+				"type": "connection",
+				"address": list(addr),
+				"room": roomId,
+				"data": base64.b64encode(data).decode('ascii')
+			}, [c.fileno()])
+
+			worker.routed += 1
+		except OSError as e:
+			warning(f'[Cluster] route: {e}')
+		finally:
+			c.close() # the worker owns its own copy now
+
+	def readWorker(self, worker: WorkerInfo):
+		while True:
+			try:
+				data = worker.channel.recv(CLUSTER_CHANNEL_BUFFER)
+			except (BlockingIOError, InterruptedError):
+				return
+			except OSError:
+				data = b''
+
+			if len(data) < 1:
+				return self.onWorkerExit(worker)
+
+			try:
+				message = json.loads(data)
+
+				match message['type']:
+					case 'stats':
+						worker.connections = message['connections']
+						worker.routed = 0
+						worker.rooms = message['rooms']
+						worker.leaderboard = message['leaderboard']
+						worker.metrics = message.get('metrics', [])
+					case 'room_closed':
+						if self.pinned.get(message['room']) == worker.index:
+							del self.pinned[message['room']]
+					case 'rooms_restored':
+						for roomId in message['rooms']:
+							self.pinned.setdefault(roomId, worker.index)
+			except Exception as e:
+				warning('[Cluster] worker message:', e)
+
+	def onWorkerExit(self, worker: WorkerInfo):
+		warning(f'[Cluster] Worker {worker.index} exited, its rooms will be pinned elsewhere.')
+
+		worker.alive = False
+		self.selector.unregister(worker.channel)
+		worker.channel.close()
+
+		for roomId, index in list(self.pinned.items()):
+			if index == worker.index:
+				del self.pinned[roomId]
+
+	# the metrics reported by the workers, labelled with the worker index
+	def workerMetrics(self) -> list:
+		families = []
+
+		for worker in self.workers:
+			if not worker.alive:
+				continue
+
+			for name, kind, help, samples in worker.metrics:
+				families.append([name, kind, help, [[suffix, dict(labels, worker=worker.index), value] for suffix, labels, value in samples]])
+
+		return families
+
+	def lobby(self) -> dict:
+		rooms = []
+		leaderboard = []
+
+		for worker in self.workers:
+			if not worker.alive:
+				continue
+
+			rooms.extend(dict(room, worker=worker.index) for room in worker.rooms)
+			leaderboard.extend(worker.leaderboard)
+
+		rooms.sort(key=lambda room: room["players"], reverse=True)
+		leaderboard.sort(key=lambda player: player["points"], reverse=True)
+
+		return {
+			"rooms": rooms[:LOBBY_ROOMS_SIZE],
+			"leaderboard": leaderboard[:LOBBY_LEADERBOARD_SIZE]
+		}
+
+	# every CLUSTER_STATS_INTERVAL seconds
+	def shareLobby(self):
+		self.scheduler.callLater(CLUSTER_STATS_INTERVAL, self.shareLobby)
+
+		message = {
+			"type": "lobby",
+			"lobby": self.lobby()
+		}
+
+		for worker in self.workers:
+			if not worker.alive:
+				continue
+
+			try:
+				sendChannel(worker.channel, message)
+			except OSError as e:
+				warning(f'[Cluster] lobby: {e}')
@@ -0,0 +1,51 @@
+from server.scheduler import *
+from collections import deque
+
+# A single-owner command queue (one per arena).
+# Commands can be posted from any thread, they run one at a time and in order on the
+# scheduler's loop, so the state only they touch needs no locks and every command sees
+# the effects of the ones posted before it.
+class CommandQueue:
+	def __init__(self, scheduler: Scheduler) -> None:
+		self.scheduler = scheduler
+		self.commands = deque() # (callback, args), append and popleft are atomic
+		self.lock = threading.Lock() # only guards the scheduled flag
+		self.scheduled = False
+		self.processed = 0
+
+	def __len__(self) -> int:
+		return len(self.commands)
+
+	def post(self, callback, *args):
+		self.commands.append((callback, args))
+
+		with self.lock:
+			if self.scheduled:
+				return
+			self.scheduled = True
+
+		self.scheduler.callSoon(self.drain)
+
+	# run the commands queued so far, commands they post run on the next drain
+	def drain(self):
+		with self.lock:
+			self.scheduled = False
+
+		for _ in range(len(self.commands)):
+			callback, args = self.commands.popleft()
+
+			if METRICS_ENABLED:
+				started = time.perf_counter()
+
+			try:
+				if PROFILE_ENABLED:
+					timeHandler(handlerName(callback), callback, *args)
+				else:
+					callback(*args)
+			except Exception as e:
+				error("command:", e)
+
+			if METRICS_ENABLED:
+				COMMAND_SECONDS.labels(callback.__name__).observe(time.perf_counter() - started)
+
+			self.processed += 1
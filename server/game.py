@@ -1,116 +1,461 @@
-import json
 from server.socket_handler import *
-from threading import Timer
+from server.questions import *
+from server.scoreboard import *
+from server.scoring import *
+from server.commands import *
+from server.store import *
+from server.journal import *
+from urllib.parse import urlsplit, parse_qs
 import random
+import secrets
 import time
 import re
 import os
 
 random.seed(time.time())
 
+# messages that only carry the latest state, an unsent older one is replaced by a newer one
+COALESCED_MESSAGES = {
+	"players_info": "players_info",
+	"round_started": "round",
+	"round_ended": "round"
+}
+
+# A player's scoring state lives in its arena's PlayerColumns, at the player's slot.
 class Player:
-	def __init__(self, client: SocketClient) -> None:
+	__slots__ = ('client', 'name', 'columns', 'slot', 'token')
+
+	def __init__(self, client: SocketClient, columns: PlayerColumns = None, slot = None) -> None:
+		if columns == None:
+			columns = PlayerColumns()
+			slot = columns.allocate()
+
 		self.client = client
 		self.name = None
-		self.points = 0
-		self.answered = None
-		self.registered = False # only set this to True after they registered
-		self.justJoined = True # immunity to point decrease if joined mid-match, but also receives less points
-		self.penalty = 0 # gameovered after a penalty
-		self.gameovered = False
+		self.columns = columns
+		self.slot = slot
+		self.token = None # resume token, issued once registered
+
+	@property
+	def points(self) -> int:
+		return self.columns.points[self.slot]
+
+	@points.setter
+	def points(self, value):
+		self.columns.points[self.slot] = value
+
+	# gameovered after a penalty
+	@property
+	def penalty(self) -> int:
+		return self.columns.penalty[self.slot]
+
+	@penalty.setter
+	def penalty(self, value):
+		self.columns.penalty[self.slot] = value
+
+	@property
+	def gameovered(self) -> bool:
+		return self.columns.gameovered[self.slot] != 0
+
+	@gameovered.setter
+	def gameovered(self, value):
+		self.columns.gameovered[self.slot] = int(value)
+
+	# immunity to point decrease if joined mid-match, but also receives less points
+	@property
+	def justJoined(self) -> bool:
+		return self.columns.justJoined[self.slot] != 0
+
+	@justJoined.setter
+	def justJoined(self, value):
+		self.columns.justJoined[self.slot] = int(value)
+
+	# only set this to True after they registered
+	@property
+	def registered(self) -> bool:
+		return self.columns.registered[self.slot] != 0
+
+	@registered.setter
+	def registered(self, value):
+		self.columns.registered[self.slot] = int(value)
+
+	@property
+	def answered(self):
+		return self.columns.answerOf(self.slot)
 
 	def __eq__(self, __value: object) -> bool:
 		if not isinstance(__value, Player):
 			return False
+
+		# detached players have no client
+		if self.client == None:
+			return self is __value
 		
 		return self.client == __value.client
 	
 	def information(self):
-		print("Client:", self.client.addressString())
-		print("Registered:", self.registered)
+		debug("Client:", self.client.addressString())
+		debug("Registered:", self.registered)
 		if self.registered:
-			print("Name:", self.name)
+			debug("Name:", self.name)
 			if self.justJoined:
-				print("Joined mid-round.")
+				debug("Joined mid-round.")
 
 			if self.gameovered:
-				print("Game-overed.")
+				debug("Game-overed.")
 			else:
-				print("Points:", self.points)
-				print("Penalty:", self.penalty)
-				print("Current answer:", "Not answered" if self.answered == None else self.answered)
-
+				debug("Points:", self.points)
+				debug("Penalty:", self.penalty)
+				debug("Current answer:", "Not answered" if self.answered == None else self.answered)
+
+# Players indexed by their client and, once registered, by nickname.
+# Both dicts keep insertion order, so iterating the list still follows join order.
+# A registered player whose client is gone stays detached (by nickname and resume token)
+# until a new client resumes it or the arena forgets it.
 class PlayerManager:
 	def __init__(self) -> None:
-		self.list = []
+		self.players = {}
+		self.names = {}
+		self.tokens = {} # resume token -> registered player
+		self.columns = PlayerColumns()
+		self.slots = [] # slot -> player that last held it
+		self.detached = {} # resume token -> registered player without a client (disconnected, or restored after a restart)
+
+	# snapshot of all players in join order, safe to iterate while players come and go
+	@property
+	def list(self) -> list:
+		return list(self.players.values())
+
+	# registered players, connected or detached, in registration order
+	@property
+	def registered(self) -> list:
+		return list(self.names.values())
+
+	def __len__(self) -> int:
+		return len(self.players)
 
 	def find(self, client: SocketClient) -> Player | None:
-		for player in self.list:
-			if player.client == client:
-				return player
-		
-		return None
+		return self.players.get(client)
+
+	def findByName(self, name) -> Player | None:
+		return self.names.get(name)
+
+	def findByToken(self, token) -> Player | None:
+		return self.tokens.get(token)
 	
 	def add(self, client: SocketClient) -> Player:
 		player = self.find(client)
 		
 		if player == None:
-			player = Player(client)
-			self.list.append(player)
+			player = self.track(Player(client, self.columns, self.columns.allocate()))
+			self.players[client] = player
 		
 		return player
+
+	def track(self, player: Player) -> Player:
+		if player.slot < len(self.slots):
+			self.slots[player.slot] = player
+		else:
+			self.slots.append(player)
+
+		return player
+
+	# register a player under a nickname, returns False if someone already picked it
+	def register(self, player: Player, name) -> bool:
+		if name in self.names:
+			return False
+
+		player.registered = True
+		player.name = name
+		player.token = secrets.token_hex(16)
+		self.names[name] = player
+		self.tokens[player.token] = player
+
+		return True
+
+	# add a registered player read back from the journal, detached until reclaimed with its token
+	def restore(self, state: PlayerState) -> Player | None:
+		if state.name in self.names or state.token == None:
+			return None
+
+		player = self.track(Player(None, self.columns, self.columns.allocate()))
+		player.name = state.name
+		player.token = state.token
+		player.registered = True
+		player.points = state.points
+		player.penalty = state.penalty
+		player.gameovered = state.gameovered
+		player.justJoined = state.justJoined
+		self.columns.present[player.slot] = 0 # not scored until reclaimed
+
+		self.names[player.name] = player
+		self.tokens[player.token] = player
+		self.detached[player.token] = player
+
+		return player
+
+	# keep the registered player of a closed client for a later resume, None if it was not registered
+	def detach(self, client: SocketClient) -> Player | None:
+		player = self.players.get(client)
+
+		if player == None or not player.registered:
+			return None
+
+		del self.players[client]
+		player.client = None
+		self.columns.present[player.slot] = 0 # not scored while away
+		self.detached[player.token] = player
+
+		return player
+
+	# hand a detached player over to client, replacing the client's unregistered player
+	def reattach(self, client: SocketClient, token) -> Player | None:
+		player = self.detached.pop(token, None)
+
+		if player == None:
+			return None
+
+		self.remove(client)
+
+		player.client = client
+		self.players[client] = player
+		self.columns.present[player.slot] = 1
+
+		return player
+
+	# drop a detached player nobody reclaimed
+	def forget(self, player: Player):
+		if self.detached.get(player.token) is not player:
+			return
+
+		del self.detached[player.token]
+		del self.tokens[player.token]
+		self.columns.release(player.slot)
+
+		if self.names.get(player.name) is player:
+			del self.names[player.name]
 	
 	def remove(self, client: SocketClient) -> Player | None:
-		for player in self.list:
-			if player.client == client:
-				self.list.remove(player)
-				return player
-			
-		return None
+		player = self.players.pop(client, None)
+
+		if player == None:
+			return None
+
+		self.columns.release(player.slot)
+
+		if player.registered and self.names.get(player.name) is player:
+			del self.names[player.name]
+			self.tokens.pop(player.token, None)
+
+		return player
 
+# A single arena. Run standalone it owns its SocketServer,
+# otherwise it is one room of a RoomManager sharing the manager's server.
+# Its state is only changed by commands on its queue: clients, messages and round timers
+# post them (onClientConnect, onMessage, onClientClose, Set.schedule) and they run in order.
 class Game:
-	def __init__(self) -> None:
-		server = self.server = SocketServer()
-		server.setMessageHandler(self.onMessage)
-		server.setClientCloseHandler(self.onClientClose)
-		server.setClientConnectHandler(self.onClientConnect)
-		server.setServerOnStartup(self.startRound)
+	def __init__(self, server: SocketServer = None, roomId = None) -> None:
+		self.roomId = roomId
+		self.server = server
+		self.journal = None # where state changes are recorded to survive restarts (see server/journal.py)
+		self.closed = False # set once the arena is dropped, see close
+		self.expiries = {} # resume token -> timer forgetting the detached player
+		self.spectators = set() # clients watching without a player, see addSpectator
+		self.spectatorUpdate = None # timer sending spectators the scoreboard
+		self.spectatorsUpdatedAt = 0.0 # time.monotonic() spectators last got it
+
+		if server == None:
+			server = self.server = SocketServer()
+			server.setMessageHandler(self.onMessage)
+			server.setClientCloseHandler(self.onClientClose)
+			server.setClientConnectHandler(self.onClientConnect)
+			server.setServerOnStartup(self.startRound)
+
+			if SNAPSHOT_ENABLED:
+				self.journal = Journal('arena')
+
+		self.scheduler = self.server.scheduler
+		self.commands = CommandQueue(self.scheduler)
+		self.questions = sharedQuestionPool()
+		self.store = sharedMatchStore()
 		self.players = PlayerManager()
+		self.scoreboard = Scoreboard(self.players)
 		self.round = Set(self)
 
+	# stop the arena's pending round timers
+	def close(self):
+		self.closed = True
+		self.round.cancelTimer()
+		self.round.finishMatch()
+
+		if self.spectatorUpdate != None:
+			self.spectatorUpdate.cancel()
+
+		if self.journal != None:
+			self.journal.append(closedRecord(self))
+
+	# log a change of the arena to the journal: record(self, *args) is one of the records of server/journal.py
+	def logChange(self, record, *args):
+		if self.journal != None:
+			self.journal.append(record(self, *args))
+
+	# continue from the state read back from the journal, its players wait to be reclaimed
+	def restore(self, state: ArenaState):
+		round = self.round
+
+		self.winningPoints = state.winningPoints
+		self.countdown = state.countdown
+
+		round.roundEnd, round.endGame = state.roundEnd, state.endGame
+		round.notStarted, round.notEnoughPlayers = state.notStarted, state.notEnoughPlayers
+		round.num1, round.num2, round.operator = state.num1, state.num2, state.operator
+		round.accepted, round.result, round.endTime = state.accepted, state.result, state.endTime
+		round.roundIndex, round.matchStarted = state.roundIndex, state.matchStarted
+		round.matchId = state.matchId if self.store.enabled else None
+
+		answers = []
+		for playerState in state.players.values():
+			player = self.players.restore(playerState)
+
+			if player != None and playerState.answerState != NO_ANSWER:
+				answers.append((playerState.position, player, playerState.answered if playerState.answerState == ANSWERED else INT64_MAX + 1))
+
+		for _, player, answer in sorted(answers, key=lambda answer: answer[0]):
+			self.players.columns.answer(player.slot, answer)
+
+		round.winner = self.players.findByName(state.winner) if state.winner != None else None
+		self.scoreboard.seed()
+
+		# pick the round up where it was, the deadline may already be over
+		if round.notStarted or round.endTime == None:
+			pass
+		elif round.roundEnd:
+			round.schedule(max(0, round.endTime / 1000 - time.time()), round.restartRound)
+		else:
+			round.schedule(max(0, round.endTime / 1000 - time.time()), round.endRound)
+
+		for player in list(self.players.detached.values()):
+			self.expireLater(player, RESUME_TIMEOUT)
+
+	# forget a detached player unless it is resumed within timeout seconds
+	def expireLater(self, player: Player, timeout):
+		self.expiries[player.token] = self.scheduler.callLater(timeout, self.post, self.expire, player)
+
+	def expire(self, player: Player):
+		if self.players.detached.get(player.token) is not player:
+			return
+
+		self.expiries.pop(player.token, None)
+		self.players.forget(player)
+		self.logChange(leftRecord, player)
+
+		self.sendData(None, "player_left", player.name)
+		self.playerStatus()
+
+	# give cli the detached player of token and bring it up to date:
+	# the scoreboard deltas after seq and, unless it already has it, the round state.
+	# Returns False if there is no such player.
+	def resume(self, cli: SocketClient, token, seq = None, roundEnd = None) -> bool:
+		# the old connection may not have noticed it is gone yet (after switching networks), the new one takes over
+		current = self.players.findByToken(token)
+		if current != None and current.client != None and current.client is not cli:
+			old = current.client
+			self.players.detach(old)
+			self.server.closeClient(old)
+
+		player = self.players.reattach(cli, token)
+
+		if player == None:
+			return False
+
+		timer = self.expiries.pop(token, None)
+		if timer != None:
+			timer.cancel()
+
+		self.sendData(cli, "register_success", player.name)
+		self.sendData(cli, "resume_token", player.token)
+
+		if roundEnd != self.round.endTime:
+			self.round.status(cli)
+
+		deltas = self.scoreboard.since(seq) if seq != None else None
+
+		if deltas == None:
+			self.playerStatus(cli)
+		else:
+			for delta in deltas:
+				self.sendData(cli, "players_delta", delta)
+
+		self.playerStatus()
+
+		if self.round.notEnoughPlayers:
+			self.round.start()
+
+		return True
+
 	def generateRaceValues(self):
 		self.winningPoints = random.randint(3, 26)
 		self.countdown = MAX_COUNTDOWN_TIME # seconds, decrease 1s every round
 	
 	def start(self):
 		os.environ['WS_ENDPOINT'] = f"ws://{SERVER_HOST}:{SERVER_PORT}/"
+
+		if self.journal != None:
+			state = self.journal.recover().get(self.roomId or DEFAULT_ROOM_ID)
+			if state != None:
+				self.restore(state)
+				info(f'[Journal] Restored the arena with {len(state.players)} players.')
+
+			self.journal.start(self.scheduler, lambda: [self])
+
 		self.server.start()
 
 	def startRound(self):
-		self.round.start()
+		# a restored arena already has its round timer
+		if self.round.timer != None:
+			return
+
+		self.post(self.round.start)
+
+	# run callback(*args) as a command of this arena
+	def post(self, callback, *args):
+		self.commands.post(callback, *args)
 
-	def sendDataToSingle(self, cli, message):
+	def sendDataToSingle(self, cli, name, content):
 		try:
-			cli.sendJSON(message)
+			cli.sendMessage(name, content, COALESCED_MESSAGES.get(name))
 		except Exception as e:
-			print("send:", e)
+			error("send:", e)
 			return
 
 	def sendData(self, cli, name, content):
-		message = {
-			"name": name,
-			"data": content
-		}
-
 		if cli == None:
-			# send to all players
-			for player in self.players.list:
-				self.sendDataToSingle(player.client, message)
+			clients = [player.client for player in self.players.list]
 
-			return
+			# spectators get the scoreboard throttled instead of every delta (see updateSpectators)
+			if len(self.spectators) > 0 and name != "players_delta":
+				clients.extend(self.spectators)
 
-		self.sendDataToSingle(cli, message)
+			return self.broadcast(clients, name, content)
+
+		self.sendDataToSingle(cli, name, content)
+
+	# send to clients, encoded once per protocol
+	def broadcast(self, clients, name, content):
+		if METRICS_ENABLED:
+			started = time.perf_counter()
+
+		broadcast(clients, name, content, COALESCED_MESSAGES.get(name))
+
+		if METRICS_ENABLED:
+			BROADCAST_SECONDS.observe(time.perf_counter() - started)
+			BROADCAST_RECIPIENTS.inc(len(clients))
 	
+	# send to one player, nothing if it is detached (never a broadcast)
+	def sendToPlayer(self, player: Player, name, content):
+		if player.client != None:
+			self.sendDataToSingle(player.client, name, content)
+
 	def sendError(self, cli, errorMsg):
 		return self.sendData(cli, "error", errorMsg)
 	
@@ -119,11 +464,34 @@ class Game:
 
 	def onMessage(self, cli, msg):
 		try:
-			data = json.loads(msg)
+			data = cli.decodeMessage(msg)
+		except Exception as e:
+			if METRICS_ENABLED:
+				MESSAGE_PARSE_ERRORS.inc()
+			debug("decode:", e)
+			return
+
+		self.post(self.handleMessage, cli, data, cli.receivedAt)
+
+	# when an answer received at receivedAt was sent, as far as we can tell
+	def answerTime(self, cli: SocketClient, receivedAt):
+		if receivedAt == None:
+			receivedAt = time.monotonic()
+
+		if LATENCY_COMPENSATION and cli.rtt != None:
+			receivedAt -= min(cli.rtt / 2, MAX_LATENCY_COMPENSATION)
+
+		return receivedAt
 
+	# handle an already decoded message (a command), receivedAt: time.monotonic() it was read from the socket
+	def handleMessage(self, cli, data, receivedAt = None):
+		try:
 			player = self.players.find(cli)
 
 			if player == None:
+				if cli in self.spectators:
+					return self.handleSpectatorMessage(cli, data)
+
 				return self.sendError(cli, "Who are you?")
 			
 			
@@ -140,26 +508,35 @@ class Game:
 						if re.match(r'^[a-zA-Z0-9_]{1,10}$', nickname) == None:
 							return self.sendError(cli, "Nickname must only from 1-10 character(s) and only contains alphanumerics and/or underscores (_).")
 						
-						for p in self.players.list:
-							if p.registered and p.name == nickname:
-								return self.sendError(cli, "Someone already picked this nickname. Please try another.")
-							
-						player.registered = True
-						player.name = nickname
-
-						self.sendData(None, "players_info", [{
-							"name": player.name,
-							"points": player.points,
-							"gameovered": player.gameovered
-						}])
+						if not self.players.register(player, nickname):
+							return self.sendError(cli, "Someone already picked this nickname. Please try another.")
+
+						self.logChange(joinedRecord, player)
+						self.playerStatus()
 
 						if self.round.notEnoughPlayers:
 							self.round.start()
 
-						return self.sendData(cli, "register_success", player.name)
+						self.sendData(cli, "register_success", player.name)
+						return self.sendData(cli, "resume_token", player.token)
 					except Exception as e:
-						print("register (debug):", e)
+						error("register (debug):", e)
 						return self.sendError(cli, "Please provide a nickname.")
+				case 'players_resync':
+					return self.playerStatus(cli)
+				case 'spectate':
+					if player.registered:
+						return self.sendError(cli, "You are already registered.")
+
+					self.players.remove(cli)
+					return self.addSpectator(cli)
+				case 'resume':
+					if player.registered:
+						return self.sendError(cli, "You are already registered.")
+
+					# (this client got the full state when it connected)
+					if not self.resume(cli, str(data.get('token')), self.scoreboard.seq, self.round.endTime):
+						return self.sendError(cli, "This session can not be resumed.")
 				case 'answer':
 					try:
 						if not player.registered:
@@ -184,40 +561,118 @@ class Game:
 							else:
 								answer = int(answer)
 						
-						player.answered = answer
+						self.players.columns.answer(player.slot, answer, self.answerTime(cli, receivedAt))
 
-						self.round.answers.append(player)
+						self.logChange(answerRecord, player, answer)
 
 						self.sendMessage(cli, "Answer received.")
 					except Exception as e:
-						print("answer (debug):", e)
+						error("answer (debug):", e)
 						return self.sendError(cli, "Please provide an answer.")
 		except Exception as e:
-			print("handle:", e)
+			error("handle:", e)
 			return
 
+	def handleSpectatorMessage(self, cli, data):
+		if data['name'] == 'players_resync':
+			return self.playerStatus(cli)
+
+		self.sendError(cli, "Spectators can not play, reconnect without ?spectate to join.")
+
 	def onClientClose(self, cli):
+		self.post(self.removeClient, cli)
+
+	# the client is still connected, but moved to another room
+	def onClientLeave(self, cli):
+		self.post(self.removeClient, cli, False)
+
+	def removeClient(self, cli, closed = True):
+		if self.removeSpectator(cli):
+			return
+
+		# registered players whose connection closed wait for their client to come back (see resume)
+		if closed and RECONNECT_GRACE > 0:
+			player = self.players.detach(cli)
+
+			if player != None:
+				self.expireLater(player, RECONNECT_GRACE)
+				return
+
 		player = self.players.remove(cli)
 
 		if player != None and player.registered:
+			self.logChange(leftRecord, player)
 			self.sendData(None, "player_left", player.name)
+			self.playerStatus()
 
+	# send the full scoreboard to a client, or what changed since the last update to everyone
 	def playerStatus (self, client:SocketClient = None):
-		playersData = []
+		if client != None:
+			return self.sendData(client, "players_info", self.scoreboard.snapshot())
 
-		for player in self.players.list:
-			if not player.registered:
-				continue
+		delta = self.scoreboard.delta()
 
-			playersData.append({
-				"name": player.name,
-				"points": player.points,
-				"gameovered": player.gameovered
-			})
+		if delta != None:
+			self.sendData(None, "players_delta", delta)
+
+			if len(self.spectators) > 0 and self.spectatorUpdate == None:
+				delay = max(0, self.spectatorsUpdatedAt + 1 / SPECTATOR_UPDATE_RATE - time.monotonic())
+				self.spectatorUpdate = self.scheduler.callLater(delay, self.post, self.updateSpectators)
+
+	# the whole scoreboard to every spectator, at most SPECTATOR_UPDATE_RATE times a second:
+	# one encoding for all of them, and a slow spectator's queue only ever holds the latest
+	def updateSpectators(self):
+		self.spectatorUpdate = None
+		self.spectatorsUpdatedAt = time.monotonic()
+
+		if len(self.spectators) > 0:
+			self.broadcast(list(self.spectators), "players_info", self.scoreboard.snapshot())
+
+	# watch the arena: round messages as they happen, the scoreboard throttled, no player
+	def addSpectator(self, cli: SocketClient):
+		self.spectators.add(cli)
+
+		if METRICS_ENABLED:
+			SPECTATORS.inc()
+
+		self.round.status(cli)
+		self.playerStatus(cli)
+
+	def removeSpectator(self, cli: SocketClient) -> bool:
+		if cli not in self.spectators:
+			return False
+
+		self.spectators.discard(cli)
 
-		self.sendData(client, "players_info", playersData)
+		if METRICS_ENABLED:
+			SPECTATORS.dec()
+
+		return True
+
+	# initial: cli just connected, otherwise it moved here from another room and enters as a new client
+	def onClientConnect(self, cli: SocketClient, initial = True):
+		self.post(self.addClient, cli, initial)
+
+	def addClient(self, cli: SocketClient, initial = True):
+		# a reconnecting client asks to resume in the upgrade path: ?resume=<token>&seq=<scoreboard seq>&round=<round end time>,
+		# a spectator with ?spectate=1 (only read on the connect itself, not on later room joins)
+		query = parse_qs(urlsplit(cli.path).query) if initial else {}
+
+		if query.get('spectate', ['0'])[0] != '0':
+			return self.addSpectator(cli)
+
+		if 'resume' in query:
+			try:
+				seq = int(query['seq'][0]) if 'seq' in query else None
+				roundEnd = int(query['round'][0]) if 'round' in query else None
+			except ValueError:
+				seq = roundEnd = None
+
+			if self.resume(cli, query['resume'][0], seq, roundEnd):
+				return
+
+			self.sendError(cli, "This session can not be resumed.")
 
-	def onClientConnect(self, cli: SocketClient):
 		newPlayer = self.players.add(cli)
 
 		self.round.status(newPlayer.client)
@@ -236,21 +691,28 @@ class Set:
 		self.num1 = None
 		self.num2 = None
 		self.operator = None
+		self.accepted = None
 		self.notStarted = True
 		self.notEnoughPlayers = True
+		self.timer = None
+		self.matchId = None # id of the match being recorded, None if not recording
+		self.matchStarted = None
+		self.roundIndex = 0
 
-	def restartRound (self):
-		# restart player stuff
-		for player in self.manager.players.list:
-			player.answered = None
+	# post callback as a command after delay seconds, replacing the pending phase transition
+	def schedule (self, delay, callback):
+		self.cancelTimer()
+		self.timer = self.manager.scheduler.callLater(delay, self.manager.post, callback)
 
-			if player.registered:
-				player.justJoined = False
+	def cancelTimer (self):
+		if self.timer != None:
+			self.timer.cancel()
+			self.timer = None
 
-			if self.endGame:
-				player.points = 0
-				player.penalty = 0
-				player.gameovered = False
+	def restartRound (self):
+		# restart player stuff
+		newGame = self.endGame
+		self.manager.players.columns.newRound(newGame)
 		
 		if self.noPlayers():
 			self.notStarted = True
@@ -259,37 +721,17 @@ class Set:
 			self.status()
 		else:
 			try:
-				self.answers = []
-				
 				if self.endGame:
 					self.manager.generateRaceValues()
+					self.beginMatch()
 				else:
 					self.manager.countdown = max(self.manager.countdown - 1, MIN_COUNTDOWN_TIME)
 
 				if self.endGame:
 					self.manager.playerStatus()
 
-				# select operator
-				self.operator = random.choice(["+", "-", "*", "/", "%"])
-
-				# select second int
-				match (self.operator):
-					case "%" | "/":
-						# random but skip zero
-						self.num2 = random.choice(list(range(-10000, 0)) + list(range(1, 10001)))
-					case _:
-						self.num2 = random.randrange(-10000, 10000, 1)
-
-				# select first int
-				match (self.operator):
-					case "/":
-						# ensure division value will always be int
-						division1 = int(-10000 / self.num2)
-						division2 = int(10000 / self.num2)
-						self.num1 = self.num2 * random.randrange(min(division1, division2), max(division1, division2), 1)
-					case _:
-						self.num1 = random.randrange(-10000, 10000, 1)
-
+				# pick the next pre-generated question
+				self.num1, self.num2, self.operator, self.accepted = self.manager.questions.next()
 
 				self.roundEnd = False
 				self.endGame = False
@@ -300,16 +742,45 @@ class Set:
 
 				self.status()
 			except Exception as e:
-				print("restart:", e)
+				error("restart:", e)
 
-			Timer(self.manager.countdown, self.endRound, []).start()
+			self.schedule(self.manager.countdown, self.endRound)
 
-	def noPlayers (self) -> bool:
-		for player in self.manager.players.list:
-			if player.registered and not player.gameovered:
-				return False
+		self.manager.logChange(roundRecord, ROUND_STARTED, newGame)
 
-		return True
+	# start recording a new match (if the arena has a store)
+	def beginMatch (self):
+		if not self.manager.store.enabled:
+			return
+
+		self.matchId = self.manager.store.newMatchId()
+		self.matchStarted = time.time()
+		self.roundIndex = 0
+
+	# answers: (slot, answer) in arrival order, taken before scoring
+	def recordRound (self, answers, score: RoundScore):
+		correct = set(score.correct)
+		slots = self.manager.players.slots
+
+		self.roundIndex += 1
+		self.manager.store.recordRound(self.matchId, self.roundIndex, self.num1, self.num2, self.operator, self.result,
+			[(slots[slot].name, answer, int(slot in correct)) for slot, answer in answers], time.time())
+
+	# record the match being recorded with the players still in the arena (or about to come back)
+	def finishMatch (self):
+		if self.matchId == None:
+			return
+
+		standings = [(player.name, player.points, player.gameovered) for player in self.manager.players.registered]
+
+		self.manager.store.recordMatch(self.matchId, self.manager.roomId or DEFAULT_ROOM_ID, self.manager.winningPoints, self.roundIndex,
+			self.winner.name if self.winner != None else None, standings, self.matchStarted, time.time())
+
+		self.matchId = None
+
+	# players waiting to be reclaimed keep the match going
+	def noPlayers (self) -> bool:
+		return not self.manager.players.columns.anyActive() and len(self.manager.players.detached) < 1
 
 	def status (self, client:SocketClient = None):
 		if self.roundEnd:
@@ -348,74 +819,39 @@ class Set:
 		self.endRound(True)
 		
 	def endRound (self, init = False):
+		scored = [] # slots whose score changed
+
 		try:
 			self.roundEnd = True
 
 			if not init:
-				# calculate result
-				result = self.result = [int(eval(f'{self.num1} {self.operator} {self.num2}'))]
+				# accepted answers were computed with the question
+				result = self.result = self.accepted
 
-				if self.operator == "%":
-					self.result.append(self.result[0] - self.num2)
-					self.result.sort(reverse=True)
+				players = self.manager.players
+				players.columns.rankAnswers()
 
-				firstCorrect = None
+				answers = None
+				if self.matchId != None:
+					answers = [(slot, players.columns.answerOf(slot)) for slot in players.columns.order]
 
-				# check list of answered
-				new_answers = []
-				for player in self.answers:
-					if player.answered in result:
-						player.penalty = 0
-						
-						new_answers.append(player)
-
-						self.manager.sendData(player.client, "correct_answer", "")
-
-						if firstCorrect == None:
-							firstCorrect = player
-						else:
-							player.points += 1
-					else:
-						player.answered = None
-
-				self.answers = new_answers
-
-				# check for all players to check how many failed
-				totalPointsLost = 0
-				for player in self.manager.players.list:
-					if (not player.registered) or player.gameovered:
-						continue
-
-					if player.answered == None:
-						# incorrect answer
-						self.manager.sendData(player.client, "wrong_answer", "")
-						if player.justJoined:
-							continue
-
-						player.penalty += 1
-						if player.penalty >= 3: # wrong answer 3 times in a row
-							player.gameovered = True
-							totalPointsLost += player.points
-							self.manager.sendData(player.client, "disqualified", "You are disqualified for many wrong answers in a row.")
-						elif player.points > 0:
-							totalPointsLost += 1
-							player.points -= 1
-					
-
-				# give more points to first correct one
-				if firstCorrect != None:
-					totalPointsLost = max(2, totalPointsLost)
-					if firstCorrect.justJoined:
-						# nerf to prevent smurfers
-						totalPointsLost //= 2
-					
-					firstCorrect.points += totalPointsLost
-
-				# check if someone wins yet?
-				self.winner = None
-				for player in self.answers:
-					if player.points >= self.manager.winningPoints and (self.winner == None or self.winner.points < player.points):
-						self.winner = player
+				score = scoreRound(players.columns, result, self.manager.winningPoints)
+
+				if answers != None:
+					self.recordRound(answers, score)
+
+				scored = score.correct + score.wrong
+
+				for slot in score.correct:
+					self.manager.sendToPlayer(players.slots[slot], "correct_answer", "")
+
+				for slot in score.wrong:
+					self.manager.sendToPlayer(players.slots[slot], "wrong_answer", "")
+
+				for slot in score.disqualified:
+					self.manager.sendToPlayer(players.slots[slot], "disqualified", "You are disqualified for many wrong answers in a row.")
+
+				self.winner = players.slots[score.winner] if score.winner != None else None
 
 				if self.winner != None:
 					self.endGame = True
@@ -423,8 +859,11 @@ class Set:
 			if self.noPlayers():
 				self.endGame = True
 
+			if self.endGame:
+				self.finishMatch()
+
 		except Exception as e:
-			print("game_end:", e)
+			error("game_end:", e)
 
 		waiting_time = GAME_END_WAITING_TIME if self.endGame else ROUND_END_WAITING_TIME
 
@@ -433,6 +872,8 @@ class Set:
 		try:
 			self.status()
 		except Exception as e:
-			print("game_status:", e)
+			error("game_status:", e)
+
+		self.schedule(waiting_time, self.restartRound)
 
-		Timer(waiting_time, self.restartRound, []).start()
\ No newline at end of file
+		self.manager.logChange(roundRecord, ROUND_ENDED, False, scored)
\ No newline at end of file
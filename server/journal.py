@@ -0,0 +1,507 @@
+from server.log import *
+from server.questions import OPERATORS
+import atexit
+import os
+import queue
+import struct
+import threading
+import zlib
+
+# Crash-safe arena state: a full snapshot of every arena every SNAPSHOT_INTERVAL seconds,
+# plus an append-only log of what changed since. Both are the same binary records:
+#   header (body size, crc32 of type and body, type), room id, body
+# A new snapshot starts a new log generation. It is taken SNAPSHOT_BATCH arenas per loop iteration,
+# each arena record also goes to the log between the changes before and after it, and the
+# snapshot file is only replaced once every arena is in. A restart loads <name>.snapshot and
+# replays <name>-<generation>.log of its generation and every later one (of snapshots that never
+# completed), each up to the first torn or corrupt record.
+
+RECORD_ARENA = 1 # the whole state of an arena (in snapshots, and in the log of their generation)
+RECORD_ANSWER = 2 # an answer accepted since the arena's last state
+RECORD_CLOSED = 3 # the arena is gone
+RECORD_JOINED = 4 # a player registered
+RECORD_LEFT = 5 # a registered player is gone for good
+RECORD_ROUND = 6 # a round started or ended, with the scores that changed
+
+# round events
+ROUND_STARTED = 1 # after the players' columns got their newRound
+ROUND_ENDED = 2
+
+SNAPSHOT_MAGIC = b'RAS1'
+
+RECORD_HEADER = struct.Struct('<IIB') # body size, crc32, type
+SNAPSHOT_HEADER = struct.Struct('<4sQ') # magic, generation
+# flags, operator, num1, num2, end time (ms), countdown, points to win, match id, match start, round index, accepted answers
+ARENA_STATE = struct.Struct('<BBqqqdHqdIB')
+# token, points, penalty, gameovered, just joined, answer state, answer, position in the answer order
+PLAYER_STATE = struct.Struct('<16sqbbbbqi')
+ANSWER_STATE = struct.Struct('<bq') # answer state, answer
+ROUND_EVENT = struct.Struct('<BB') # round event, new game
+SCORE_STATE = struct.Struct('<qbbb') # points, penalty, gameovered, just joined
+
+FLAG_ROUND_END = 0x01
+FLAG_END_GAME = 0x02
+FLAG_NOT_STARTED = 0x04
+FLAG_NOT_ENOUGH_PLAYERS = 0x08
+FLAG_HAS_RESULT = 0x10
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+def packString (value) -> bytes:
+	data = (value or '').encode('utf-8')
+	return bytes([len(data)]) + data
+
+def unpackString (data, offset) -> tuple:
+	size = data[offset]
+	return data[offset + 1:offset + 1 + size].decode('utf-8'), offset + 1 + size
+
+def packRecord (type, roomId, body = b'') -> bytes:
+	payload = packString(roomId) + body
+	return RECORD_HEADER.pack(len(payload), zlib.crc32(bytes([type]) + payload), type) + payload
+
+# (type, room id, body) of every intact record, stops at the first torn or corrupt one
+def unpackRecords (data, offset = 0):
+	while offset + RECORD_HEADER.size <= len(data):
+		size, crc, type = RECORD_HEADER.unpack_from(data, offset)
+		start = offset + RECORD_HEADER.size
+		payload = data[start:start + size]
+
+		if len(payload) < size or zlib.crc32(bytes([type]) + payload) != crc:
+			return
+
+		roomId, bodyStart = unpackString(payload, 0)
+		yield type, roomId, payload[bodyStart:]
+
+		offset = start + size
+
+# A restored player, detached until a client reclaims it with the token.
+class PlayerState:
+	__slots__ = ('name', 'token', 'points', 'penalty', 'gameovered', 'justJoined', 'answerState', 'answered', 'position')
+
+# An arena as read back from the journal.
+class ArenaState:
+	def __init__(self, roomId) -> None:
+		self.roomId = roomId
+		self.players = {} # name -> PlayerState
+		self.answers = 0 # answers given this round, orders answers logged after the state
+
+		# the round of a new arena (see Set), an arena created after the snapshot keeps it until its first round record
+		self.roundEnd = self.endGame = self.notStarted = self.notEnoughPlayers = True
+		self.num1 = self.num2 = self.operator = None
+		self.accepted = self.result = self.endTime = self.winner = None
+		self.countdown = MAX_COUNTDOWN_TIME
+		self.winningPoints = 0
+		self.matchId = self.matchStarted = None
+		self.roundIndex = 0
+
+	# state: ANSWERED, or ANSWERED_OUT_OF_RANGE (answered is 0 then, it can not be correct anyway)
+	def answer(self, name, state, answered):
+		player = self.players.get(name)
+
+		if player == None or player.answerState != 0:
+			return
+
+		player.answerState = state
+		player.answered = answered
+		player.position = self.answers
+		self.answers += 1
+
+	# a round started (see PlayerColumns.newRound) or ended, answers only count while it runs
+	def roundChanged(self, started, newGame):
+		for player in self.players.values():
+			player.answerState = 0
+			player.answered = 0
+			player.position = -1
+
+			if started:
+				player.justJoined = 0 # they are all registered
+
+			if newGame:
+				player.points = player.penalty = player.gameovered = 0
+
+		self.answers = 0
+
+# flags, question, timing and match of the arena's round, then its accepted answers and winner
+def packRound (game) -> bytes:
+	round = game.round
+
+	flags = 0
+	flags |= FLAG_ROUND_END if round.roundEnd else 0
+	flags |= FLAG_END_GAME if round.endGame else 0
+	flags |= FLAG_NOT_STARTED if round.notStarted else 0
+	flags |= FLAG_NOT_ENOUGH_PLAYERS if round.notEnoughPlayers else 0
+	flags |= FLAG_HAS_RESULT if round.result != None else 0
+
+	accepted = round.accepted or []
+	parts = [ARENA_STATE.pack(
+		flags,
+		OPERATORS.index(round.operator) if round.operator in OPERATORS else 255,
+		round.num1 or 0,
+		round.num2 or 0,
+		round.endTime if round.endTime != None else -1,
+		getattr(game, 'countdown', MAX_COUNTDOWN_TIME),
+		getattr(game, 'winningPoints', 0),
+		round.matchId or 0,
+		round.matchStarted or 0.0,
+		round.roundIndex,
+		len(accepted)
+	)]
+	parts.append(struct.pack(f'<{len(accepted)}q', *accepted))
+	parts.append(packString(round.winner.name if round.winner != None else None))
+
+	return b''.join(parts)
+
+# position: of the player's answer in this round's answer order, -1 if none
+def packPlayer (player, position = -1) -> bytes:
+	columns = player.columns
+	slot = player.slot
+
+	return packString(player.name) + PLAYER_STATE.pack(
+		bytes.fromhex(player.token) if player.token != None else bytes(16),
+		columns.points[slot],
+		columns.penalty[slot],
+		columns.gameovered[slot],
+		columns.justJoined[slot],
+		columns.answerState[slot],
+		columns.answered[slot],
+		position
+	)
+
+def arenaRecord (game) -> bytes:
+	players = game.players
+
+	positions = {slot: position for position, slot in enumerate(players.columns.order)}
+	registered = list(players.names.values())
+
+	parts = [packRound(game), struct.pack('<H', len(registered))]
+	for player in registered:
+		parts.append(packPlayer(player, positions.get(player.slot, -1)))
+
+	return packRecord(RECORD_ARENA, game.roomId or DEFAULT_ROOM_ID, b''.join(parts))
+
+def answerRecord (game, player, answer) -> bytes:
+	if INT64_MIN <= answer <= INT64_MAX:
+		body = ANSWER_STATE.pack(1, answer)
+	else:
+		body = ANSWER_STATE.pack(2, 0)
+
+	return packRecord(RECORD_ANSWER, game.roomId or DEFAULT_ROOM_ID, packString(player.name) + body)
+
+def joinedRecord (game, player) -> bytes:
+	return packRecord(RECORD_JOINED, game.roomId or DEFAULT_ROOM_ID, packPlayer(player))
+
+def leftRecord (game, player) -> bytes:
+	return packRecord(RECORD_LEFT, game.roomId or DEFAULT_ROOM_ID, packString(player.name))
+
+# event: ROUND_STARTED or ROUND_ENDED, newGame: the newRound started a new game, scored: slots whose score changed
+def roundRecord (game, event, newGame = False, scored = ()) -> bytes:
+	columns = game.players.columns
+	slots = game.players.slots
+
+	parts = [ROUND_EVENT.pack(event, int(newGame)), packRound(game), struct.pack('<H', len(scored))]
+	for slot in scored:
+		parts.append(packString(slots[slot].name))
+		parts.append(SCORE_STATE.pack(columns.points[slot], columns.penalty[slot], columns.gameovered[slot], columns.justJoined[slot]))
+
+	return packRecord(RECORD_ROUND, game.roomId or DEFAULT_ROOM_ID, b''.join(parts))
+
+def closedRecord (game) -> bytes:
+	return packRecord(RECORD_CLOSED, game.roomId or DEFAULT_ROOM_ID)
+
+# read the round of packRound into state, returns the offset after it
+def readRound (state, body, offset) -> int:
+	(flags, operator, state.num1, state.num2, endTime, state.countdown, state.winningPoints,
+		matchId, state.matchStarted, state.roundIndex, count) = ARENA_STATE.unpack_from(body, offset)
+	offset += ARENA_STATE.size
+
+	state.roundEnd = flags & FLAG_ROUND_END != 0
+	state.endGame = flags & FLAG_END_GAME != 0
+	state.notStarted = flags & FLAG_NOT_STARTED != 0
+	state.notEnoughPlayers = flags & FLAG_NOT_ENOUGH_PLAYERS != 0
+	state.operator = OPERATORS[operator] if operator < len(OPERATORS) else None
+	state.endTime = endTime if endTime >= 0 else None
+	state.matchId = matchId or None
+	state.accepted = list(struct.unpack_from(f'<{count}q', body, offset)) if state.operator != None else None
+	state.result = state.accepted if flags & FLAG_HAS_RESULT else None
+	offset += 8 * count
+
+	winner, offset = unpackString(body, offset)
+	state.winner = winner or None
+
+	return offset
+
+def readPlayer (body, offset) -> tuple:
+	player = PlayerState()
+	player.name, offset = unpackString(body, offset)
+	(token, player.points, player.penalty, player.gameovered, player.justJoined,
+		player.answerState, player.answered, player.position) = PLAYER_STATE.unpack_from(body, offset)
+
+	player.token = token.hex() if any(token) else None
+
+	return player, offset + PLAYER_STATE.size
+
+def readArena (roomId, body) -> ArenaState:
+	state = ArenaState(roomId)
+	offset = readRound(state, body, 0)
+
+	(players,) = struct.unpack_from('<H', body, offset)
+	offset += 2
+
+	for _ in range(players):
+		player, offset = readPlayer(body, offset)
+		state.players[player.name] = player
+
+		if player.position >= 0:
+			state.answers = max(state.answers, player.position + 1)
+
+	return state
+
+# apply a round record to state
+def readRoundChange (state, body):
+	event, newGame = ROUND_EVENT.unpack_from(body, 0)
+	offset = readRound(state, body, ROUND_EVENT.size)
+	state.roundChanged(event == ROUND_STARTED, event == ROUND_STARTED and newGame != 0)
+
+	(scored,) = struct.unpack_from('<H', body, offset)
+	offset += 2
+
+	for _ in range(scored):
+		name, offset = unpackString(body, offset)
+		points, penalty, gameovered, justJoined = SCORE_STATE.unpack_from(body, offset)
+		offset += SCORE_STATE.size
+
+		player = state.players.get(name)
+		if player != None:
+			player.points, player.penalty, player.gameovered, player.justJoined = points, penalty, gameovered, justJoined
+
+# The journal of one process (a standalone arena, a RoomManager or a cluster worker).
+# Records are handed over on the server loop and written by a background thread,
+# the log is flushed to the OS after every batch, snapshots are fsynced before they replace the last one.
+class Journal:
+	def __init__(self, name, directory = SNAPSHOT_DIR, interval = SNAPSHOT_INTERVAL) -> None:
+		self.name = name
+		self.directory = directory
+		self.interval = interval
+		self.generation = 0
+		self.pending = queue.SimpleQueue() # (kind, data)
+		self.log = None
+		self.logGeneration = 0 # generation of the log being written, only used by the writer
+		self.parts = [] # arena records of the snapshot being taken, only used by the writer
+		self.writer = None
+		self.scheduler = None
+		self.arenas = None # callable returning the arenas to snapshot
+		self.snapshotting = [] # arenas of the running snapshot left to record
+
+	def snapshotPath(self) -> str:
+		return os.path.join(self.directory, f'{self.name}.snapshot')
+
+	def logPath(self, generation) -> str:
+		return os.path.join(self.directory, f'{self.name}-{generation}.log')
+
+	# arena states of the last snapshot with the logs since replayed on top, by room id
+	def recover(self) -> dict:
+		states = {}
+
+		try:
+			with open(self.snapshotPath(), 'rb') as file:
+				data = file.read()
+
+			magic, generation = SNAPSHOT_HEADER.unpack_from(data, 0)
+			if magic == SNAPSHOT_MAGIC:
+				self.generation = generation
+				self.apply(states, data, SNAPSHOT_HEADER.size)
+		except (OSError, struct.error) as e:
+			if not isinstance(e, FileNotFoundError):
+				warning('[Journal] snapshot:', e)
+
+		# the log of the snapshot, then those of snapshots taken after it that never completed
+		generation = self.generation
+		while True:
+			try:
+				with open(self.logPath(generation), 'rb') as file:
+					self.apply(states, file.read())
+			except FileNotFoundError:
+				break
+			except OSError as e:
+				warning('[Journal] log:', e)
+				break
+
+			self.generation = generation
+			generation += 1
+
+		self.logGeneration = self.generation
+
+		return states
+
+	def apply(self, states, data, offset = 0):
+		for type, roomId, body in unpackRecords(data, offset):
+			try:
+				if type == RECORD_ARENA:
+					states[roomId] = readArena(roomId, body)
+				elif type == RECORD_ANSWER:
+					state = states.get(roomId)
+					if state != None:
+						name, offset = unpackString(body, 0)
+						answerState, answered = ANSWER_STATE.unpack_from(body, offset)
+						state.answer(name, answerState, answered)
+				elif type == RECORD_CLOSED:
+					states.pop(roomId, None)
+				elif type == RECORD_JOINED:
+					player, _ = readPlayer(body, 0)
+					self.arenaState(states, roomId).players[player.name] = player
+				elif type == RECORD_LEFT:
+					state = states.get(roomId)
+					if state != None:
+						state.players.pop(unpackString(body, 0)[0], None)
+				elif type == RECORD_ROUND:
+					readRoundChange(self.arenaState(states, roomId), body)
+			except (ValueError, IndexError, struct.error) as e:
+				warning(f'[Journal] record of {roomId}:', e)
+
+	# state of an arena created since the last snapshot starts with its first record
+	def arenaState(self, states, roomId) -> ArenaState:
+		state = states.get(roomId)
+
+		if state == None:
+			state = states[roomId] = ArenaState(roomId)
+
+		return state
+
+	# start writing: snapshot arenas() now and every interval seconds on the scheduler's loop
+	def start(self, scheduler, arenas):
+		self.scheduler = scheduler
+		self.arenas = arenas
+
+		self.writer = threading.Thread(target=self.run, name='journal', daemon=True)
+		self.writer.start()
+		atexit.register(self.flush)
+
+		self.snapshot()
+
+	# start a snapshot, called on the loop: it is taken in batches (see snapshotBatch)
+	def snapshot(self):
+		try:
+			self.snapshotting = list(self.arenas())
+			self.generation += 1
+			self.pending.put(('begin', self.generation))
+		except Exception as e:
+			error('[Journal] snapshot:', e)
+			self.scheduler.callLater(self.interval, self.snapshot)
+			return
+
+		self.snapshotBatch()
+
+	# record the next SNAPSHOT_BATCH arenas, called on the loop (between commands, so every arena is consistent)
+	def snapshotBatch(self):
+		batch = self.snapshotting[-SNAPSHOT_BATCH:]
+		del self.snapshotting[-SNAPSHOT_BATCH:]
+
+		for arena in batch:
+			# a closed arena already logged its end, recording it again would bring it back
+			if arena.closed:
+				continue
+
+			try:
+				self.pending.put(('arena', arenaRecord(arena)))
+			except Exception as e:
+				error('[Journal] snapshot:', e)
+
+		if len(self.snapshotting) > 0:
+			self.scheduler.callSoon(self.snapshotBatch)
+			return
+
+		self.pending.put(('end', self.generation))
+		self.scheduler.callLater(self.interval, self.snapshot)
+
+	# append a record to the log, called on the loop
+	def append(self, record):
+		self.pending.put(('log', record))
+
+	# wait until everything handed over so far is written
+	def flush(self):
+		if self.writer == None or not self.writer.is_alive():
+			return
+
+		done = threading.Event()
+		self.pending.put(('flush', done))
+		done.wait(5)
+
+	def run(self):
+		os.makedirs(self.directory, exist_ok=True)
+
+		while True:
+			items = [self.pending.get()]
+			try:
+				while len(items) < 4096:
+					items.append(self.pending.get_nowait())
+			except queue.Empty:
+				pass
+
+			flushed = []
+			for kind, data in items:
+				try:
+					match kind:
+						case 'log':
+							self.writeLog(data)
+						case 'begin':
+							self.beginGeneration(data)
+						case 'arena':
+							self.writeLog(data)
+							self.parts.append(data)
+						case 'end':
+							data, self.parts = b''.join(self.parts), []
+							self.writeSnapshot(self.logGeneration, data)
+						case 'flush':
+							flushed.append(data)
+				except OSError as e:
+					error('[Journal] write:', e)
+
+			try:
+				if self.log != None:
+					self.log.flush()
+			except OSError as e:
+				error('[Journal] flush:', e)
+
+			for done in flushed:
+				done.set()
+
+	def writeLog(self, data):
+		if self.log == None:
+			self.log = open(self.logPath(self.logGeneration), 'ab')
+
+		self.log.write(data)
+
+	# start the log of a new snapshot's generation, its arena records follow
+	def beginGeneration(self, generation):
+		if self.log != None:
+			self.log.close()
+			self.log = None
+
+		self.logGeneration = generation
+		self.parts = []
+		self.log = open(self.logPath(generation), 'ab')
+
+	# replace the snapshot once all its arena records are in the log of its generation
+	def writeSnapshot(self, generation, data):
+		path = self.snapshotPath()
+
+		# the snapshot is replayed with its log, which has to hold everything up to the snapshot's arena records
+		if self.log != None:
+			self.log.flush()
+			os.fsync(self.log.fileno())
+
+		with open(path + '.tmp', 'wb') as file:
+			file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation))
+			file.write(data)
+			file.flush()
+			os.fsync(file.fileno())
+
+		os.replace(path + '.tmp', path)
+
+		# logs of older generations are covered by the snapshot now
+		for older in range(max(0, generation - 4), generation):
+			try:
+				os.remove(self.logPath(older))
+			except FileNotFoundError:
+				pass
@@ -0,0 +1,81 @@
+from server.server_enums import *
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import queue
+import sys
+
+# Leveled logging of the server. Once startLogging was called records are only put on a queue by the caller,
+# a listener thread formats them and writes them to stdout, so the loop never blocks on the console.
+# Before that (and in scripts that never call it) the caller writes them itself.
+logger = logging.getLogger('racing-arena')
+logger.propagate = False
+
+listener = None
+
+def outputHandler () -> logging.Handler:
+	output = logging.StreamHandler(sys.stdout)
+	output.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+	return output
+
+def setHandler (handler):
+	for old in list(logger.handlers):
+		logger.removeHandler(old)
+	logger.addHandler(handler)
+
+# start the listener thread, entry points call it once they forked their worker processes
+def startLogging ():
+	global listener
+
+	if listener != None:
+		return
+
+	records = queue.SimpleQueue()
+	setHandler(QueueHandler(records))
+
+	listener = QueueListener(records, outputHandler())
+	listener.start()
+
+def stopLogging ():
+	global listener
+
+	if listener != None:
+		listener.stop()
+		listener = None
+		setHandler(outputHandler()) # later records are written by their caller again
+
+# the listener thread of the parent does not exist in a forked child, start a new one there
+def restartLogging ():
+	global listener
+
+	if listener != None:
+		listener = None
+		startLogging()
+
+def setLogLevel (level):
+	logger.setLevel(level)
+
+# True if debug messages are logged, check it before building an expensive message
+def debugEnabled () -> bool:
+	return logger.isEnabledFor(logging.DEBUG)
+
+def debug (*msg):
+	if logger.isEnabledFor(logging.DEBUG):
+		logger.debug(' '.join(str(part) for part in msg))
+
+def info (*msg):
+	if logger.isEnabledFor(logging.INFO):
+		logger.info(' '.join(str(part) for part in msg))
+
+def warning (*msg):
+	if logger.isEnabledFor(logging.WARNING):
+		logger.warning(' '.join(str(part) for part in msg))
+
+def error (*msg):
+	if logger.isEnabledFor(logging.ERROR):
+		logger.error(' '.join(str(part) for part in msg))
+
+setLogLevel(LOG_LEVEL)
+setHandler(outputHandler())
+atexit.register(stopLogging)
+os.register_at_fork(after_in_child=restartLogging)
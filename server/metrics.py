@@ -0,0 +1,154 @@
+from server.server_enums import *
+import bisect
+
+# Counters, gauges and histograms of this process in the Prometheus text format.
+# Updates are plain additions without locks (they happen on the server loop), a scrape
+# from another thread may see a value one update old. Call sites check METRICS_ENABLED
+# first, so disabled metrics cost a global lookup.
+
+REGISTRY = [] # top level metrics, in the order they are rendered
+COLLECTORS = [] # callables returning extra metric families (e.g. of cluster workers)
+
+# latency buckets (seconds)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+class Counter:
+	type = 'counter'
+
+	def __init__(self, name, help, labelNames = (), register = True) -> None:
+		self.name = name
+		self.help = help
+		self.labelNames = labelNames
+		self.children = {} # label values -> child metric
+		self.value = 0
+
+		if register:
+			REGISTRY.append(self)
+
+	def inc(self, amount = 1):
+		self.value += amount
+
+	# the metric of one combination of label values
+	def labels(self, *values):
+		child = self.children.get(values)
+
+		if child == None:
+			child = self.children[values] = self.child()
+
+		return child
+
+	def child(self):
+		return type(self)(self.name, self.help, register=False)
+
+	# [suffix, labels, value] of this metric without labels
+	def samples(self) -> list:
+		return [['', {}, self.value]]
+
+	# the metric family as JSON friendly [name, type, help, samples]
+	def family(self) -> list:
+		samples = []
+
+		if len(self.labelNames) < 1:
+			samples.extend(self.samples())
+
+		for values, child in list(self.children.items()):
+			labels = dict(zip(self.labelNames, values))
+			samples.extend([suffix, dict(labels, **childLabels), value] for suffix, childLabels, value in child.samples())
+
+		return [self.name, self.type, self.help, samples]
+
+class Gauge(Counter):
+	type = 'gauge'
+
+	def set(self, value):
+		self.value = value
+
+	def dec(self, amount = 1):
+		self.value -= amount
+
+class Histogram(Counter):
+	type = 'histogram'
+
+	def __init__(self, name, help, labelNames = (), buckets = LATENCY_BUCKETS, register = True) -> None:
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+		self.sum = 0.0
+		self.count = 0
+		super().__init__(name, help, labelNames, register)
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def child(self):
+		return Histogram(self.name, self.help, buckets=self.buckets, register=False)
+
+	def samples(self) -> list:
+		samples = []
+		cumulative = 0
+
+		for bound, count in zip(self.buckets, self.counts):
+			cumulative += count
+			samples.append(['_bucket', {"le": repr(float(bound))}, cumulative])
+
+		samples.append(['_bucket', {"le": "+Inf"}, self.count])
+		samples.append(['_sum', {}, self.sum])
+		samples.append(['_count', {}, self.count])
+
+		return samples
+
+def addCollector (collector):
+	COLLECTORS.append(collector)
+
+# every metric family of this process, JSON friendly so workers can ship them to the router
+def snapshot () -> list:
+	return [metric.family() for metric in REGISTRY]
+
+def formatLabels (labels) -> str:
+	if len(labels) < 1:
+		return ''
+
+	pairs = []
+	for name, value in labels.items():
+		value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+		pairs.append(f'{name}="{value}"')
+
+	return '{' + ','.join(pairs) + '}'
+
+# the Prometheus text exposition of this process and of every collector
+def renderMetrics () -> str:
+	families = {}
+
+	for name, kind, help, samples in snapshot() + [family for collector in COLLECTORS for family in collector()]:
+		if name in families:
+			families[name][2].extend(samples)
+		else:
+			families[name] = [kind, help, list(samples)]
+
+	lines = []
+	for name, (kind, help, samples) in families.items():
+		lines.append(f'# HELP {name} {help}')
+		lines.append(f'# TYPE {name} {kind}')
+
+		for suffix, labels, value in samples:
+			lines.append(f'{name}{suffix}{formatLabels(labels)} {value}')
+
+	return '\n'.join(lines) + '\n'
+
+# metrics of the server
+CONNECTIONS = Gauge('arena_connections', 'Open client connections.')
+SPECTATORS = Gauge('arena_spectators', 'Clients watching an arena without playing.')
+CONNECTIONS_ACCEPTED = Counter('arena_connections_accepted_total', 'Client connections accepted.')
+SLOW_CONSUMERS = Counter('arena_slow_consumers_evicted_total', 'Clients disconnected for not reading their messages.')
+FRAMES_IN = Counter('arena_frames_received_total', 'WebSocket frames received.')
+FRAMES_OUT = Counter('arena_frames_sent_total', 'Frames (or raw messages) queued for clients.')
+BYTES_IN = Counter('arena_bytes_received_total', 'Bytes read from client sockets.')
+BYTES_OUT = Counter('arena_bytes_sent_total', 'Bytes written to client sockets.')
+PARSE_ERRORS = Counter('arena_parse_errors_total', 'Frames or messages that could not be parsed.', ('stage',))
+FRAME_PARSE_ERRORS = PARSE_ERRORS.labels('frame')
+MESSAGE_PARSE_ERRORS = PARSE_ERRORS.labels('message')
+COMMAND_SECONDS = Histogram('arena_command_seconds', 'Time spent running arena commands (handleMessage is the message handler).', ('command',))
+BROADCAST_SECONDS = Histogram('arena_broadcast_seconds', 'Time spent encoding and queueing a broadcast to an arena.')
+BROADCAST_RECIPIENTS = Counter('arena_broadcast_recipients_total', 'Clients broadcasts were queued for.')
+TIMER_DRIFT_SECONDS = Histogram('arena_timer_drift_seconds', 'How late scheduled timers (round deadlines) ran.')
@@ -0,0 +1,194 @@
+from server.log import *
+import atexit
+import os
+import sys
+import threading
+import time
+
+# Opt-in profiling of a live server (GAME_PROFILE=1).
+# A daemon thread samples the stack of every other thread each PROFILE_INTERVAL seconds
+# and writes them as collapsed stacks ("thread;frame;frame count", the input of
+# flamegraph.pl or speedscope) every PROFILE_WINDOW seconds, along with the time spent
+# in each handler of the server loop (see timeHandler).
+# At the default 100 samples per second a sample costs tens of microseconds, the
+# profiler logs its own share of the window with every profile it writes.
+
+class HandlerTiming:
+	__slots__ = ('calls', 'total', 'max')
+
+	def __init__(self) -> None:
+		self.calls = 0
+		self.total = 0.0
+		self.max = 0.0
+
+class Profiler:
+	def __init__(self, interval = PROFILE_INTERVAL, window = PROFILE_WINDOW, directory = PROFILE_DIR) -> None:
+		self.interval = interval
+		self.window = window
+		self.directory = directory
+		self.stacks = {} # (thread id, code objects innermost first) -> samples
+		self.threadNames = {} # thread id -> name
+		self.windows = 0 # profiles written
+		self.handlers = {} # handler name -> HandlerTiming
+		self.samples = 0
+		self.sampling = 0.0 # seconds spent sampling in this window
+		self.windowStart = time.monotonic()
+		self.lock = threading.Lock() # guards the window's counters, write swaps them out from another thread
+		self.thread = None
+		self.running = False
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.running = False
+		self.write()
+
+	def run(self):
+		while self.running:
+			time.sleep(self.interval)
+
+			started = time.perf_counter()
+			self.sample()
+			with self.lock:
+				self.sampling += time.perf_counter() - started
+
+			if time.monotonic() - self.windowStart >= self.window:
+				self.write()
+
+	# add the current stack of every other thread, stacks are only turned into text when written
+	def sample(self):
+		me = threading.get_ident()
+		keys = []
+
+		for ident, frame in sys._current_frames().items():
+			if ident == me:
+				continue
+
+			if ident not in self.threadNames:
+				self.threadNames = {thread.ident: thread.name for thread in threading.enumerate()}
+
+			codes = []
+			while frame != None:
+				codes.append(frame.f_code)
+				frame = frame.f_back
+
+			keys.append((ident, tuple(codes)))
+
+		with self.lock:
+			stacks = self.stacks
+			for key in keys:
+				stacks[key] = stacks.get(key, 0) + 1
+
+			self.samples += 1
+
+	# "thread;outermost frame;...;innermost frame" of a sampled stack
+	def collapse(self, ident, codes, labels) -> str:
+		frames = [self.threadNames.get(ident, str(ident))]
+
+		for code in reversed(codes):
+			label = labels.get(code)
+
+			if label == None:
+				label = labels[code] = f'{os.path.basename(code.co_filename)}:{getattr(code, "co_qualname", code.co_name)}'
+
+			frames.append(label)
+
+		return ';'.join(frames)
+
+	# record seconds spent in a handler, called on the server loop
+	def record(self, name, seconds):
+		with self.lock:
+			timing = self.handlers.get(name)
+
+			if timing == None:
+				timing = self.handlers[name] = HandlerTiming()
+
+			timing.calls += 1
+			timing.total += seconds
+			if seconds > timing.max:
+				timing.max = seconds
+
+	# write the window's profile files and start a new window
+	def write(self):
+		with self.lock:
+			stacks, handlers, samples, sampling = self.stacks, self.handlers, self.samples, self.sampling
+			elapsed = time.monotonic() - self.windowStart
+
+			self.stacks, self.handlers = {}, {}
+			self.samples, self.sampling = 0, 0.0
+			self.windowStart = time.monotonic()
+
+		if samples < 1 and len(handlers) < 1:
+			return
+
+		self.windows += 1
+		name = f'{os.getpid()}-{time.strftime("%Y%m%d-%H%M%S")}-{self.windows}'
+
+		# stacks differing only in line numbers collapse into one
+		collapsed = {}
+		labels = {}
+		for (ident, codes), count in stacks.items():
+			stack = self.collapse(ident, codes, labels)
+			collapsed[stack] = collapsed.get(stack, 0) + count
+
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+
+			with open(os.path.join(self.directory, f'stacks-{name}.collapsed'), 'w') as file:
+				for stack, count in sorted(collapsed.items()):
+					file.write(f'{stack} {count}\n')
+
+			with open(os.path.join(self.directory, f'handlers-{name}.tsv'), 'w') as file:
+				file.write('handler\tcalls\ttotal_ms\tavg_us\tmax_us\n')
+
+				for handler, timing in sorted(handlers.items(), key=lambda item: item[1].total, reverse=True):
+					file.write(f'{handler}\t{timing.calls}\t{timing.total * 1000:.3f}\t{timing.total / timing.calls * 1e6:.1f}\t{timing.max * 1e6:.1f}\n')
+		except OSError as e:
+			return warning('[Profiler] write:', e)
+
+		info(f'[Profiler] Wrote {self.directory}/*-{name} ({samples} samples, sampling took {sampling / max(elapsed, 1e-9) * 100:.2f}% of the window).')
+
+profiler = None
+
+# start profiling if GAME_PROFILE is set, entry points call it once they forked their worker processes
+def startProfiler ():
+	global profiler
+
+	if not PROFILE_ENABLED or profiler != None:
+		return
+
+	profiler = Profiler()
+	profiler.start()
+
+def stopProfiler ():
+	if profiler != None:
+		profiler.stop()
+
+# run func(*args) on the server loop, timed under name when profiling
+def timeHandler (name, func, *args):
+	if profiler == None:
+		return func(*args)
+
+	started = time.perf_counter()
+	try:
+		return func(*args)
+	finally:
+		profiler.record(name, time.perf_counter() - started)
+
+# the name a handler is reported under
+def handlerName (func) -> str:
+	return getattr(func, '__qualname__', None) or getattr(func, '__name__', None) or repr(func)
+
+# the sampling thread of the parent does not exist in a forked child, start a new one there
+def restartProfiler ():
+	global profiler
+
+	if profiler != None:
+		profiler = None
+		startProfiler()
+
+atexit.register(stopProfiler)
+os.register_at_fork(after_in_child=restartProfiler)
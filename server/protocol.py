@@ -0,0 +1,122 @@
+import json
+import struct
+
+# Message encodings a client can pick with the Sec-WebSocket-Protocol header.
+# Every message is a (name, data) pair, encode returns str for text frames and bytes for binary frames.
+
+# Verbose JSON text, {"name": ..., "data": ...}. Used when the client asks for nothing else.
+class JSONProtocol:
+	name = 'racing-arena.json'
+
+	def encode(self, name, data) -> str | bytes:
+		return json.dumps({
+			"name": name,
+			"data": data
+		}, skipkeys=True)
+
+	def decode(self, msg) -> dict:
+		return json.loads(msg)
+
+OPERATORS = ["+", "-", "*", "/", "%"]
+
+# opcodes of the binary protocol
+OP_ROUND_STARTED = 0x01
+OP_ROUND_ENDED = 0x02
+OP_PLAYERS_INFO = 0x03
+OP_CORRECT_ANSWER = 0x04
+OP_ANSWER = 0x05
+OP_PLAYERS_DELTA = 0x06
+
+# flags of round_ended
+FLAG_NOT_STARTED = 0x01
+FLAG_GAME_END = 0x02
+
+# all numbers are big-endian, times and answers are float64 so browsers read them without BigInt
+ROUND_STARTED = struct.Struct('!BdiiBH') # op, time_end, num1, num2, operator, points_to_win
+ROUND_ENDED = struct.Struct('!BBd') # op, flags, time_end
+ROUND_ENDED_QUESTION = struct.Struct('!iiBHB') # num1, num2, operator, points_to_win, result count
+PLAYERS_INFO = struct.Struct('!BIH') # op, seq, player count (also players_delta with the updated count)
+PLAYER = struct.Struct('!iB') # points, gameovered (after the length-prefixed name)
+COUNT = struct.Struct('!H')
+ANSWER = struct.Struct('!Bd') # op, answer
+FLOAT = struct.Struct('!d')
+
+# Fixed-layout binary frames for the hot messages (see client/public/script.js for the decoder),
+# every other message falls back to a JSON text frame.
+class BinaryProtocol(JSONProtocol):
+	name = 'racing-arena.bin.v1'
+
+	def encode(self, name, data) -> str | bytes:
+		match name:
+			case "round_started":
+				return ROUND_STARTED.pack(OP_ROUND_STARTED, data["time_end"] or 0, data["num1"], data["num2"], OPERATORS.index(data["operator"]), data["points_to_win"])
+			case "round_ended":
+				flags = (FLAG_NOT_STARTED if data.get("not_started") else 0) | (FLAG_GAME_END if data.get("game_end") else 0)
+				header = ROUND_ENDED.pack(OP_ROUND_ENDED, flags, data.get("time_end") or 0)
+
+				if flags & FLAG_NOT_STARTED:
+					return header
+
+				result = data["result"] or []
+				return header + ROUND_ENDED_QUESTION.pack(data["num1"], data["num2"], OPERATORS.index(data["operator"]), data["points_to_win"], len(result)) + b''.join(FLOAT.pack(value) for value in result)
+			case "players_info":
+				return b''.join([PLAYERS_INFO.pack(OP_PLAYERS_INFO, data["seq"], len(data["players"]))] + self.encodePlayers(data["players"]))
+			case "players_delta":
+				parts = [PLAYERS_INFO.pack(OP_PLAYERS_DELTA, data["seq"], len(data["updated"]))] + self.encodePlayers(data["updated"])
+				parts.append(COUNT.pack(len(data["removed"])))
+
+				for name in data["removed"]:
+					playerName = name.encode('utf-8')
+					parts.append(bytes([len(playerName)]) + playerName)
+
+				return b''.join(parts)
+			case "correct_answer":
+				return bytes([OP_CORRECT_ANSWER])
+
+		return super().encode(name, data)
+
+	# length-prefixed name, points and gameovered of each player
+	def encodePlayers(self, players) -> list:
+		parts = []
+
+		for player in players:
+			playerName = player["name"].encode('utf-8')
+			parts.append(bytes([len(playerName)]) + playerName + PLAYER.pack(player["points"], player["gameovered"]))
+
+		return parts
+
+	def decode(self, msg) -> dict:
+		if type(msg) != bytes:
+			return super().decode(msg)
+
+		if msg[0] == OP_ANSWER:
+			answer = ANSWER.unpack_from(msg)[1]
+
+			# answers are integers, as the JSON text of an answer has to be (see Game.handleMessage)
+			if not answer.is_integer():
+				raise ValueError(f"answer {answer} is not an integer")
+
+			return {
+				"name": "answer",
+				"answer": int(answer)
+			}
+
+		raise ValueError(f"unknown opcode {msg[0]}")
+
+JSON_PROTOCOL = JSONProtocol()
+BINARY_PROTOCOL = BinaryProtocol()
+
+PROTOCOLS = {
+	JSON_PROTOCOL.name: JSON_PROTOCOL,
+	BINARY_PROTOCOL.name: BINARY_PROTOCOL
+}
+
+# pick the first protocol offered in a Sec-WebSocket-Protocol header that the server knows
+def negotiateProtocol (offered, binaryEnabled = True):
+	for name in offered.split(','):
+		protocol = PROTOCOLS.get(name.strip())
+
+		if protocol != None and (binaryEnabled or protocol != BINARY_PROTOCOL):
+			return protocol
+
+	return None
@@ -0,0 +1,122 @@
+from server.server_enums import *
+from array import array
+import random
+import threading
+
+OPERATORS = ["+", "-", "*", "/", "%"]
+
+# A difficulty profile: which operators are asked and the operand range [-limit, limit).
+class DifficultyProfile:
+	def __init__(self, name, operators, limit) -> None:
+		self.name = name
+		self.operators = [OPERATORS.index(operator) for operator in operators]
+		self.limit = limit
+
+QUESTION_PROFILES = {}
+
+def registerProfile (name, operators, limit) -> DifficultyProfile:
+	profile = QUESTION_PROFILES[name] = DifficultyProfile(name, operators, limit)
+	return profile
+
+registerProfile('easy', ["+", "-", "*"], 100)
+registerProfile('classic', OPERATORS, 10000)
+registerProfile('hard', OPERATORS, 1000000)
+
+# accepted answers of num1 <operator> num2, highest first
+# (a remainder is accepted with either sign, as languages disagree on it)
+def answersOf (num1, num2, operator) -> list:
+	match operator:
+		case "+":
+			return [num1 + num2]
+		case "-":
+			return [num1 - num2]
+		case "*":
+			return [num1 * num2]
+		case "/":
+			return [num1 // num2] # num1 is always a multiple of num2
+		case "%":
+			remainder = num1 % num2
+			return sorted([remainder, remainder - num2], reverse=True)
+
+# Pre-generated questions stored column-wise in compact arrays.
+# next() hands them out in order and refills a whole batch at once when they run out,
+# the same seed always produces the same questions.
+class QuestionPool:
+	def __init__(self, profile = QUESTION_PROFILE, seed = None, batchSize = QUESTION_BATCH_SIZE) -> None:
+		self.profile = QUESTION_PROFILES[profile] if type(profile) == str else profile
+		self.random = random.Random(seed)
+		self.batchSize = batchSize
+		self.lock = threading.Lock()
+
+		self.operators = array('b')
+		self.num1 = array('q')
+		self.num2 = array('q')
+		self.answer1 = array('q')
+		self.answer2 = array('q') # same as answer1 when only one answer is accepted
+		self.index = 0
+
+	def __len__(self) -> int:
+		return len(self.num1) - self.index
+
+	# generate the next batch of questions, replacing the used one
+	def fill(self):
+		randrange = self.random.randrange
+		choice = self.random.choice
+		operators, limit = self.profile.operators, self.profile.limit
+
+		ops, nums1, nums2, answers1, answers2 = array('b'), array('q'), array('q'), array('q'), array('q')
+
+		for _ in range(self.batchSize):
+			operator = choice(operators)
+
+			# select second int, skip zero for division and remainder
+			if operator >= 3:
+				num2 = randrange(1, 2 * limit + 1)
+				if num2 > limit:
+					num2 = limit - num2
+			else:
+				num2 = randrange(-limit, limit)
+
+			# select first int, a multiple of num2 when dividing so the result is an int
+			if operator == 3:
+				quotient = limit // abs(num2)
+				num1 = num2 * randrange(-quotient, quotient)
+			else:
+				num1 = randrange(-limit, limit)
+
+			answers = answersOf(num1, num2, OPERATORS[operator])
+
+			ops.append(operator)
+			nums1.append(num1)
+			nums2.append(num2)
+			answers1.append(answers[0])
+			answers2.append(answers[-1])
+
+		self.operators, self.num1, self.num2, self.answer1, self.answer2 = ops, nums1, nums2, answers1, answers2
+		self.index = 0
+
+	# returns (num1, num2, operator, accepted answers)
+	def next(self) -> tuple:
+		with self.lock:
+			if self.index >= len(self.num1):
+				self.fill()
+
+			i = self.index
+			self.index += 1
+
+			answers = [self.answer1[i]]
+			if self.answer2[i] != answers[0]:
+				answers.append(self.answer2[i])
+
+			return self.num1[i], self.num2[i], OPERATORS[self.operators[i]], answers
+
+sharedPool = None
+
+# the pool shared by every arena of this process
+def sharedQuestionPool () -> QuestionPool:
+	global sharedPool
+
+	if sharedPool == None:
+		sharedPool = QuestionPool(QUESTION_PROFILE, QUESTION_SEED)
+
+	return sharedPool
@@ -0,0 +1,235 @@
+from server.game import *
+from urllib.parse import urlsplit, parse_qs
+import gc
+
+ROOM_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_\-]{1,32}$')
+
+# get the room id requested in a WebSocket upgrade path ('/room/<id>' or '/?room=<id>')
+def roomIdFromPath (path) -> str | None:
+	url = urlsplit(path)
+
+	roomId = None
+	parts = [part for part in url.path.split('/') if part != '']
+
+	if len(parts) == 2 and parts[0] == 'room':
+		roomId = parts[1]
+	elif len(parts) == 0:
+		roomId = parse_qs(url.query).get('room', [DEFAULT_ROOM_ID])[0]
+
+	if roomId == None or ROOM_ID_PATTERN.match(roomId) == None:
+		return None
+
+	return roomId
+
+# Hosts many independent arenas (Game instances) behind one SocketServer.
+# Clients pick a room by the upgrade path or by sending a 'join' message,
+# rooms are created on first use and dropped once their last client leaves.
+class RoomManager:
+	def __init__(self, journalName = 'rooms') -> None:
+		server = self.server = SocketServer()
+		server.setMessageHandler(self.onMessage)
+		server.setClientCloseHandler(self.onClientClose)
+		server.setClientConnectHandler(self.onClientConnect)
+		self.rooms = {}
+		self.members = {} # room id -> clients routed to it (rooms apply joins and leaves later, as commands)
+		self.clientRooms = {} # client -> room it is in
+		self.onRoomClosed = None # called with the room id once a room is dropped
+		self.canHost = None # optional check whether a new room may be created in this process
+		self.sharedLobby = None # lobby shared by the cluster router, if any
+		self.journal = Journal(journalName) if SNAPSHOT_ENABLED else None
+
+	def start(self):
+		os.environ['WS_ENDPOINT'] = f"ws://{SERVER_HOST}:{SERVER_PORT}/"
+		self.restoreRooms()
+		self.server.start()
+
+	# recreate the rooms of the journal and start journaling, returns the restored room ids
+	def restoreRooms(self) -> list:
+		if self.journal == None:
+			return []
+
+		started = time.perf_counter()
+
+		# everything built here lives on, collecting in between only slows the restart down
+		gc.disable()
+		try:
+			states = self.journal.recover()
+
+			for roomId, state in states.items():
+				room = self.rooms[roomId] = self.createRoom(roomId)
+				room.restore(state)
+
+				# restored rooms stay until their players had the chance to come back
+				self.server.scheduler.callLater(RESUME_TIMEOUT + 1, self.closeIfIdle, room)
+		finally:
+			gc.enable()
+		self.journal.start(self.server.scheduler, lambda: list(self.rooms.values()))
+
+		if len(states) > 0:
+			info(f'[Journal] Restored {len(states)} rooms in {(time.perf_counter() - started) * 1000:.0f} ms.')
+
+		return list(states)
+
+	def createRoom(self, roomId) -> Game:
+		room = Game(self.server, roomId)
+		room.journal = self.journal
+		return room
+
+	def find(self, roomId) -> Game | None:
+		return self.rooms.get(roomId)
+
+	def get(self, roomId) -> Game | None:
+		room = self.rooms.get(roomId)
+
+		if room == None:
+			if len(self.rooms) >= MAX_ROOMS or (self.canHost != None and not self.canHost(roomId)):
+				return None
+
+			room = self.rooms[roomId] = self.createRoom(roomId)
+
+		return room
+
+	def roomOf(self, cli: SocketClient) -> Game | None:
+		return self.clientRooms.get(cli)
+
+	# move a client into a room, leaving the one it is in.
+	# initial: the client just connected, its upgrade path may ask to resume or spectate
+	def join(self, cli: SocketClient, roomId, initial = False) -> bool:
+		room = self.get(roomId)
+
+		if room == None:
+			return False
+
+		self.leave(cli)
+
+		self.clientRooms[cli] = room
+		self.members[roomId] = self.members.get(roomId, 0) + 1
+		room.onClientConnect(cli, initial)
+
+		return True
+
+	# closed: the connection is gone (its player may resume), otherwise the client moves to another room
+	def leave(self, cli: SocketClient, closed = False):
+		room = self.clientRooms.pop(cli, None)
+
+		if room == None:
+			return
+
+		if closed:
+			room.onClientClose(cli)
+		else:
+			room.onClientLeave(cli)
+
+		self.members[room.roomId] -= 1
+
+		if self.members[room.roomId] < 1:
+			room.post(self.closeIfIdle, room) # after the room detached or removed the player
+
+	# close a room without clients, once no detached player can come back to it
+	def closeIfIdle(self, room: Game):
+		if self.rooms.get(room.roomId) is not room or self.members.get(room.roomId, 0) > 0:
+			return
+
+		if len(room.players.detached) > 0:
+			self.server.scheduler.callLater(RECONNECT_GRACE + 1, self.closeIfIdle, room)
+			return
+
+		self.closeRoom(room)
+
+	def closeRoom(self, room: Game):
+		self.members.pop(room.roomId, None)
+		self.rooms.pop(room.roomId, None)
+		room.post(room.close)
+
+		if self.onRoomClosed != None:
+			self.onRoomClosed(room.roomId)
+
+	# busiest rooms of this process
+	def roomsInfo(self, limit = LOBBY_ROOMS_SIZE) -> list:
+		rooms = [{
+			"id": roomId,
+			"players": len(room.players)
+		} for roomId, room in self.rooms.items()]
+
+		rooms.sort(key=lambda room: room["players"], reverse=True)
+
+		return rooms[:limit]
+
+	# registered players of this process, highest points first
+	def leaderboard(self, limit = LOBBY_LEADERBOARD_SIZE) -> list:
+		players = [{
+			"name": player.name,
+			"room": roomId,
+			"points": player.points
+		} for roomId, room in self.rooms.items() for player in room.players.registered]
+
+		players.sort(key=lambda player: player["points"], reverse=True)
+
+		return players[:limit]
+
+	def lobby(self) -> dict:
+		if self.sharedLobby != None:
+			return self.sharedLobby
+
+		return {
+			"rooms": self.roomsInfo(),
+			"leaderboard": self.leaderboard()
+		}
+
+	def sendError(self, cli, errorMsg):
+		try:
+			cli.sendMessage("error", errorMsg)
+		except Exception as e:
+			error("send:", e)
+
+	def onClientConnect(self, cli: SocketClient):
+		roomId = roomIdFromPath(cli.path)
+
+		if roomId == None:
+			return self.sendError(cli, "Invalid room.")
+
+		if not self.join(cli, roomId, True):
+			return self.sendError(cli, "The server is full, please try again later.")
+
+	def onMessage(self, cli, msg):
+		try:
+			data = cli.decodeMessage(msg)
+		except Exception as e:
+			if METRICS_ENABLED:
+				MESSAGE_PARSE_ERRORS.inc()
+			debug("decode:", e)
+			return
+
+		try:
+			if data['name'] == 'join':
+				roomId = str(data.get('room'))
+				if ROOM_ID_PATTERN.match(roomId) == None:
+					return self.sendError(cli, "Invalid room.")
+
+				room = self.roomOf(cli)
+				if room != None and room.roomId == roomId:
+					return self.sendError(cli, "You are already in this room.")
+
+				if not self.join(cli, roomId):
+					if self.canHost != None and not self.canHost(roomId):
+						return self.sendError(cli, f"This room is hosted by another worker, please reconnect to /room/{roomId}.")
+
+					return self.sendError(cli, "The server is full, please try again later.")
+
+				return
+
+			if data['name'] == 'lobby':
+				return cli.sendMessage("lobby", self.lobby())
+
+			room = self.roomOf(cli)
+
+			if room == None:
+				return self.sendError(cli, "Join a room first.")
+
+			room.post(room.handleMessage, cli, data, cli.receivedAt)
+		except Exception as e:
+			error("handle:", e)
+			return
+
+	def onClientClose(self, cli):
+		self.leave(cli, True)
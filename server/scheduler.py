@@ -0,0 +1,144 @@
+from server.log import *
+from server.metrics import *
+from server.profiler import *
+import heapq
+import threading
+import time
+
+# A scheduled callback, returned by Scheduler.callLater.
+class TimerHandle:
+	def __init__(self, scheduler, when, callback, args) -> None:
+		self.scheduler = scheduler
+		self.when = when
+		self.callback = callback
+		self.args = args
+		self.seq = None # sequence number of its live heap entry, None once fired or cancelled
+		self.cancelled = False
+
+	def cancel(self):
+		self.scheduler.cancel(self)
+
+	# move the deadline to delay seconds from now, also revives a cancelled handle
+	def reschedule(self, delay):
+		self.scheduler.reschedule(self, delay)
+
+	# seconds until the callback runs
+	def remaining(self) -> float:
+		return max(0, self.when - time.monotonic())
+
+# Heap based timer scheduler driven by the server loop.
+# Callbacks run on the loop thread, timers can be scheduled from any thread.
+class Scheduler:
+	def __init__(self) -> None:
+		self.heap = [] # (when, seq, handle)
+		self.lock = threading.Lock()
+		self.seq = 0
+		self.garbage = 0 # heap entries of cancelled or rescheduled handles
+		self.onWakeup = None # called when a new earliest deadline is set from another thread
+
+		# drift metrics (seconds a callback ran after its deadline)
+		self.fired = 0
+		self.driftTotal = 0.0
+		self.driftMax = 0.0
+		self.driftLast = 0.0
+
+	def callLater(self, delay, callback, *args) -> TimerHandle:
+		handle = TimerHandle(self, 0, callback, args)
+		self.reschedule(handle, delay)
+		return handle
+
+	def callSoon(self, callback, *args) -> TimerHandle:
+		return self.callLater(0, callback, *args)
+
+	def reschedule(self, handle: TimerHandle, delay):
+		with self.lock:
+			if handle.seq != None:
+				self.garbage += 1 # the old entry stays in the heap
+
+			handle.cancelled = False
+			self.seq += 1
+			handle.seq = self.seq
+			handle.when = time.monotonic() + max(0, delay)
+			heapq.heappush(self.heap, (handle.when, handle.seq, handle))
+			earliest = self.heap[0][2] is handle
+
+		if earliest and self.onWakeup != None:
+			self.onWakeup()
+
+	def cancel(self, handle: TimerHandle):
+		with self.lock:
+			handle.cancelled = True
+
+			if handle.seq == None: # already fired or cancelled
+				return
+
+			handle.seq = None
+			self.garbage += 1
+
+			# drop garbage entries once they make up most of the heap
+			if self.garbage > 64 and self.garbage * 2 > len(self.heap):
+				self.heap = [entry for entry in self.heap if self.isLive(entry)]
+				heapq.heapify(self.heap)
+				self.garbage = 0
+
+	def isLive(self, entry) -> bool:
+		return entry[2].seq == entry[1]
+
+	def __len__(self) -> int:
+		return len(self.heap) - self.garbage
+
+	# seconds until the next deadline, None if nothing is scheduled
+	def nextTimeout(self) -> float | None:
+		with self.lock:
+			while len(self.heap) > 0 and not self.isLive(self.heap[0]):
+				heapq.heappop(self.heap)
+				self.garbage -= 1
+
+			if len(self.heap) < 1:
+				return None
+
+			return max(0, self.heap[0][0] - time.monotonic())
+
+	# run every callback whose deadline has passed
+	def runDue(self):
+		now = time.monotonic()
+
+		while True:
+			with self.lock:
+				if len(self.heap) < 1 or self.heap[0][0] > now:
+					return
+
+				entry = heapq.heappop(self.heap)
+
+				if not self.isLive(entry):
+					self.garbage -= 1
+					continue
+
+				handle = entry[2]
+				handle.seq = None
+
+			drift = time.monotonic() - handle.when
+			self.fired += 1
+			self.driftTotal += drift
+			self.driftLast = drift
+			self.driftMax = max(self.driftMax, drift)
+
+			if METRICS_ENABLED:
+				TIMER_DRIFT_SECONDS.observe(drift)
+
+			try:
+				if PROFILE_ENABLED:
+					timeHandler(handlerName(handle.callback), handle.callback, *handle.args)
+				else:
+					handle.callback(*handle.args)
+			except Exception as e:
+				error("scheduler:", e)
+
+	def stats(self) -> dict:
+		return {
+			"scheduled": len(self),
+			"fired": self.fired,
+			"drift_last": self.driftLast,
+			"drift_max": self.driftMax,
+			"drift_avg": self.driftTotal / self.fired if self.fired > 0 else 0.0
+		}
@@ -0,0 +1,71 @@
+from server.server_enums import *
+from collections import deque
+import random
+
+# Versioned scoreboard of an arena's registered players.
+# Clients get a full snapshot ("players_info") once, then only the players that changed
+# since the last published version ("players_delta"). Every delta bumps seq, so a client
+# that sees a gap asks for a new snapshot ("players_resync").
+# The last deltas are kept, so a resuming client only gets what it missed.
+class Scoreboard:
+	def __init__(self, players) -> None:
+		self.players = players
+		self.seq = random.randrange(1 << 30) # a seq from another scoreboard (before a restart) is unlikely to be ours
+		self.published = {} # name -> (points, gameovered) as of seq
+		self.history = deque(maxlen=SCOREBOARD_HISTORY) # last deltas, oldest first
+
+	def entry(self, player) -> dict:
+		return {
+			"name": player.name,
+			"points": player.points,
+			"gameovered": player.gameovered
+		}
+
+	def snapshot(self) -> dict:
+		return {
+			"seq": self.seq,
+			"players": [self.entry(player) for player in self.players.registered]
+		}
+
+	# take the players as they are now as published, without a delta (e.g. once restored after a restart:
+	# every client starts from a snapshot, the next delta only has to hold what changed after it)
+	def seed(self):
+		self.published = {player.name: (player.points, player.gameovered) for player in self.players.registered}
+
+	# players changed or gone since the last delta, None if nothing changed
+	def delta(self) -> dict | None:
+		updated = []
+		current = {}
+
+		for player in self.players.registered:
+			state = current[player.name] = (player.points, player.gameovered)
+
+			if self.published.get(player.name) != state:
+				updated.append(self.entry(player))
+
+		removed = [name for name in self.published if name not in current]
+
+		if len(updated) < 1 and len(removed) < 1:
+			return None
+
+		self.published = current
+		self.seq += 1
+
+		delta = {
+			"seq": self.seq,
+			"updated": updated,
+			"removed": removed
+		}
+		self.history.append(delta)
+
+		return delta
+
+	# deltas published after seq, None if they are not all kept (send a snapshot then)
+	def since(self, seq) -> list | None:
+		if seq == self.seq:
+			return []
+
+		if len(self.history) < 1 or not self.history[0]["seq"] - 1 <= seq < self.seq:
+			return None
+
+		return [delta for delta in self.history if delta["seq"] > seq]
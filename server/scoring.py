@@ -0,0 +1,278 @@
+from server.server_enums import *
+from array import array
+from itertools import compress
+import time
+
+# numpy is optional, only used to score rounds with many players
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# rounds with at least this many player slots are scored with numpy (if installed)
+NUMPY_SCORING_THRESHOLD = 2048
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+# answer states of a slot
+NO_ANSWER = 0
+ANSWERED = 1
+ANSWERED_OUT_OF_RANGE = 2 # does not fit in int64, so it can not be an accepted answer
+
+# Scoring state of every player of an arena, stored column-wise and indexed by player slot.
+# Slots of players that left are only reused after the next round started,
+# so a round is always scored with the players that answered it.
+class PlayerColumns:
+	def __init__(self) -> None:
+		self.points = array('q')
+		self.penalty = array('b') # wrong answers in a row
+		self.gameovered = array('b')
+		self.justJoined = array('b') # joined mid-match: no point decrease, but the first correct answer earns less
+		self.registered = array('b')
+		self.present = array('b') # cleared when the player leaves
+		self.answerState = array('b')
+		self.answered = array('q')
+		self.answeredAt = array('d') # time.monotonic() the answer was sent (see Game.answerTime)
+		self.order = array('q') # slots in the order answers arrived this round, by answer time once ranked
+		self.outOfRange = {} # slot -> answer too large for the answered column
+		self.free = [] # slots that can be handed out again
+		self.released = [] # slots freed during the running round
+
+	def __len__(self) -> int:
+		return len(self.points)
+
+	def allocate(self) -> int:
+		if len(self.free) > 0:
+			slot = self.free.pop()
+		else:
+			slot = len(self.points)
+			for column in [self.points, self.penalty, self.gameovered, self.justJoined, self.registered, self.present, self.answerState, self.answered, self.answeredAt]:
+				column.append(0)
+
+		self.points[slot] = 0
+		self.penalty[slot] = 0
+		self.gameovered[slot] = 0
+		self.justJoined[slot] = 1
+		self.registered[slot] = 0
+		self.present[slot] = 1
+		self.answerState[slot] = NO_ANSWER
+		self.answered[slot] = 0
+
+		return slot
+
+	def release(self, slot):
+		self.present[slot] = 0
+		self.released.append(slot)
+
+	# at: when the answer was sent, now if not known
+	def answer(self, slot, value, at = None):
+		if INT64_MIN <= value <= INT64_MAX:
+			self.answerState[slot] = ANSWERED
+			self.answered[slot] = value
+		else:
+			self.answerState[slot] = ANSWERED_OUT_OF_RANGE
+			self.outOfRange[slot] = value
+
+		self.answeredAt[slot] = at if at != None else time.monotonic()
+		self.order.append(slot)
+
+	# order this round's answers by the time they were sent, ties keep their arrival order
+	def rankAnswers(self):
+		answeredAt = self.answeredAt
+		self.order = array('q', sorted(self.order, key=answeredAt.__getitem__))
+
+	def answerOf(self, slot):
+		state = self.answerState[slot]
+
+		if state == ANSWERED:
+			return self.answered[slot]
+		elif state == ANSWERED_OUT_OF_RANGE:
+			return self.outOfRange[slot]
+
+		return None
+
+	# reset answers before a new round, everything else too if a new game starts
+	def newRound(self, newGame = False):
+		n = len(self)
+
+		self.answerState = array('b', bytes(n))
+		self.order = array('q')
+		self.outOfRange = {}
+
+		# registered players are no longer new, those still unregistered keep their immunity
+		self.justJoined = array('b', [joined and not registered for joined, registered in zip(self.justJoined, self.registered)])
+
+		if newGame:
+			self.points = array('q', bytes(8 * n))
+			self.penalty = array('b', bytes(n))
+			self.gameovered = array('b', bytes(n))
+
+		self.free.extend(self.released)
+		self.released = []
+
+	# True if any player could still answer
+	def anyActive(self) -> bool:
+		for slot in range(len(self)):
+			if self.registered[slot] and self.present[slot] and not self.gameovered[slot]:
+				return True
+
+		return False
+
+# Outcome of a scored round, the slots whose players have to be told about it.
+class RoundScore:
+	def __init__(self, correct, wrong, disqualified, winner) -> None:
+		self.correct = correct # correct answers in answer order, the first one got the bonus
+		self.wrong = wrong # players without a correct answer
+		self.disqualified = disqualified # players that just reached MAX_PENALTY
+		self.winner = winner # slot of the winner or None
+
+# Score a round in one batch, updating the columns:
+# - correct answers reset the penalty and earn a point, the first correct answer earns
+#   the points everybody else lost instead (at least 2, halved if that player just joined)
+# - players without a correct answer (except those that just joined) get a penalty and lose a point,
+#   reaching MAX_PENALTY disqualifies them and all their points go to the first correct answer
+# - the correct answerer with the most points (the earliest on a tie) wins once reaching winningPoints
+def scoreRound(columns: PlayerColumns, accepted, winningPoints) -> RoundScore:
+	if numpy != None and len(columns) >= NUMPY_SCORING_THRESHOLD:
+		return scoreRoundNumpy(columns, accepted, winningPoints)
+
+	return scoreRoundPython(columns, accepted, winningPoints)
+
+# 0/1 byte columns as ints (byte i is slot i), so whole columns combine with & | + in one go
+def flags(column) -> int:
+	return int.from_bytes(column, 'little')
+
+def flagColumn(bits, n) -> bytes:
+	return bits.to_bytes(n, 'little')
+
+# MAX_PENALTY -> table mapping a penalty byte to 1 if it disqualifies
+disqualifyingTables = {}
+
+# MAX_PENALTY is looked up on every round (like scoreRoundNumpy does), it may have been changed since the import
+def disqualifying(maxPenalty) -> bytes:
+	table = disqualifyingTables.get(maxPenalty)
+
+	if table == None:
+		table = disqualifyingTables[maxPenalty] = bytes(int(value >= maxPenalty) for value in range(256))
+
+	return table
+
+# The flag columns are combined as ints, the rest is looped over as lists (which index faster than arrays),
+# visiting only the slots that answered or lose points.
+def scoreRoundPython(columns: PlayerColumns, accepted, winningPoints) -> RoundScore:
+	n = len(columns)
+	answerState, answered, accepted = columns.answerState, columns.answered.tolist(), set(accepted)
+
+	# out of range answers are never accepted
+	correct = [slot for slot in columns.order.tolist() if answered[slot] in accepted and answerState[slot] == ANSWERED]
+
+	isCorrect = bytearray(n)
+	for slot in correct:
+		isCorrect[slot] = 1
+
+	# the wrong answers are dropped
+	columns.answerState = array('b', isCorrect)
+	if len(columns.outOfRange) > 0:
+		columns.outOfRange = {}
+
+	right, gameovered = flags(isCorrect), flags(columns.gameovered)
+	wrong = flags(columns.registered) & flags(columns.present) & ~gameovered & ~right
+	penalized = wrong & ~flags(columns.justJoined)
+
+	# correct answers reset the penalty, penalties stay below MAX_PENALTY + 1 so adding never carries into the next slot
+	penalty = flagColumn((flags(columns.penalty) & ~(right * 0xff)) + penalized, n)
+	disqualified = penalized & flags(penalty.translate(disqualifying(MAX_PENALTY)))
+	columns.penalty = array('b', penalty)
+	columns.gameovered = array('b', flagColumn(gameovered | disqualified, n))
+
+	slots = range(n)
+	points = columns.points.tolist()
+	for slot in correct[1:]:
+		points[slot] += 1
+
+	pointsLost = 0
+	for slot in compress(slots, flagColumn(penalized & ~disqualified, n)):
+		if points[slot] > 0:
+			pointsLost += 1
+			points[slot] -= 1
+
+	disqualified = list(compress(slots, flagColumn(disqualified, n))) if disqualified != 0 else []
+	for slot in disqualified:
+		pointsLost += points[slot]
+
+	winner = None
+
+	if len(correct) > 0:
+		first = correct[0]
+		pointsLost = max(2, pointsLost)
+		if columns.justJoined[first]:
+			pointsLost //= 2
+		points[first] += pointsLost
+
+		for slot in correct:
+			if points[slot] >= winningPoints and (winner == None or points[winner] < points[slot]):
+				winner = slot
+
+	columns.points = array('q', points)
+
+	return RoundScore(correct, list(compress(slots, flagColumn(wrong, n))), disqualified, winner)
+
+def scoreRoundNumpy(columns: PlayerColumns, accepted, winningPoints) -> RoundScore:
+	n = len(columns)
+
+	# views share memory with the columns, so updates are written straight back
+	points = numpy.frombuffer(columns.points, dtype=numpy.int64)
+	penalty = numpy.frombuffer(columns.penalty, dtype=numpy.int8)
+	gameovered = numpy.frombuffer(columns.gameovered, dtype=numpy.int8)
+	justJoined = numpy.frombuffer(columns.justJoined, dtype=numpy.int8).astype(bool)
+	eligible = (numpy.frombuffer(columns.registered, dtype=numpy.int8) != 0) & (numpy.frombuffer(columns.present, dtype=numpy.int8) != 0) & (gameovered == 0)
+
+	order = numpy.frombuffer(columns.order, dtype=numpy.int64) if len(columns.order) > 0 else numpy.zeros(0, dtype=numpy.int64)
+	answerState = numpy.frombuffer(columns.answerState, dtype=numpy.int8)
+	answers = numpy.frombuffer(columns.answered, dtype=numpy.int64)[order]
+
+	isAnswerCorrect = (answerState[order] == ANSWERED) & numpy.isin(answers, numpy.array(accepted, dtype=numpy.int64))
+	correct = order[isAnswerCorrect]
+
+	answerState[order[~isAnswerCorrect]] = NO_ANSWER
+	if len(columns.outOfRange) > 0:
+		columns.outOfRange = {}
+
+	penalty[correct] = 0
+	points[correct[1:]] += 1
+
+	isCorrect = numpy.zeros(n, dtype=bool)
+	isCorrect[correct] = True
+
+	wrong = eligible & ~isCorrect
+	penalized = wrong & ~justJoined
+	penalty[penalized] += 1
+
+	disqualified = penalized & (penalty >= MAX_PENALTY)
+	decreased = penalized & ~disqualified & (points > 0)
+
+	pointsLost = int(points[disqualified].sum()) + int(numpy.count_nonzero(decreased))
+	gameovered[disqualified] = 1
+	points[decreased] -= 1
+
+	winner = None
+
+	if len(correct) > 0:
+		first = int(correct[0])
+		pointsLost = max(2, pointsLost)
+		if justJoined[first]:
+			pointsLost //= 2
+		points[first] += pointsLost
+
+		# argmax picks the earliest answer among equal points
+		best = int(numpy.argmax(points[correct]))
+		if points[correct[best]] >= winningPoints:
+			winner = int(correct[best])
+
+	result = RoundScore(correct.tolist(), numpy.flatnonzero(wrong).tolist(), numpy.flatnonzero(disqualified).tolist(), winner)
+
+	# drop the views so the columns can grow again
+	del points, penalty, gameovered, order, answerState, answers
+
+	return result
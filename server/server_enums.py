@@ -4,8 +4,44 @@ import os
 
 SERVER_HOST = '0.0.0.0'
 SERVER_PORT = int(os.environ.get('GAME_SERVER_PORT') or 4000)
-SERVER_MAX_PLAYERS = 10 # max players
-SERVER_DEBUG_MESSAGE = True # log every client message into console
+SERVER_LISTEN_BACKLOG = 1024 # pending connections queued by the kernel
+SERVER_ACCEPT_BATCH = 256 # max connections accepted per loop wakeup
+SERVER_RECV_SIZE = 65536 # max bytes read from a socket per loop wakeup
+SERVER_MAX_MESSAGE_SIZE = 65536 # connections sending larger messages are closed
+SERVER_UPGRADE_TIMEOUT = 10 # seconds a new connection may take to send its upgrade request (cluster router)
+WS_BINARY_PROTOCOL = True # let clients pick the compact binary protocol
+WS_DEFLATE = True # negotiate permessage-deflate compression with clients that offer it
+WS_DEFLATE_THRESHOLD = 256 # messages shorter than this (bytes) are sent uncompressed
+WS_DEFLATE_LEVEL = 6 # zlib compression level
+WS_DEFLATE_SERVER_CONTEXT_TAKEOVER = False # keep the compression window between messages (better ratio, ~300 KB per connection, broadcasts are compressed per client)
+WS_DEFLATE_CLIENT_CONTEXT_TAKEOVER = False # let clients keep theirs (~40 KB per connection on the server)
+SERVER_OUTBOUND_HIGH_WATER = 256 * 1024 # bytes queued for a client before it counts as a slow consumer
+SERVER_OUTBOUND_HARD_LIMIT = 4 * 1024 * 1024 # bytes queued for a client before it is disconnected right away
+SERVER_SLOW_CONSUMER_TIMEOUT = 10 # seconds a client may stay over the high-water mark before it is disconnected
+SERVER_PING_INTERVAL = 5 if (os.environ.get('GAME_LATENCY_COMPENSATION') or '0') != '0' else 0 # seconds between pings measuring each client's round-trip time, 0 never pings
+SERVER_WORKERS = int(os.environ.get('GAME_SERVER_WORKERS') or 1) # worker processes, more than 1 starts the cluster router
+SERVER_DEBUG_MESSAGE = True # log every client message into console (the default log level becomes DEBUG)
+
+# LOGGING, METRICS & PROFILING PROPERTIES
+
+LOG_LEVEL = os.environ.get('GAME_LOG_LEVEL') or ('DEBUG' if SERVER_DEBUG_MESSAGE else 'INFO') # DEBUG, INFO, WARNING or ERROR
+METRICS_ENABLED = (os.environ.get('GAME_METRICS') or '1') != '0' # collect metrics, served at /metrics of the web client
+PROFILE_ENABLED = (os.environ.get('GAME_PROFILE') or '0') != '0' # sample thread stacks and time the server handlers
+PROFILE_INTERVAL = float(os.environ.get('GAME_PROFILE_INTERVAL') or 0.01) # seconds between stack samples
+PROFILE_WINDOW = float(os.environ.get('GAME_PROFILE_WINDOW') or 60) # seconds of samples per written profile
+PROFILE_DIR = os.environ.get('GAME_PROFILE_DIR') or 'profiles' # where profiles are written
+
+# ROOM PROPERTIES
+
+DEFAULT_ROOM_ID = 'main' # room of clients connecting to '/'
+MAX_ROOMS = 10000 # max concurrent rooms per server process
+LOBBY_LEADERBOARD_SIZE = 10 # players listed in the lobby leaderboard
+LOBBY_ROOMS_SIZE = 50 # busiest rooms listed in the lobby
+
+# CLUSTER PROPERTIES
+
+CLUSTER_STATS_INTERVAL = 1 # seconds between worker reports to the router
+CLUSTER_CHANNEL_BUFFER = 256 * 1024 # max size of a router <-> worker message
 
 # GAME PROPERTIES
 
@@ -13,6 +49,33 @@ MAX_COUNTDOWN_TIME = 45 # seconds
 MIN_COUNTDOWN_TIME = 10 # seconds
 ROUND_END_WAITING_TIME = 5 # seconds
 GAME_END_WAITING_TIME = 10 # seconds
+MAX_PENALTY = 3 # wrong answers in a row before a player is disqualified
+RECONNECT_GRACE = float(os.environ.get('GAME_RECONNECT_GRACE') or 30) # seconds a disconnected player is kept for its client to resume, 0 drops it at once
+SCOREBOARD_HISTORY = 64 # scoreboard deltas kept to bring resuming clients up to date
+LATENCY_COMPENSATION = (os.environ.get('GAME_LATENCY_COMPENSATION') or '0') != '0' # rank answers by when they were sent: received minus half the client's round-trip time
+SPECTATOR_UPDATE_RATE = float(os.environ.get('GAME_SPECTATOR_RATE') or 2) # scoreboard updates per second sent to spectators at most
+MAX_LATENCY_COMPENSATION = 0.15 # seconds an answer can be moved forward at most (a client delaying its pongs gains no more)
+
+# QUESTION PROPERTIES
+
+QUESTION_PROFILE = os.environ.get('GAME_QUESTION_PROFILE') or 'classic' # 'easy', 'classic' or 'hard'
+QUESTION_SEED = int(os.environ['GAME_QUESTION_SEED']) if os.environ.get('GAME_QUESTION_SEED') else None # fixed seed for reproducible questions
+QUESTION_BATCH_SIZE = 1024 # questions generated ahead of time
+
+# STORE PROPERTIES
+
+STORE_BACKEND = os.environ.get('GAME_STORE') or 'sqlite' # where matches are recorded: 'sqlite' or 'none'
+STORE_PATH = os.environ.get('GAME_STORE_PATH') or 'racing-arena.db' # database file of the sqlite store
+STORE_BATCH_SIZE = 2000 # max records written per transaction
+STORE_FLUSH_INTERVAL = 0.5 # seconds records may wait to be batched with later ones
+
+# SNAPSHOT PROPERTIES
+
+SNAPSHOT_ENABLED = (os.environ.get('GAME_SNAPSHOTS') or '0') != '0' # journal arena state to survive restarts
+SNAPSHOT_DIR = os.environ.get('GAME_SNAPSHOT_DIR') or 'snapshots' # where snapshots and event logs are written
+SNAPSHOT_INTERVAL = 30 # seconds between full snapshots, the event log only covers the time since the last one
+SNAPSHOT_BATCH = 100 # arenas recorded per loop iteration while a snapshot is taken
+RESUME_TIMEOUT = 60 # seconds players restored after a restart can reclaim their slot with their resume token
 
 # export
 os.environ['GAME_SERVER_PORT'] = str(SERVER_PORT)
@@ -1,105 +1,49 @@
 from server.server_enums import *
+from server.ws_codec import *
+from server.scheduler import *
+from server.protocol import *
+from server.log import *
+from server.metrics import *
 import socket
-from threading import Thread
+import selectors
+import threading
+import time
 import re
 import base64
 import hashlib
 import json
-
-# debug omit, yeah
-def debug (*msg):
-	if SERVER_DEBUG_MESSAGE:
-		return print(*msg)
-	
-	return
-
-# something to parse a WS Payload request
-class WSPayload:
-	def __init__(self, data):
-		self.fromBytes(data)
-
-	def fromBytes (self, data):
-		if data == None:
-			self.initialized = False
-			return
-		self.data = data
-		self.parse()
-
-		return self
-
-	def parse (self):
-		try:
-			# first block
-			data = self.data[0]
-			self.fin = data >> 7
-
-			self.reserved = []
-			for i in [6, 5, 4]:
-				self.reserved.append((data & (1 << i)) >> i)
-
-			self.opcode = data & 0xf
-			self.text = self.opcode == 1
-
-			# second block
-			data = self.data[1]
-			self.bit_mask = data >> 7
-			self.payload_len = data & 0x7f
-
-			# check payload len
-			extended_payload_bytes = 0
-			if self.payload_len == 126:
-				extended_payload_bytes = 2
-			elif self.payload_len == 127:
-				extended_payload_bytes = 8
-
-			if extended_payload_bytes != 0:
-				self.payload_len = 0
-				for i in range(0, extended_payload_bytes):
-					self.payload_len = (self.payload_len << 8) | self.data[2 + i]
-
-			nextFrame = extended_payload_bytes + 2
-
-			# get mask
-			self.mask = []
-			if self.bit_mask:
-				self.mask = self.data[nextFrame : nextFrame + 4]
-				nextFrame += 4
-					
-
-			# get obf payload data
-			payloads = self.data[nextFrame:]
-			self.payload = []
-			for p in payloads:
-				self.payload.append(p)
-			
-			# deobf payload data
-			if len(self.mask) > 0:
-				for i in range(0, len(self.payload)):
-					self.payload[i] = self.mask[i % 4] ^ self.payload[i]
-
-			self.payload = bytes(self.payload)
-
-			self.initialized = True
-		except Exception as e:
-			# payload malformed
-			# print(e, self.data)
-			self.initialized = False
-		
-	def information (self):
-		debug("WSPayload: ", self.data)
-		debug("FIN:", self.fin)
-		debug("Reserved:", self.reserved)
-		debug("OPCode:", self.opcode)
-		debug("Bit Mask:", self.bit_mask)
-		debug("Payload Length:", self.payload_len)
-		debug("Mask:", self.mask)
-		debug("Payload:", self.payload)
+from collections import deque
 
 # Wrapper for Socket Client (to support WS and such).
+# Slotted, and the receive buffer and outbound queue only exist while they hold data,
+# so an idle connection stays small.
 class SocketClient:
+	__slots__ = ('address', 'socket', 'path', 'protocol', 'buffer', 'fragments', 'fragmentsSize', 'fragmentsText', 'fragmentsCompressed', 'deflate',
+		'outbound', 'outboundKeys', 'outboundSize', 'outboundLock', 'overLimitSince', 'closed', 'onPendingWrite', 'onSlowConsumer', 'WSKey', 'WebSocket',
+		'receivedAt', 'rtt', 'pingSentAt')
+
 	def __init__(self, socket, address, WSKey = None) -> None:
 		self.address = address
 		self.socket = socket
+		self.path = '/' # path requested in the WebSocket upgrade
+		self.protocol = JSON_PROTOCOL # message encoding picked with Sec-WebSocket-Protocol
+		self.buffer = None # bytes received and not parsed yet
+		self.fragments = None # payloads of a fragmented message
+		self.fragmentsSize = 0
+		self.fragmentsText = True
+		self.fragmentsCompressed = False
+		self.deflate = None # PerMessageDeflate once negotiated
+		self.outbound = None # [coalesce key, bytes] entries waiting to be written
+		self.outboundKeys = None # coalesce key -> queued entry
+		self.outboundSize = 0 # bytes waiting to be written
+		self.outboundLock = threading.RLock()
+		self.overLimitSince = None
+		self.closed = False
+		self.onPendingWrite = None # called when the queue could not be written right away
+		self.onSlowConsumer = None # called when the queue stays over its limits
+		self.receivedAt = None # time.monotonic() of the last read, the receive time of the messages parsed from it
+		self.rtt = None # smoothed round-trip time in seconds, measured by the server's pings
+		self.pingSentAt = None # time.monotonic() of the ping waiting for its pong
 		self.setWSKey(WSKey)
 
 	# set WS Key by given client key
@@ -114,12 +58,20 @@ class SocketClient:
 			return False
 
 	# setup and verify connection with WebSocket instance
-	def setupWSConnection (self, WSKey) -> bool:
+	def setupWSConnection (self, WSKey, protocol = None, deflate = None, extensions = None) -> bool:
 		result = self.setWSKey(WSKey)
 		if result:
+			headers = ''
+			if protocol != None:
+				self.protocol = protocol
+				headers += f'Sec-WebSocket-Protocol: {protocol.name}\r\n'
+			if deflate != None:
+				self.deflate = deflate
+				headers += f'Sec-WebSocket-Extensions: {extensions}\r\n'
+
 			oldWebSocket = self.WebSocket
 			self.WebSocket = False # temp remove to allow send raw data
-			self.send(f'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {self.WSKey}\r\n\r\n')
+			self.send(f'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: {self.WSKey}\r\n{headers}\r\n')
 			debug(f"[{self.addressString()}] WebSocket connection setup successfully.")
 			self.WebSocket = oldWebSocket
 
@@ -136,93 +88,321 @@ class SocketClient:
 			
 			debug(f"[{self.addressString()}] Obtained client WS Key: '{socketKey[0]}'.")
 
-			return self.setupWSConnection(socketKey[0])
+			requestLine = re.match(r'GET\s+(\S+)\s+HTTP/', msg)
+			if requestLine != None:
+				self.path = requestLine.group(1)
+
+			protocol = None
+			offered = re.findall(r'Sec\-WebSocket\-Protocol:\s*(.+)\r\n', msg, re.IGNORECASE)
+			if len(offered) > 0:
+				protocol = negotiateProtocol(offered[0], WS_BINARY_PROTOCOL)
+
+			deflate, extensions = None, None
+			offered = re.findall(r'Sec\-WebSocket\-Extensions:\s*(.+)\r\n', msg, re.IGNORECASE)
+			if WS_DEFLATE and len(offered) > 0:
+				deflate, extensions = negotiateDeflate(', '.join(offered), WS_DEFLATE_SERVER_CONTEXT_TAKEOVER, WS_DEFLATE_CLIENT_CONTEXT_TAKEOVER, WS_DEFLATE_LEVEL)
+
+			return self.setupWSConnection(socketKey[0], protocol, deflate, extensions)
 		
 		return False
 
 	def addressString (self) -> str:
 		return f'{self.address[0]}:{self.address[1]}'
 	
-	def send (self, data):
+	# key of the wire format this client expects, clients sharing it can be sent the same encoded bytes
+	# (a client compressing with context takeover gets its own key)
+	def wireFormat (self):
+		deflate = None
+		if self.deflate != None:
+			deflate = self.deflate.sharedKey() or self
+
+		return self.WebSocket, self.protocol.name, deflate
+
+	# encode data the way it has to be written to this client's socket
+	def encode (self, data) -> bytes:
 		sendAsText = type(data) == str
 
 		if type(data) != bytes:
 			data = data.encode('utf-8')
 
 		if self.WebSocket: # handle differently for WS
-			payload = bytes([
-				(1 << 7) | (000 << 4) | (1 if sendAsText else 2), # fin - reserved(3) - opcode
-				0, # mask - payload len, calculate later
-				# this part will be inserted later to calculate len (0-2-8 bytes extended)
-				# 0x0, 0x0, 0x0, 0x0, # no masks
-			]) + data # raw payload data
-
-			payloadLen = len(payload)
-			payloadheaderSize = payloadLen
-			extraPayloadLenBytes = 0
-
-			if payloadLen >= 0x10000: # larger than 2 bytes
-				extraPayloadLenBytes = 8
-				payloadheaderSize = 127
-			elif payloadLen >= 126:
-				extraPayloadLenBytes = 2
-				payloadheaderSize = 126
-
-			# what to put to payload len header (2nd byte)
-			payload = payload[:1] + bytes([(payload[1] << 7) | payloadheaderSize]) + payload[2:]
-
-			# extended payload length
-			if extraPayloadLenBytes != 0:
-				exLenBytes = []
-				for i in range(0, extraPayloadLenBytes):
-					exLenBytes.insert(0, payloadLen & 0xff)
-					payloadLen >>= 8
-
-				payload = payload[:2] + bytes(exLenBytes) + payload[2:]
-
-			data = payload + b'\r\n'
-			
-		self.socket.send(data)
+			compressed = self.deflate != None and len(data) >= WS_DEFLATE_THRESHOLD
+			if compressed:
+				data = self.deflate.compress(data)
+
+			data = encodeFrame(data, OPCODE_TEXT if sendAsText else OPCODE_BINARY, rsv1=compressed)
+
+		return data
+
+	# queue already encoded bytes for the socket and try writing them right away
+	# a queued message with the same coalesce key that has not started sending yet is replaced
+	def sendEncoded (self, data, key = None):
+		with self.outboundLock:
+			if self.closed:
+				return
+
+			if key != None and self.outboundKeys != None:
+				stale = self.outboundKeys.pop(key, None)
+				if stale != None and stale[0] == key:
+					self.outboundSize -= len(stale[1])
+					stale[0] = None
+					stale[1] = b''
+
+			if self.outbound == None:
+				self.outbound = deque()
+
+			entry = [key, data]
+			self.outbound.append(entry)
+			self.outboundSize += len(data)
+
+			if METRICS_ENABLED:
+				FRAMES_OUT.inc()
+
+			if key != None:
+				if self.outboundKeys == None:
+					self.outboundKeys = {}
+				self.outboundKeys[key] = entry
+
+			# nothing else queued, so the loop is not writing to this socket yet
+			broken = False
+			if len(self.outbound) == 1:
+				try:
+					self.flush()
+				except OSError as e:
+					debug(f"[{self.addressString()}] send:", e)
+					broken = True
+
+			slow = broken or self.checkOutboundLimits()
+
+		if slow:
+			if self.onSlowConsumer != None:
+				self.onSlowConsumer(self)
+		elif self.outbound != None and self.onPendingWrite != None:
+			self.onPendingWrite(self)
+
+	# write as much of the outbound queue as the socket accepts, returns True once the queue is empty
+	def flush (self) -> bool:
+		with self.outboundLock:
+			outbound = self.outbound
+			if outbound == None:
+				return True
+
+			while len(outbound) > 0:
+				entry = outbound[0]
+				data = entry[1]
+
+				if len(data) > 0:
+					entry[0] = None # started sending, can not be coalesced anymore
+
+					try:
+						sent = self.socket.send(data)
+					except (BlockingIOError, InterruptedError):
+						return False
+
+					self.outboundSize -= sent
+
+					if METRICS_ENABLED:
+						BYTES_OUT.inc(sent)
+
+					if sent < len(data):
+						entry[1] = memoryview(data)[sent:]
+						return False
+
+				outbound.popleft()
+
+			self.outbound = None
+			self.outboundKeys = None
+			self.overLimitSince = None
+			return True
+
+	# track how long the queue stays over the high-water mark, returns True if the client should be evicted
+	def checkOutboundLimits (self) -> bool:
+		if self.outboundSize >= SERVER_OUTBOUND_HARD_LIMIT:
+			return True
 
-	def sendJSON(self, dict):
+		if self.outboundSize < SERVER_OUTBOUND_HIGH_WATER:
+			self.overLimitSince = None
+			return False
+
+		if self.overLimitSince == None:
+			self.overLimitSince = time.monotonic()
+
+		return time.monotonic() - self.overLimitSince >= SERVER_SLOW_CONSUMER_TIMEOUT
+
+	def send (self, data, key = None):
+		return self.sendEncoded(self.encode(data), key)
+
+	def sendJSON(self, dict, key = None):
 		data = json.dumps(dict, skipkeys=True)
-		return self.send(data)
+		return self.send(data, key)
 
-	oldPayload = bytes([])
+	# send a named message in the client's protocol
+	def sendMessage(self, name, data, key = None):
+		return self.send(self.protocol.encode(name, data), key)
 
-	def get_data(self, delim = 1024, toBytes = False) -> str | bytes:
-		msg = self.socket.recv(delim)
+	def decodeMessage(self, msg) -> dict:
+		return self.protocol.decode(msg)
 
-		binary = True
+	# read whatever is available on the socket and return every complete message in it as (msg, isBinary)
+	# partial frames stay in the receive buffer until the rest arrives
+	def receive(self, delim = 1024, toBytes = False) -> list:
+		try:
+			chunk = self.socket.recv(delim)
+		except (BlockingIOError, InterruptedError):
+			return []
 
-		if self.WebSocket:
-			data = WSPayload(msg)
+		if len(chunk) < 1: # peer has shut down its side
+			raise ConnectionResetError("connection closed by peer")
 
-			resetPayload = False
+		if METRICS_ENABLED:
+			BYTES_IN.inc(len(chunk))
+
+		return self.feed(chunk, toBytes)
+
+	# append received bytes to the receive buffer and return every complete message in it
+	def feed(self, data, toBytes = False) -> list:
+		if self.buffer == None:
+			self.buffer = bytearray(data)
+		else:
+			self.buffer += data
+
+		return self.parseBuffer(toBytes)
+
+	# extract every complete message from the receive buffer
+	def parseBuffer(self, toBytes = False) -> list:
+		if self.buffer == None:
+			return []
+
+		if not self.WebSocket:
+			return self.receiveRaw(toBytes)
+
+		messages = []
+		offset = 0
+
+		with memoryview(self.buffer) as view:
+			while True:
+				header = parseFrameHeader(view, offset)
+				if header == None:
+					break
+
+				fin, rsv1, opcode, mask, start, end = header
+
+				if end - start > SERVER_MAX_MESSAGE_SIZE or self.fragmentsSize + end - start > SERVER_MAX_MESSAGE_SIZE:
+					if METRICS_ENABLED:
+						FRAME_PARSE_ERRORS.inc()
+					raise ConnectionResetError("message too large")
+
+				if end > len(view):
+					break
+
+				if METRICS_ENABLED:
+					FRAMES_IN.inc()
+
+				payload = view[start : end]
+				payload = unmask(payload, mask) if mask != None else bytes(payload)
+				offset = end
+
+				if opcode == OPCODE_CLOSE: # close frame, let the server loop tear it down
+					raise ConnectionResetError("close frame received")
+				elif opcode == OPCODE_PING:
+					self.sendControl(OPCODE_PONG, payload)
+					continue
+				elif opcode == OPCODE_PONG:
+					self.pongReceived()
+					continue
+				elif opcode != OPCODE_CONTINUATION: # first frame of a new message
+					self.fragments = None
+					self.fragmentsSize = 0
+					self.fragmentsText = opcode == OPCODE_TEXT
+					self.fragmentsCompressed = rsv1 == 1 # only set on the first frame of a message
+
+				if fin == 1 and self.fragments == None: # unfragmented, no need to collect it
+					msg = payload
+				else:
+					if self.fragments == None:
+						self.fragments = []
+					self.fragments.append(payload)
+					self.fragmentsSize += len(payload)
+
+					if fin != 1:
+						continue
+
+					msg = b''.join(self.fragments)
+					self.fragments = None
+					self.fragmentsSize = 0
+
+				if self.fragmentsCompressed:
+					try:
+						if self.deflate == None:
+							raise ValueError("compressed frame without permessage-deflate")
+
+						msg = self.deflate.decompress(msg, SERVER_MAX_MESSAGE_SIZE)
+					except (ValueError, zlib.error) as e:
+						if METRICS_ENABLED:
+							FRAME_PARSE_ERRORS.inc()
+						raise ConnectionResetError(f"bad compressed message: {e}")
+
+				# binary messages are always handed over as bytes
+				if not toBytes and self.fragmentsText:
+					msg = msg.decode('utf-8', 'replace')
+
+				messages.append((msg, not self.fragmentsText))
+
+		# drop consumed frames, deleting from the front of a bytearray does not copy the rest
+		del self.buffer[:offset]
+		if len(self.buffer) < 1:
+			self.buffer = None
+
+		return messages
+
+	# data received before the WebSocket upgrade: wait for the whole HTTP request,
+	# or pass anything else through as is
+	def receiveRaw(self, toBytes = False) -> list:
+		if self.buffer.startswith(b'GET '):
+			end = self.buffer.find(b'\r\n\r\n')
+			if end < 0:
+				if len(self.buffer) > SERVER_MAX_MESSAGE_SIZE:
+					if METRICS_ENABLED:
+						FRAME_PARSE_ERRORS.inc()
+					raise ConnectionResetError("request too large")
+				return []
+			end += 4
+		else:
+			end = len(self.buffer)
+
+		msg = bytes(self.buffer[:end])
+		del self.buffer[:end]
+		if len(self.buffer) < 1:
+			self.buffer = None
 
-			if not data.initialized:
-				msg = bytes([])
-			elif data.opcode == 8: # close frame
-				self.socket.close()
-				resetPayload = True
-				msg = bytes([])
-			else:
-				self.oldPayload += data.payload
-				msg = bytes([])
-				if data.fin == 1: # this is the final frame
-					resetPayload = True
-					msg = self.oldPayload
-					binary = not data.text
-			
-			if resetPayload:
-				self.oldPayload = bytes([])
-			
 		if not toBytes:
-			msg = ''.join([chr(i) for i in msg])
+			msg = msg.decode('latin-1')
+
+		return [(msg, True)]
+
+	def sendControl (self, opcode, payload = b''):
+		return self.sendEncoded(encodeFrame(payload, opcode))
+
+	def ping (self, now):
+		self.pingSentAt = now
+		self.sendControl(OPCODE_PING)
 
-		return msg, binary
+	# smooth round-trip samples like TCP does (1/8 of each new sample)
+	def pongReceived (self):
+		if self.pingSentAt == None:
+			return
+
+		sample = (self.receivedAt or time.monotonic()) - self.pingSentAt
+		self.rtt = sample if self.rtt == None else self.rtt + (sample - self.rtt) / 8
+		self.pingSentAt = None
 	
 	def close (self):
+		with self.outboundLock:
+			self.closed = True
+			self.outbound = None
+			self.outboundKeys = None
+			self.outboundSize = 0
+
 		return self.socket.close()
 	
 	def __eq__(self, __value: object) -> bool:
@@ -231,17 +411,33 @@ class SocketClient:
 		
 		return self.address == __value.address and self.socket == __value.socket
 
+	def __hash__(self) -> int:
+		return hash(self.address)
+
+# send the same message to many clients, serializing and framing it only once per wire format
+def broadcast (clients, name, data, key = None):
+	encoded = {}
+
+	for client in clients:
+		wireFormat = client.wireFormat()
+		frame = encoded.get(wireFormat)
+
+		if frame == None:
+			frame = encoded[wireFormat] = client.encode(client.protocol.encode(name, data))
+
+		try:
+			client.sendEncoded(frame, key)
+		except Exception as e:
+			debug(f"[{client.addressString()}] broadcast:", e)
+
 # Socket Clients Manager instance.
+# Clients are indexed by address (insertion ordered), so lookups and removals are O(1).
 class SocketClientManager:
 	def __init__(self) -> None:
-		self.clients = []
+		self.clients = {}
 
 	def find(self, address) -> SocketClient | None:
-		for client in self.clients:
-			if client.address == address:
-				return client
-		
-		return None
+		return self.clients.get(address)
 
 	def add(self, socket, address, WSKey = None) -> SocketClient:
 		# check if client exist first
@@ -251,7 +447,7 @@ class SocketClientManager:
 
 		if newClient == None:
 			newClient = SocketClient(socket, address, WSKey)
-			self.clients.append(newClient)
+			self.clients[address] = newClient
 			new = True
 
 		return newClient, new
@@ -261,14 +457,12 @@ class SocketClientManager:
 			client.close()
 		except:
 			pass
-	
-	def closeAtIndex(self, index, closeClient = False):
-		if index >= 0 and index < len(self.clients):
-			cli = self.clients[index]
-			if closeClient:
-				self.tryClose(cli)
-			
-			self.clients.pop(index)
+
+	def __len__(self) -> int:
+		return len(self.clients)
+
+	def __iter__(self):
+		return iter(list(self.clients.values()))
 	
 	# close a socket client and removes from list of sockets
 	def closeSocket(self, client, dontTryClose = False):
@@ -277,56 +471,296 @@ class SocketClientManager:
 			self.tryClose(client)
 		
 		# remove socket from list of client
-		if client in self.clients:
-			self.closeAtIndex(self.clients.index(client))
+		if self.clients.get(client.address) is client:
+			del self.clients[client.address]
 
 	# close a socket client by address and removes from list of sockets
 	def closeSocketByAddress(self, address):
-		index = 0
+		client = self.clients.pop(address, None)
 
-		for client in self.clients:
-			if client.address == address:
-				break
-
-			index += 1
+		if client != None:
+			self.tryClose(client)
 
-		if index < len(self.clients):
-			self.closeAtIndex(index, True)
+# raise the open files limit so the selector can hold many idle connections
+def raiseOpenFilesLimit ():
+	try:
+		import resource
+		soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+		if hard == resource.RLIM_INFINITY or hard > soft:
+			resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+	except (ImportError, ValueError, OSError) as e:
+		warning("[Socket Startup] Could not raise open files limit:", e)
 
 # The Socket Server instance.
+# All connections are multiplexed on a single selector loop (epoll/kqueue where available),
+# so an idle connection costs only its socket and a SocketClient, not an OS thread.
 class SocketServer:
 	def __init__(self) -> None:
 		s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
 		self.socket = s
 		self.clients = SocketClientManager()
-		self.news = []
+		self.news = set() # connected clients that did not send anything yet
+		self.selector = selectors.DefaultSelector()
+		self.loopThread = None
+
+		# timers of every arena run on the loop
+		self.scheduler = Scheduler()
+		self.scheduler.onWakeup = self.wakeup
+
+		# writes and closes requested for clients, applied by the loop
+		self.pendingLock = threading.Lock()
+		self.pendingWrites = set()
+		self.pendingCloses = set()
+		self.clientCallbacks = (self.requestWrite, self.evictSlowConsumer) # bound once and shared by every client
 
-	def start (self):
-		self.socket.bind((SERVER_HOST, SERVER_PORT))
+		# lets other threads wake the loop up
+		self.wakeupReader, self.wakeupWriter = socket.socketpair()
+		self.wakeupReader.setblocking(False)
+		self.wakeupWriter.setblocking(False)
 
-		self.socket.listen(SERVER_MAX_PLAYERS)
+	# run the server loop, without listen the server only serves clients handed to adoptClient
+	def start (self, listen = True):
+		raiseOpenFilesLimit()
 
-		debug(f'[Socket Startup] Server started at \'ws://{SERVER_HOST}:{SERVER_PORT}\'.')
+		if listen:
+			self.socket.bind((SERVER_HOST, SERVER_PORT))
+
+			self.socket.listen(SERVER_LISTEN_BACKLOG)
+			self.socket.setblocking(False)
+
+			self.selector.register(self.socket, selectors.EVENT_READ, self.acceptClients)
+		else:
+			self.socket.close()
+
+		self.selector.register(self.wakeupReader, selectors.EVENT_READ, self.drainWakeup)
+		self.loopThread = threading.get_ident()
+
+		if listen:
+			info(f'[Socket Startup] Server started at \'ws://{SERVER_HOST}:{SERVER_PORT}\'.')
 
 		self.safeHandler(self.onServerStartup)
 
+		if SERVER_PING_INTERVAL > 0:
+			self.scheduler.callLater(SERVER_PING_INTERVAL, self.pingClients)
+
 		while True:
-			c, addr = self.socket.accept()     # Establish connection with client.
-			cli, new = self.clients.add(c, addr)
-			
-			if new:
-				debug(f'[{cli.addressString()}] New connection established.')
-				self.news.append(cli)
-			
-			Thread(target=self.on_new_client, args=[cli]).start()
+			for key, mask in self.selector.select(self.scheduler.nextTimeout()):
+				if PROFILE_ENABLED:
+					self.profileEvent(key, mask)
+				elif type(key.data) == SocketClient:
+					self.serviceClient(key.data, mask)
+				else:
+					key.data(key.fileobj)
+
+			self.applyPending()
+			self.scheduler.runDue()
+
+	# the loop's event dispatch, timed per callback
+	def profileEvent (self, key, mask):
+		if type(key.data) == SocketClient:
+			timeHandler('SocketServer.serviceClient', self.serviceClient, key.data, mask)
+		else:
+			timeHandler(handlerName(key.data), key.data, key.fileobj)
+
+	# ping every WebSocket client, the pongs measure their round-trip times
+	def pingClients (self):
+		now = time.monotonic()
+
+		for cli in self.clients:
+			if cli.WebSocket and not cli.closed:
+				cli.ping(now)
+
+		self.scheduler.callLater(SERVER_PING_INTERVAL, self.pingClients)
+
+	# call callback(fileobj) on the loop whenever fileobj is readable
+	def watch (self, fileobj, callback):
+		self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+	# wake the loop up if called from another thread
+	def wakeup (self):
+		if threading.get_ident() == self.loopThread:
+			return
+
+		try:
+			self.wakeupWriter.send(b'\0')
+		except (BlockingIOError, InterruptedError):
+			pass # already has pending wakeups
+
+	def drainWakeup (self, reader):
+		try:
+			while len(reader.recv(4096)) > 0:
+				pass
+		except (BlockingIOError, InterruptedError):
+			pass
+
+	def requestWrite (self, cli: SocketClient):
+		with self.pendingLock:
+			self.pendingWrites.add(cli)
+		self.wakeup()
+
+	def requestClose (self, cli: SocketClient):
+		with self.pendingLock:
+			self.pendingCloses.add(cli)
+		self.wakeup()
+
+	def evictSlowConsumer (self, cli: SocketClient):
+		warning(f'[{cli.addressString()}] Evicting slow consumer ({cli.outboundSize} bytes queued).')
+
+		if METRICS_ENABLED:
+			SLOW_CONSUMERS.inc()
+		self.requestClose(cli)
+
+	# apply writes and closes requested since the last loop iteration
+	def applyPending (self):
+		with self.pendingLock:
+			writes, closes = self.pendingWrites, self.pendingCloses
+			if len(writes) < 1 and len(closes) < 1:
+				return
+			self.pendingWrites, self.pendingCloses = set(), set()
+
+		for cli in closes:
+			self.closeClient(cli)
+
+		for cli in writes:
+			if cli.closed:
+				continue
+
+			try:
+				self.selector.modify(cli.socket, selectors.EVENT_READ | selectors.EVENT_WRITE, cli)
+			except (KeyError, ValueError):
+				pass
+
+	def serviceClient (self, cli: SocketClient, mask):
+		if mask & selectors.EVENT_WRITE:
+			try:
+				if cli.flush():
+					self.selector.modify(cli.socket, selectors.EVENT_READ, cli)
+			except OSError:
+				return self.closeClient(cli)
+
+		if mask & selectors.EVENT_READ:
+			self.readClient(cli)
+
+	# accept every pending connection on the listener
+	def acceptClients (self, listener):
+		for _ in range(SERVER_ACCEPT_BATCH):
+			try:
+				c, addr = listener.accept()     # Establish connection with client.
+			except (BlockingIOError, InterruptedError):
+				return
+			except OSError as e:
+				warning(f'[Socket Accept] {e}')
+				return
+
+			self.addClient(c, addr)
+
+	def addClient (self, c, addr) -> SocketClient:
+		c.setblocking(False)
+
+		cli, new = self.clients.add(c, addr)
+		cli.onPendingWrite, cli.onSlowConsumer = self.clientCallbacks
+
+		if new:
+			debug(f'[{cli.addressString()}] New connection established.')
+			self.news.add(cli)
+
+			if METRICS_ENABLED:
+				CONNECTIONS.inc()
+				CONNECTIONS_ACCEPTED.inc()
+
+		self.selector.register(c, selectors.EVENT_READ, cli)
+
+		return cli
+
+	# take over a connection accepted elsewhere (e.g. by the cluster router),
+	# data is what was already read from it
+	def adoptClient (self, c, addr, data = b''):
+		cli = self.addClient(c, addr)
+
+		if len(data) < 1:
+			return
+
+		cli.receivedAt = time.monotonic()
+
+		try:
+			messages = cli.feed(data)
+		except Exception as e:
+			return self.closeClient(cli)
+
+		self.processMessages(cli, messages)
+
+	def readClient (self, cli: SocketClient):
+		cli.receivedAt = time.monotonic() # answers are ranked by this (see Game.answerTime)
+
+		try:
+			messages = cli.receive(SERVER_RECV_SIZE)
+		except Exception as e:
+			# debug(e)
+			return self.closeClient(cli)
+
+		self.processMessages(cli, messages)
+
+	def processMessages (self, cli: SocketClient, messages):
+		for msg, isBinary in messages:
+			wasWebSocket = cli.WebSocket
+			self.handleMessage(cli, msg, isBinary)
+
+			# frames sent right behind the upgrade request are already buffered
+			if cli.WebSocket and not wasWebSocket and cli.buffer != None:
+				try:
+					messages.extend(cli.parseBuffer())
+				except Exception as e:
+					return self.closeClient(cli)
+
+	def handleMessage (self, cli: SocketClient, msg, isBinary):
+		if len(msg) < 1:
+			return
+
+		notWS = not cli.checkAndSetupWSConnectionIfEligible(msg)
+
+		if cli in self.news:
+			self.news.discard(cli)
+			self.safeHandler(self.onClientConnect, cli)
+
+		if notWS:
+			# get socket data
+			if debugEnabled():
+				debug(f'[{cli.addressString()}] Received message (Type: {"Binary" if isBinary else "Text (UTF-8)"}):')
+				debug(msg)
+
+			self.safeHandler(self.onMessage, cli, msg)
+
+	def closeClient (self, cli: SocketClient):
+		if cli.closed:
+			return
+
+		try:
+			self.selector.unregister(cli.socket)
+		except (KeyError, ValueError):
+			pass
+
+		self.news.discard(cli)
+
+		self.clients.closeSocket(cli)
+		debug(f'[{cli.addressString()}] Connection closed by client.')
+
+		if METRICS_ENABLED:
+			CONNECTIONS.dec()
+		self.safeHandler(self.onClientClose, cli)
 
 	def safeHandler (self, func, *args):
 		try:
-			if func != None:
+			if func == None:
+				return
+
+			if PROFILE_ENABLED:
+				timeHandler(handlerName(func), func, *args)
+			else:
 				func(*args)
 		except Exception as e:
-			debug(e)
+			error(e)
 
 	def setMessageHandler(self, func):
 		self.onMessage = func
@@ -344,31 +778,3 @@ class SocketServer:
 	onClientClose = None
 	onClientConnect = None
 	onServerStartup = None
-	
-	def on_new_client(self, cli: SocketClient):
-		try:
-			while True:
-				msg, isBinary = cli.get_data(2048) # up to 2KB only
-				if len(msg) < 1:
-					continue
-
-				notWS = not cli.checkAndSetupWSConnectionIfEligible(msg)
-
-				if cli in self.news:
-					self.news.remove(cli)
-					self.safeHandler(self.onClientConnect, cli)
-
-				if notWS:
-					# get socket data
-					debug(f'[{cli.addressString()}] Received message (Type: {"Binary" if isBinary else "Text (UTF-8)"}):')
-					debug(msg)
-
-					self.safeHandler(self.onMessage, cli, msg)
-					
-		except Exception as e:
-			# debug(e)
-			self.clients.closeSocket(cli, True)
-			debug(f'[{cli.addressString()}] Connection closed by client.')
-			self.safeHandler(self.onClientClose, cli)
-
-			
\ No newline at end of file
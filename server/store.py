@@ -0,0 +1,275 @@
+from server.log import *
+import atexit
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+
+# Match history: matches, their rounds and answers, final standings, and all-time player totals.
+# Arenas only hand records over (a queue put), a writer thread writes them in batches,
+# so scoring a round never waits for the disk. Queries can run on any thread.
+class MatchStore:
+	enabled = False # False if nothing is recorded, arenas skip collecting records then
+
+	# id of a new match, unique across processes sharing the store
+	def newMatchId(self) -> int:
+		return secrets.randbits(62)
+
+	# answers: (nickname, answer, correct) in arrival order
+	def recordRound(self, matchId, index, num1, num2, operator, result, answers, endedAt):
+		pass
+
+	# standings: (nickname, points, gameovered), winner: nickname or None if nobody won
+	def recordMatch(self, matchId, roomId, winningPoints, rounds, winner, standings, startedAt, endedAt):
+		pass
+
+	# all-time best players, by wins then points
+	def topPlayers(self, limit = 10) -> list:
+		return []
+
+	# the latest matches of a player, newest first
+	def history(self, nickname, limit = 20) -> list:
+		return []
+
+	# wait until every record handed over so far is written
+	def flush(self):
+		pass
+
+	def close(self):
+		pass
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+	id INTEGER PRIMARY KEY,
+	room TEXT,
+	winning_points INTEGER,
+	rounds INTEGER,
+	winner TEXT,
+	started_at REAL,
+	ended_at REAL
+);
+CREATE TABLE IF NOT EXISTS rounds (
+	match_id INTEGER,
+	round INTEGER,
+	num1 INTEGER,
+	num2 INTEGER,
+	operator TEXT,
+	result TEXT,
+	answers INTEGER,
+	correct INTEGER,
+	ended_at REAL,
+	PRIMARY KEY (match_id, round)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS answers (
+	match_id INTEGER,
+	round INTEGER,
+	position INTEGER,
+	nickname TEXT,
+	answer INTEGER,
+	correct INTEGER,
+	PRIMARY KEY (match_id, round, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS standings (
+	match_id INTEGER,
+	nickname TEXT,
+	place INTEGER,
+	points INTEGER,
+	gameovered INTEGER,
+	won INTEGER,
+	ended_at REAL,
+	PRIMARY KEY (match_id, nickname)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS players (
+	nickname TEXT PRIMARY KEY,
+	matches INTEGER,
+	wins INTEGER,
+	points INTEGER,
+	best INTEGER,
+	last_played REAL
+);
+CREATE INDEX IF NOT EXISTS standings_by_nickname ON standings (nickname, ended_at DESC);
+CREATE INDEX IF NOT EXISTS players_by_rank ON players (wins DESC, points DESC);
+"""
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+INSERT_MATCH = "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)"
+INSERT_ROUND = "INSERT OR REPLACE INTO rounds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_ANSWER = "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_STANDING = "INSERT OR REPLACE INTO standings VALUES (?, ?, ?, ?, ?, ?, ?)"
+UPSERT_PLAYER = """INSERT INTO players VALUES (?, 1, ?, ?, ?, ?)
+ON CONFLICT (nickname) DO UPDATE SET
+	matches = matches + 1,
+	wins = wins + excluded.wins,
+	points = points + excluded.points,
+	best = max(best, excluded.best),
+	last_played = max(last_played, excluded.last_played)"""
+
+# SQLite in WAL mode: queries read a snapshot while the writer thread appends.
+# Every statement is an insert or a commutative upsert, so a batch can run grouped by statement.
+class SQLiteStore(MatchStore):
+	enabled = True
+
+	def __init__(self, path = STORE_PATH, batchSize = STORE_BATCH_SIZE, flushInterval = STORE_FLUSH_INTERVAL) -> None:
+		self.path = path
+		self.batchSize = batchSize # in handed over record lists
+		self.flushInterval = flushInterval
+		self.pending = queue.SimpleQueue() # (statement, rows) or (None, event) to flush
+		self.readers = threading.local() # a read connection per thread
+		self.writer = None
+		self.writerLock = threading.Lock()
+		self.written = 0 # rows written
+		self.batches = 0 # transactions committed
+
+		connection = self.connect()
+		connection.executescript(SCHEMA)
+		connection.close()
+
+	def connect(self) -> sqlite3.Connection:
+		connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+		connection.execute("PRAGMA journal_mode = WAL")
+		connection.execute("PRAGMA synchronous = NORMAL") # durable up to the last checkpoint, enough for history
+		return connection
+
+	# hand rows over to the writer thread, started on the first write
+	def put(self, statement, rows):
+		if self.writer == None:
+			with self.writerLock:
+				if self.writer == None:
+					self.writer = threading.Thread(target=self.run, name='store', daemon=True)
+					self.writer.start()
+
+		self.pending.put((statement, rows))
+
+	def recordRound(self, matchId, index, num1, num2, operator, result, answers, endedAt):
+		rows = []
+		correct = 0
+
+		for position, (nickname, answer, isCorrect) in enumerate(answers):
+			if not INT64_MIN <= answer <= INT64_MAX:
+				answer = str(answer) # too large for an INTEGER column
+			rows.append((matchId, index, position, nickname, answer, isCorrect))
+			correct += isCorrect
+
+		if len(rows) > 0:
+			self.put(INSERT_ANSWER, rows)
+		self.put(INSERT_ROUND, [(matchId, index, num1, num2, operator, ','.join(str(value) for value in result), len(answers), correct, endedAt)])
+
+	def recordMatch(self, matchId, roomId, winningPoints, rounds, winner, standings, startedAt, endedAt):
+		self.put(INSERT_MATCH, [(matchId, roomId, winningPoints, rounds, winner, startedAt, endedAt)])
+
+		if len(standings) < 1:
+			return
+
+		ranked = sorted(standings, key=lambda standing: (standing[0] != winner, -standing[1]))
+		places = [(nickname, place, points, int(gameovered), int(nickname == winner)) for place, (nickname, points, gameovered) in enumerate(ranked, 1)]
+
+		self.put(INSERT_STANDING, [(matchId, nickname, place, points, gameovered, won, endedAt) for nickname, place, points, gameovered, won in places])
+		self.put(UPSERT_PLAYER, [(nickname, won, points, points, endedAt) for nickname, place, points, gameovered, won in places])
+
+	# writer thread: wait for a row, gather more for up to flushInterval, write them in one transaction
+	def run(self):
+		connection = self.connect()
+
+		while True:
+			batch = [self.pending.get()]
+			deadline = time.monotonic() + self.flushInterval
+
+			while len(batch) < self.batchSize and batch[-1][0] != None:
+				try:
+					batch.append(self.pending.get(timeout=max(0, deadline - time.monotonic())))
+				except queue.Empty:
+					break
+
+			self.write(connection, [item for item in batch if item[0] != None])
+
+			for statement, event in batch:
+				if statement == None:
+					event.set()
+
+	def write(self, connection, batch):
+		if len(batch) < 1:
+			return
+
+		statements = {} # statement -> rows, in the order statements were first seen
+		for statement, rows in batch:
+			statements.setdefault(statement, []).extend(rows)
+
+		try:
+			with connection:
+				for statement, rows in statements.items():
+					connection.executemany(statement, rows)
+		except sqlite3.Error as e:
+			return error("store:", e)
+
+		self.written += sum(len(rows) for rows in statements.values())
+		self.batches += 1
+
+	def flush(self):
+		# (the writer of a parent process does not run in a forked child)
+		if self.writer == None or not self.writer.is_alive():
+			return
+
+		done = threading.Event()
+		self.pending.put((None, done))
+		done.wait()
+
+	def close(self):
+		self.flush()
+
+	def reader(self) -> sqlite3.Connection:
+		connection = getattr(self.readers, 'connection', None)
+
+		if connection == None:
+			connection = self.readers.connection = self.connect()
+			connection.row_factory = sqlite3.Row
+
+		return connection
+
+	def topPlayers(self, limit = 10) -> list:
+		rows = self.reader().execute("SELECT nickname, wins, matches, points, best, last_played FROM players ORDER BY wins DESC, points DESC LIMIT ?", (limit,))
+		return [dict(row) for row in rows]
+
+	def history(self, nickname, limit = 20) -> list:
+		rows = self.reader().execute("""SELECT s.match_id, m.room, s.place, s.points, s.gameovered, s.won, m.winner, m.rounds, m.started_at, s.ended_at
+			FROM standings s JOIN matches m ON m.id = s.match_id
+			WHERE s.nickname = ? ORDER BY s.ended_at DESC LIMIT ?""", (nickname, limit))
+		return [dict(row) for row in rows]
+
+STORE_BACKENDS = {}
+
+def registerStore (name, factory):
+	STORE_BACKENDS[name] = factory
+
+registerStore('none', MatchStore)
+registerStore('sqlite', SQLiteStore)
+
+sharedStore = None
+sharedStoreLock = threading.Lock()
+
+# the store shared by every arena of this process
+def sharedMatchStore () -> MatchStore:
+	global sharedStore
+
+	with sharedStoreLock:
+		if sharedStore == None:
+			try:
+				sharedStore = STORE_BACKENDS[STORE_BACKEND]()
+			except Exception as e:
+				error(f'[Store] Could not open the {STORE_BACKEND} store, matches will not be recorded:', e)
+				sharedStore = MatchStore()
+
+			atexit.register(sharedStore.close)
+
+	return sharedStore
+
+# a forked child gets its own store (and writer thread) on first use
+def forgetSharedStore ():
+	global sharedStore, sharedStoreLock
+
+	sharedStore = None
+	sharedStoreLock = threading.Lock()
+
+os.register_at_fork(after_in_child=forgetSharedStore)
@@ -0,0 +1,191 @@
+import struct
+import zlib
+
+# numpy is optional, only used to unmask large payloads
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# WebSocket opcodes
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xa
+
+# payloads from this size are unmasked with numpy (if installed)
+NUMPY_UNMASK_THRESHOLD = 4096
+
+EXTENDED_LEN_16 = struct.Struct('!H')
+EXTENDED_LEN_64 = struct.Struct('!Q')
+
+HEADER_16 = struct.Struct('!BBH')
+HEADER_64 = struct.Struct('!BBQ')
+
+# precomputed 2-byte headers of unfragmented frames with a payload shorter than 126 bytes,
+# indexed by [opcode][payload length]
+SHORT_HEADERS = [[bytes([0x80 | opcode, length]) for length in range(126)] for opcode in range(16)]
+
+# XOR a payload with its 4-byte mask (RFC 6455 section 5.3), returns bytes
+def unmask (payload, mask) -> bytes:
+	length = len(payload)
+
+	if length == 0:
+		return b''
+
+	key = bytes(mask) * ((length >> 2) + 1)
+
+	if numpy != None and length >= NUMPY_UNMASK_THRESHOLD:
+		data = numpy.frombuffer(payload, dtype=numpy.uint8)
+		return numpy.bitwise_xor(data, numpy.frombuffer(key, dtype=numpy.uint8, count=length)).tobytes()
+
+	# a single big-int XOR runs in C instead of looping over every byte
+	return (int.from_bytes(payload, 'little') ^ int.from_bytes(memoryview(key)[:length], 'little')).to_bytes(length, 'little')
+
+# build the header of an unmasked (server to client) frame
+def frameHeader (length, opcode = OPCODE_TEXT, fin = True, rsv1 = False) -> bytes:
+	first = (0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode
+
+	if length < 126:
+		if fin and not rsv1:
+			return SHORT_HEADERS[opcode][length]
+		return bytes([first, length])
+	elif length < 0x10000:
+		return HEADER_16.pack(first, 126, length)
+
+	return HEADER_64.pack(first, 127, length)
+
+# build a complete unmasked frame ready to be written to a socket
+def encodeFrame (data, opcode = OPCODE_TEXT, fin = True, rsv1 = False) -> bytes:
+	return frameHeader(len(data), opcode, fin, rsv1) + data
+
+# parse the frame header starting at offset of a receive buffer,
+# returns (fin, rsv1, opcode, mask, payload start, payload end) or None if the header is incomplete
+def parseFrameHeader (buffer, offset = 0):
+	available = len(buffer) - offset
+
+	if available < 2:
+		return None
+
+	first = buffer[offset]
+	second = buffer[offset + 1]
+
+	length = second & 0x7f
+	start = offset + 2
+
+	if length == 126:
+		if available < 4:
+			return None
+		length = EXTENDED_LEN_16.unpack_from(buffer, start)[0]
+		start += 2
+	elif length == 127:
+		if available < 10:
+			return None
+		length = EXTENDED_LEN_64.unpack_from(buffer, start)[0]
+		start += 8
+
+	mask = None
+	if second & 0x80:
+		if len(buffer) < start + 4:
+			return None
+		mask = bytes(buffer[start : start + 4])
+		start += 4
+
+	return first >> 7, (first >> 6) & 1, first & 0xf, mask, start, start + length
+
+# tail every deflated message ends with after a sync flush, stripped on the wire (RFC 7692 section 7.2.1)
+DEFLATE_TAIL = b'\x00\x00\xff\xff'
+
+# The permessage-deflate state of one connection (RFC 7692).
+# Without context takeover every message is (de)compressed with a fresh zlib stream,
+# so no window is kept between messages and identical messages compress to identical bytes.
+class PerMessageDeflate:
+	def __init__(self, serverContextTakeover = False, clientContextTakeover = False, serverMaxWindowBits = 15, clientMaxWindowBits = 15, level = 6) -> None:
+		self.serverContextTakeover = serverContextTakeover
+		self.clientContextTakeover = clientContextTakeover
+		self.serverMaxWindowBits = serverMaxWindowBits
+		self.clientMaxWindowBits = clientMaxWindowBits
+		self.level = level
+		self.compressor = None # kept between messages only with context takeover
+		self.decompressor = None
+
+	# key shared by connections that compress a message to the same bytes, None if the output depends on earlier messages
+	def sharedKey (self):
+		if self.serverContextTakeover:
+			return None
+
+		return self.serverMaxWindowBits, self.level
+
+	def compress (self, data) -> bytes:
+		compressor = self.compressor
+		if compressor == None:
+			compressor = zlib.compressobj(self.level, zlib.DEFLATED, -self.serverMaxWindowBits)
+			if self.serverContextTakeover:
+				self.compressor = compressor
+
+		data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+		if data.endswith(DEFLATE_TAIL):
+			data = data[:-4]
+
+		return data
+
+	# inflate a message, raises ValueError if it grows over maxSize
+	def decompress (self, data, maxSize) -> bytes:
+		decompressor = self.decompressor
+		if decompressor == None:
+			decompressor = zlib.decompressobj(-15) # a full window also inflates streams written with a smaller one
+			if self.clientContextTakeover:
+				self.decompressor = decompressor
+
+		data = decompressor.decompress(bytes(data) + DEFLATE_TAIL, maxSize + 1)
+
+		if len(data) > maxSize or len(decompressor.unconsumed_tail) > 0:
+			raise ValueError("decompressed message too large")
+
+		return data
+
+# pick the first permessage-deflate offer of a Sec-WebSocket-Extensions header that can be accepted,
+# returns (PerMessageDeflate, response header value) or (None, None)
+def negotiateDeflate (offered, serverContextTakeover = False, clientContextTakeover = False, level = 6):
+	for offer in offered.split(','):
+		parts = [part.strip() for part in offer.split(';')]
+		if parts[0].lower() != 'permessage-deflate':
+			continue
+
+		params = {}
+		for part in parts[1:]:
+			name, _, value = part.partition('=')
+			params[name.strip().lower()] = value.strip().strip('"')
+
+		if any(name not in ['server_no_context_takeover', 'client_no_context_takeover', 'server_max_window_bits', 'client_max_window_bits'] for name in params):
+			continue
+
+		try:
+			serverBits = int(params.get('server_max_window_bits') or 15)
+			clientBits = int(params.get('client_max_window_bits') or 15)
+		except ValueError:
+			continue
+
+		# zlib can not write raw deflate streams with a 256 byte window, so server_max_window_bits=8 is declined
+		if not (9 <= serverBits <= 15 and 8 <= clientBits <= 15):
+			continue
+
+		serverTakeover = serverContextTakeover and 'server_no_context_takeover' not in params
+		clientTakeover = clientContextTakeover and 'client_no_context_takeover' not in params
+
+		response = ['permessage-deflate']
+		if not serverTakeover:
+			response.append('server_no_context_takeover')
+		if not clientTakeover:
+			response.append('client_no_context_takeover')
+		if 'server_max_window_bits' in params:
+			response.append(f'server_max_window_bits={serverBits}')
+		if params.get('client_max_window_bits'):
+			response.append(f'client_max_window_bits={clientBits}')
+
+		return PerMessageDeflate(serverTakeover, clientTakeover, serverBits, clientBits, level), '; '.join(response)
+
+	return None, None
@@ -0,0 +1,33 @@
+# Concurrency stress check of the arena command queue (see benchmarks/commands_stress.py):
+# answers fired from many threads right around the round deadlines are each replied to
+# once, and each received one is scored exactly once, in the round it was received.
+from benchmarks.commands_stress import *
+
+def test_concurrent_answers_at_round_deadlines (monkeypatch):
+	for module, name, value in SETTINGS:
+		monkeypatch.setattr(module, name, value)
+
+	events, sent, arena = fireAnswers(players=60, rounds=4, threads=8, spread=0.05)
+
+	received = scored = 0
+
+	for cli, messages in events.items():
+		pending = False
+
+		for message in messages:
+			if message == "Answer received.":
+				assert not pending, f'{cli.addressString()}: answer received twice in a round'
+				pending = True
+				received += 1
+			elif message == "correct_answer":
+				assert pending, f'{cli.addressString()}: scored an answer that was not received'
+				pending = False
+				scored += 1
+			elif message == "wrong_answer":
+				assert not pending, f'{cli.addressString()}: a received answer was lost'
+
+		assert not pending, f'{cli.addressString()}: last answer was never scored'
+
+	replied = sum(1 for messages in events.values() for message in messages if message in REPLIES)
+	assert replied == sent, f'{sent} answers sent, {replied} replies'
+	assert received > 0 and scored == received
@@ -0,0 +1,43 @@
+# Property check of the batch scoring: random rounds scored by each implementation give the
+# same results and column updates as the original per-Player rules of Set.endRound
+# (legacyScoreRound of benchmarks/scoring_bench.py, which times them).
+from benchmarks.scoring_bench import *
+import pytest
+
+IMPLEMENTATIONS = [
+	scoreRoundPython,
+	pytest.param(scoreRoundNumpy, marks=pytest.mark.skipif(scoring.numpy == None, reason='numpy is not installed'))
+]
+
+# MAX_PENALTY is also changed after the import, as benchmarks/commands_stress.py does
+@pytest.mark.parametrize('maxPenalty', [MAX_PENALTY, 100])
+@pytest.mark.parametrize('implementation', IMPLEMENTATIONS)
+def test_random_rounds_score_like_the_legacy_rules (monkeypatch, implementation, maxPenalty):
+	monkeypatch.setattr(scoring, 'MAX_PENALTY', maxPenalty)
+	rand = random.Random(1)
+
+	for _ in range(2000):
+		count = rand.choice([1, 2, 3, 5, 10, 50, 300])
+		legacy, answering, columns, accepted = randomRound(rand, count)
+		winningPoints = rand.randint(3, 26)
+
+		expected = legacyScoreRound(legacy, answering, accepted, winningPoints)
+		score = implementation(columns, accepted, winningPoints)
+
+		assert (score.correct, score.wrong, score.disqualified, score.winner) == expected, (count, expected, score.__dict__)
+		assert list(columns.points) == [player.points for player in legacy]
+		assert list(columns.penalty) == [player.penalty for player in legacy]
+		assert list(columns.gameovered) == [int(player.gameovered) for player in legacy]
+		assert [columns.answerOf(player.slot) for player in legacy] == [player.answered for player in legacy]
+
+# scoreRound picks numpy for large rounds only, both paths have to agree there too
+def test_large_rounds_score_the_same_with_either_implementation ():
+	for seed in range(3):
+		_, _, python, accepted = randomRound(random.Random(seed), NUMPY_SCORING_THRESHOLD)
+		_, _, batched, _ = randomRound(random.Random(seed), NUMPY_SCORING_THRESHOLD)
+
+		expected = scoreRoundPython(python, accepted, 20)
+		score = scoreRound(batched, accepted, 20)
+
+		assert score.__dict__ == expected.__dict__
+		assert (python.points, python.penalty, python.gameovered) == (batched.points, batched.penalty, batched.gameovered)